@@ -1,37 +1,39 @@
-from flask import Flask, render_template, request, send_file, jsonify
-import pandas as pd
+from flask import Flask, render_template, request, send_file, jsonify, Response, stream_with_context
+import csv
 import io
+import json
 import os
 import time
 import re
-import threading
 import uuid
-from scraper_lib import get_driver, scrape_nahdi, scrape_aldawaa
+from browser_governor import process_rss_mb, process_stat, process_age_seconds
+from scheduler import get_scheduler, DEFAULT_PRIORITY
+from events import JOB_EVENTS, HEARTBEAT_SECONDS, format_sse
+from job_state import get_job_state, worker_id
+from metrics import METRICS
+from result_store import get_store
+from price_history import get_history, DIFF_CHANGES
+from exporters import export_chunks, export_filename, EXPORT_FORMATS, ExportUnavailable
+from product_matching import get_index_cache, match_catalogs, comparison_rows, MATCH_THRESHOLD
+from sites import supported_site
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
-# Global dictionary to store progress and results
-SCRAPE_STATUS = {}
-SCRAPE_RESULTS = {}
+# Job status, events and the queue live in the shared job state (see job_state.py) and rows in the
+# result store, so any web worker can answer for a job; scrapes run in worker processes (worker.py)
+BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', 100))
+# Run a scrape worker inside `python app.py` for local development; start.sh runs worker.py instead
+EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', '1') == '1'
+UNKNOWN_STATUS = {'page': 0, 'count': 0, 'status': 'unknown'}
+# How often an SSE stream re-checks a queued job's position
+QUEUE_UPDATE_SECONDS = 2
 
-def generate_filename_from_url(url):
-    try:
-        # Remove protocol
-        name = url.split('://')[-1]
-        # Remove query params
-        name = name.split('?')[0]
-        # Replace non-alphanumeric characters with underscores
-        name = re.sub(r'[^a-zA-Z0-9]', '_', name)
-        # Remove multiple underscores
-        name = re.sub(r'_+', '_', name)
-        # Limit length
-        name = name[:50]
-        # Remove trailing underscores
-        name = name.strip('_')
-        return f"{name}.csv"
-    except:
-        return "scraped_products.csv"
+def _no_worker_response():
+    """503 when no scrape worker is heartbeating; a job queued then would sit 'queued' indefinitely."""
+    if get_job_state().workers():
+        return None
+    return jsonify({'error': 'No scrape worker is running; try again shortly'}), 503
 
 @app.route('/')
 def index():
@@ -39,120 +41,340 @@ def index():
 
 @app.route('/progress/<req_id>')
 def progress(req_id):
-    return jsonify(SCRAPE_STATUS.get(req_id, {'page': 0, 'count': 0, 'status': 'unknown'}))
+    # Includes the worker's stage timings and browser memory (see tasks.save_status)
+    status = get_job_state().get_status(req_id) or dict(UNKNOWN_STATUS)
+    queue_info = get_scheduler().queue_info(req_id)
+    if queue_info:
+        # queue_position, queued_jobs, estimated_start (seconds)
+        status.update(queue_info)
+    return jsonify(status)
+
+@app.route('/metrics')
+def metrics():
+    # Scrapes run in worker processes; their counters and pool/governor/cache gauges come with their heartbeats
+    workers = get_job_state().workers()
+    gauges = {f'scheduler_{name}': value for name, value in get_scheduler().stats().items()}
+    gauges['scrape_worker_processes'] = len(workers)
+    gauges['web_startup_seconds'] = STARTUP_SECONDS
+    gauges['web_rss_mb'] = round(process_rss_mb(os.getpid()), 1)
+    for info in workers.values():
+        for name, value in info.get('gauges', {}).items():
+            if value is not None:
+                gauges[name] = gauges.get(name, 0) + value
+    # An embedded worker shares this process's METRICS; don't count it twice
+    own = worker_id()
+    snapshots = [info['metrics'] for wid, info in workers.items() if wid != own and info.get('metrics')]
+    return Response(METRICS.render(gauges, snapshots), mimetype='text/plain; version=0.0.4')
+
+@app.route('/progress/<req_id>/stream')
+def progress_stream(req_id):
+    # Server-Sent Events: pushes status_callback events instead of client polling
+    try:
+        # Reconnects resume after the last event seen; new subscribers start from now
+        last_id = int(request.headers.get('Last-Event-ID') or JOB_EVENTS.last_id(req_id))
+    except ValueError:
+        last_id = JOB_EVENTS.last_id(req_id)
+    scheduler = get_scheduler()
+    snapshot = get_job_state().get_status(req_id) or dict(UNKNOWN_STATUS)
+    snapshot.pop('timings', None)
+    snapshot.pop('memory', None)
+    queue_info = scheduler.queue_info(req_id)
+    if queue_info:
+        snapshot.update(queue_info)
+
+    def generate():
+        nonlocal queue_info
+        yield format_sse(None, 'status', json.dumps(snapshot))
+        if snapshot.get('status') in ('completed', 'failed', 'cancelled', 'unknown'):
+            return
+        last_sent = time.time()
+        # Short listen timeouts while queued, so queue moves (claims by other processes) are seen
+        for item in JOB_EVENTS.listen(req_id, last_id=last_id, heartbeat=QUEUE_UPDATE_SECONDS):
+            if item is not None:
+                event_id, event, data = item
+                queue_info = None
+                last_sent = time.time()
+                yield format_sse(event_id, event, json.dumps(data))
+                continue
+            if queue_info:
+                current = scheduler.queue_info(req_id)
+                moved = current is not None and (current['queue_position'], current['queued_jobs']) != \
+                    (queue_info['queue_position'], queue_info['queued_jobs'])
+                queue_info = current
+                if moved:
+                    last_sent = time.time()
+                    yield format_sse(None, 'queued', json.dumps(dict(snapshot, **current)))
+                    continue
+            if time.time() - last_sent >= HEARTBEAT_SECONDS:
+                last_sent = time.time()
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/cancel/<req_id>', methods=['POST'])
+def cancel(req_id):
+    state = get_scheduler().cancel(req_id)
+    if state is None:
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    if state == 'cancelled':
+        status = {'page': 0, 'count': 0, 'status': 'cancelled'}
+        get_job_state().set_status(req_id, status)
+        JOB_EVENTS.publish(req_id, 'cancelled', status)
+    return jsonify({'req_id': req_id, 'status': state})
+
+@app.route('/resume/<req_id>', methods=['POST'])
+def resume(req_id):
+    store = get_store()
+    job = store.job(req_id)
+    checkpoint = store.checkpoint(req_id)
+    if job is None or checkpoint is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if get_scheduler().is_active(req_id):
+        return jsonify({'error': 'Job is still queued or running'}), 409
+    if checkpoint['status'] == 'completed':
+        return jsonify({'error': 'Job already completed'}), 409
+    unavailable = _no_worker_response()
+    if unavailable:
+        return unavailable
+    
+    # Also picks up jobs left 'running' by a crash or restart
+    options = checkpoint['options']
+    get_job_state().set_status(req_id, {'page': checkpoint['page'], 'count': checkpoint['count'], 'status': 'queued'})
+    get_scheduler().submit(req_id, 'scrape',
+                           (req_id, job['url'], options.get('headless', True), options.get('max_staleness'),
+                            options.get('incremental', False), True))
+    return jsonify({'req_id': req_id, 'resume_after_page': checkpoint['page']})
 
 @app.route('/download/<req_id>')
 def download(req_id):
-    filename = SCRAPE_RESULTS.get(req_id)
-    if not filename or not os.path.exists(filename):
-        return "File not found", 404
+    store = get_store()
+    job = store.job(req_id)
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    filename = job['filename'] if job else None
     
-    return send_file(
-        filename,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='text/csv'
+    if fmt == 'csv' and filename and os.path.exists(filename):
+        # The job's own CSV, written as it ran
+        return send_file(
+            filename,
+            as_attachment=True,
+            download_name=os.path.basename(filename),
+            mimetype='text/csv'
+        )
+    
+    if not job or not job['columns']:
+        return "File not found", 404
+    # Other formats, and CSVs written on another instance, are encoded batch by batch from the stored rows
+    try:
+        chunks = export_chunks(fmt, job['columns'], store.iter_rows(req_id))
+    except ExportUnavailable as e:
+        return jsonify({'error': str(e)}), 501
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt][1],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(filename, fmt)}"'}
     )
 
 @app.route('/results/<req_id>')
 def results(req_id):
-    filename = SCRAPE_RESULTS.get(req_id)
-    status = SCRAPE_STATUS.get(req_id, {})
+    job = get_store().job(req_id)
+    status = get_job_state().get_status(req_id) or {}
     
-    if not filename or not os.path.exists(filename):
+    if not job:
         return "File not found", 404
     
+    # Rows are fetched page by page from /api/results/<req_id>
+    return render_template(
+        'results.html',
+        columns=job['columns'],
+        count=status.get('count', 0),
+        pages=status.get('page', 0),
+        time_elapsed=status.get('elapsed', '0s'),
+        req_id=req_id
+    )
+
+def _float_arg(name):
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    return float(value)
+
+@app.route('/api/results/<req_id>')
+def api_results(req_id):
+    store = get_store()
+    job = store.job(req_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
     try:
-        df = pd.read_csv(filename)
-        # Convert NaN to empty string for better display
-        df = df.fillna('')
-        products = df.to_dict('records')
-        columns = df.columns.tolist()
-        
-        return render_template(
-            'results.html',
-            products=products,
-            columns=columns,
-            count=status.get('count', 0),
-            pages=status.get('page', 0),
-            time_elapsed=status.get('elapsed', '0s'),
-            req_id=req_id
+        result = store.query(
+            req_id,
+            page=int(request.args.get('page', 1)),
+            per_page=int(request.args.get('per_page', 50)),
+            sort=request.args.get('sort', 'no'),
+            order=request.args.get('order', 'asc'),
+            source=request.args.get('source') or None,
+            category=request.args.get('category') or None,
+            min_price=_float_arg('min_price'),
+            max_price=_float_arg('max_price'),
+            min_discount=_float_arg('min_discount'),
+            discounted=request.args.get('discounted') == 'true',
+            q=request.args.get('q') or None,
         )
-    except Exception as e:
-        return f"Error reading results: {str(e)}", 500
+    except ValueError:
+        return jsonify({'error': 'Invalid numeric parameter'}), 400
+    
+    result['columns'] = job['columns']
+    if request.args.get('facets') == 'true':
+        result['facets'] = store.facets(req_id)
+    return jsonify(result)
+
+@app.route('/api/diff/<req_id>')
+def api_diff(req_id):
+    # New, removed and price-changed products from an incremental run
+    change = request.args.get('change') or None
+    if change and change not in DIFF_CHANGES:
+        return jsonify({'error': f"change must be one of {', '.join(DIFF_CHANGES)}"}), 400
+    return jsonify(get_history().diff(req_id, change))
+
+@app.route('/api/history')
+def api_history():
+    link = request.args.get('link')
+    if not link:
+        return jsonify({'error': 'link is required'}), 400
+    return jsonify({'link': link, 'history': get_history().history(link)})
+
+def _match_index(store, req_id):
+    return get_index_cache().get(req_id, store.row_count(req_id), lambda: store.iter_rows(req_id))
 
-def run_scrape_task(req_id, url, headless_mode):
-    print(f"Task started for {req_id}")
-    start_time = time.time()
+@app.route('/api/compare')
+def api_compare():
+    # Joins two finished jobs (e.g. a Nahdi and an Al-Dawaa category) product by product
+    store = get_store()
+    left_id, right_id = request.args.get('left'), request.args.get('right')
+    if not left_id or not right_id:
+        return jsonify({'error': 'left and right job ids are required'}), 400
+    if store.job(left_id) is None or store.job(right_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
     try:
-        driver = get_driver(headless=headless_mode)
-        
-        def update_status(page, count):
-            print(f"Req {req_id}: Page {page}, Count {count}")
-            SCRAPE_STATUS[req_id] = {'page': page, 'count': count, 'status': 'scraping'}
-
-        data = []
-        if "nahdi" in url.lower():
-            data = scrape_nahdi(driver, url, status_callback=update_status)
-        elif "al-dawaa" in url.lower():
-            data = scrape_aldawaa(driver, url, status_callback=update_status)
-        
-        driver.quit()
-        
-        end_time = time.time()
-        elapsed_seconds = int(end_time - start_time)
-        mins, secs = divmod(elapsed_seconds, 60)
-        elapsed_str = f"{mins}m {secs}s"
-        
-        # Save results
-        if data:
-            # Add numbering
-            enriched_data = []
-            for i, item in enumerate(data, 1):
-                new_item = {'No.': i}
-                new_item.update(item)
-                enriched_data.append(new_item)
-                
-            df = pd.DataFrame(enriched_data)
-            filename = generate_filename_from_url(url)
-            df.to_csv(filename, index=False, encoding='utf-8-sig')
-            
-            SCRAPE_RESULTS[req_id] = filename
-            SCRAPE_STATUS[req_id] = {
-                'status': 'completed',
-                'count': len(data),
-                'page': SCRAPE_STATUS.get(req_id, {}).get('page', 0),
-                'elapsed': elapsed_str
-            }
-            print(f"Task {req_id} completed. Saved to {filename}")
-        else:
-            SCRAPE_STATUS[req_id]['status'] = 'failed'
-            SCRAPE_STATUS[req_id]['error'] = 'No data found'
-            
-    except Exception as e:
-        print(f"Task {req_id} failed: {e}")
-        SCRAPE_STATUS[req_id]['status'] = 'failed'
-        SCRAPE_STATUS[req_id]['error'] = str(e)
+        threshold = _float_arg('min_score')
+    except ValueError:
+        return jsonify({'error': 'Invalid numeric parameter'}), 400
+
+    started = time.time()
+    left_index = _match_index(store, left_id)
+    right_index = _match_index(store, right_id)
+    matches = match_catalogs(left_index, right_index, threshold if threshold is not None else MATCH_THRESHOLD)
+    rows = comparison_rows(matches)
+    print(f"Matched {left_id} x {right_id}: {len(rows)} pairs in {time.time() - started:.2f}s")
+
+    if request.args.get('format') == 'csv':
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()) if rows else ['Product'])
+        writer.writeheader()
+        writer.writerows(rows)
+        return Response(
+            '\ufeff' + output.getvalue(),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=price_comparison.csv'}
+        )
+    return jsonify({
+        'left_products': len(left_index.products),
+        'right_products': len(right_index.products),
+        'matched': len(rows),
+        'rows': rows,
+    })
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Scrape a list of category URLs (or everything a sitemap/category root lists) as one job."""
+    payload = request.get_json(silent=True) or {}
+    urls = payload.get('urls')
+    if urls is None:
+        urls = re.split(r'[\s,]+', request.form.get('urls', ''))
+    root = payload.get('root') or request.form.get('root')
+    headless_mode = str(payload.get('headless', request.form.get('headless'))).lower() == 'true'
+    try:
+        priority = int(payload.get('priority', request.form.get('priority', DEFAULT_PRIORITY)))
+        max_staleness = payload.get('max_staleness', request.form.get('max_staleness'))
+        max_staleness = int(max_staleness) if max_staleness not in (None, '') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'priority and max_staleness must be integers'}), 400
+
+    unavailable = _no_worker_response()
+    if unavailable:
+        return unavailable
+
+    urls = [url.strip() for url in urls if url and url.strip()]
+    # Keep the first occurrence of each URL, in order
+    urls = list(dict.fromkeys(urls))[:BATCH_MAX_URLS]
+    # Workers fetch these server-side, so the host must be a storefront, not just mention one
+    unsupported = [url for url in urls if not supported_site(url)]
+    if unsupported:
+        return jsonify({'error': 'Only Nahdi and Al-Dawaa URLs are supported', 'urls': unsupported}), 400
+    if root and not supported_site(root):
+        return jsonify({'error': 'root must be a Nahdi or Al-Dawaa URL'}), 400
+    if not urls and not root:
+        return jsonify({'error': 'No category URLs given'}), 400
+
+    req_id = str(uuid.uuid4())
+    get_job_state().set_status(req_id, {'page': 0, 'count': 0, 'status': 'queued', 'batch': True,
+                                        'urls_total': len(urls)})
+    # A root's sitemap or category page is crawled by the worker, not inside this request
+    get_scheduler().submit(req_id, 'batch', (req_id, urls, headless_mode, max_staleness, root), priority=priority)
+    return jsonify({'req_id': req_id, 'urls': urls, 'root': root})
 
 @app.route('/scrape', methods=['POST'])
 def scrape():
-    url = request.form.get('url')
+    url = (request.form.get('url') or '').strip()
     headless_mode = request.form.get('headless') == 'true'
+    incremental = request.form.get('incremental') == 'true'
+    try:
+        priority = int(request.form.get('priority', DEFAULT_PRIORITY))
+    except ValueError:
+        return jsonify({'error': 'priority must be an integer'}), 400
+    # Oldest cached page (seconds) the caller will accept; 0 forces a fresh scrape
+    max_staleness = request.form.get('max_staleness')
+    try:
+        max_staleness = int(max_staleness) if max_staleness not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'max_staleness must be an integer'}), 400
     
     if not url:
         return jsonify({'error': 'URL is required'}), 400
+    # The worker fetches it server-side, so only storefront hosts are accepted
+    if not supported_site(url):
+        return jsonify({'error': 'Only Nahdi and Al-Dawaa URLs are supported'}), 400
+    unavailable = _no_worker_response()
+    if unavailable:
+        return unavailable
 
     req_id = str(uuid.uuid4())
-    SCRAPE_STATUS[req_id] = {'page': 0, 'count': 0, 'status': 'starting'}
+    get_job_state().set_status(req_id, {'page': 0, 'count': 0, 'status': 'queued'})
     
-    thread = threading.Thread(target=run_scrape_task, args=(req_id, url, headless_mode))
-    thread.start()
+    # Queued for the scrape worker processes instead of a thread (and a Chrome) per request
+    get_scheduler().submit(req_id, 'scrape', (req_id, url, headless_mode, max_staleness, incremental),
+                             priority=priority)
     
     return jsonify({'req_id': req_id})
 
+# Cold start: process start until every route is registered (under gunicorn, the master's preload)
+STARTUP_SECONDS = round(process_age_seconds(process_stat(os.getpid())) or 0, 2)
+
 if __name__ == '__main__':
-    import os
+    # Development server; production runs gunicorn -c gunicorn.conf.py (see start.sh)
     port = int(os.environ.get('PORT', 5500))
     host = os.environ.get('HOST', '127.0.0.1')
-    print(f"Starting Flask server on http://{host}:{port}")
-    app.run(debug=True, host=host, port=port)
+    debug = os.environ.get('FLASK_DEBUG', '1') == '1'
+    print(f"Starting Flask server on http://{host}:{port} (loaded in {STARTUP_SECONDS}s, "
+          f"RSS {process_rss_mb(os.getpid()):.0f} MB)")
+    # The debug reloader runs this block twice; only run jobs (and warm drivers) in the serving child
+    if EMBEDDED_WORKER and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        from worker import start_worker
+        start_worker()
+    app.run(debug=debug, host=host, port=port)
@@ -0,0 +1,264 @@
+"""Offline scraper benchmark against the recorded storefront pages in bench_fixtures/.
+
+Serves the fixtures from a local HTTP server, drives the real scrape_nahdi /
+scrape_aldawaa with headless Chrome and reports pages/sec, products/sec,
+per-page latency percentiles and WebDriver round trips per category. Results
+are compared with bench_baseline.json; a regression beyond the tolerance (or
+a wrong product count) makes the run exit non-zero.
+
+    python benchmark.py                      # run and compare with the baseline
+    python benchmark.py --update-baseline    # run and store the results as the new baseline
+    python benchmark.py --only nahdi --nahdi-concurrency 1   # Nahdi pages one at a time, to compare
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Every run must load pages through Chrome, never from the page cache, and try selectors in
+# their default order rather than what the production strategy cache learned
+os.environ['PAGE_CACHE'] = '0'
+os.environ['STRATEGY_CACHE'] = '0'
+
+from scraper_lib import scrape_nahdi, scrape_aldawaa, get_driver, NAHDI_PAGE_CONCURRENCY
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_fixtures')
+BASELINE_PATH = os.environ.get('BENCH_BASELINE', 'bench_baseline.json')
+# Allowed relative slowdown before a metric counts as a regression
+BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.2))
+
+# metric -> True when higher is better
+METRICS = {
+    'pages_per_sec': True,
+    'products_per_sec': True,
+    'p50_page_seconds': False,
+    'p90_page_seconds': False,
+    'round_trips': False,
+}
+
+
+def load_manifest(directory=FIXTURES_DIR):
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)['categories']
+
+
+class FixtureServer:
+    """Serves each manifest category's page-N.html for its listing path and page query parameter.
+
+    Pages past the last fixture get the category's empty.html (or a bare
+    listing), like a storefront that has run out of products.
+    """
+
+    def __init__(self, categories, directory=FIXTURES_DIR, latency_ms=0):
+        routes = {category['path']: category for category in categories}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlparse(self.path)
+                category = routes.get(parts.path.rstrip('/'))
+                if category is None:
+                    self.send_error(404)
+                    return
+                page = parse_qs(parts.query).get(category['page_param'], ['1'])[0]
+                base = os.path.join(directory, category['directory'])
+                path = os.path.join(base, f'page-{int(page) if page.isdigit() else 1}.html')
+                if not os.path.exists(path):
+                    path = os.path.join(base, 'empty.html')
+                body = b'<!DOCTYPE html><html><body></body></html>'
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        body = f.read()
+                if latency_ms:
+                    time.sleep(latency_ms / 1000.0)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def count_round_trips(driver):
+    """Count every WebDriver command; element calls go through driver.execute too."""
+    counts = Counter()
+    execute = driver.execute
+
+    def counting_execute(driver_command, params=None):
+        counts[driver_command] += 1
+        return execute(driver_command, params)
+
+    driver.execute = counting_execute
+    return counts
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)]
+
+
+def run_category(driver, counts, category, base_url, nahdi_concurrency=NAHDI_PAGE_CONCURRENCY):
+    """One scrape of a fixture category; returns its raw measurements."""
+    url = base_url + category['path']
+    page_seconds = []
+
+    def on_progress(page, count, event='page_started', **stats):
+        if event == 'page_done':
+            page_seconds.append(stats.get('page_seconds', 0))
+
+    counts.clear()
+    start = time.time()
+    if category['site'] == 'nahdi':
+        rows = scrape_nahdi(driver, url, status_callback=on_progress, concurrency=nahdi_concurrency)
+    else:
+        rows = scrape_aldawaa(driver, url, status_callback=on_progress)
+    elapsed = time.time() - start
+    return {
+        'seconds': elapsed,
+        'pages': len(page_seconds),
+        'products': len(rows),
+        'page_seconds': page_seconds,
+        'round_trips': sum(counts.values()),
+        'commands': dict(counts),
+    }
+
+
+def summarize(category, runs):
+    seconds = statistics.median(run['seconds'] for run in runs)
+    pages = runs[-1]['pages']
+    products = runs[-1]['products']
+    page_seconds = [value for run in runs for value in run['page_seconds']]
+    return {
+        'pages': pages,
+        'products': products,
+        'expected_pages': category['pages'],
+        'expected_products': category['products'],
+        'seconds': round(seconds, 2),
+        'pages_per_sec': round(pages / seconds, 3) if seconds else 0,
+        'products_per_sec': round(products / seconds, 2) if seconds else 0,
+        'p50_page_seconds': percentile(page_seconds, 50),
+        'p90_page_seconds': percentile(page_seconds, 90),
+        'p99_page_seconds': percentile(page_seconds, 99),
+        'round_trips': int(statistics.median(run['round_trips'] for run in runs)),
+        'commands': runs[-1]['commands'],
+    }
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE):
+    """Regression messages: wrong product counts, and metrics worse than the baseline by more than tolerance."""
+    problems = []
+    for name, result in results.items():
+        if (result['products'], result['pages']) != (result['expected_products'], result['expected_pages']):
+            problems.append(f"{name}: scraped {result['products']} products on {result['pages']} pages, "
+                            f"expected {result['expected_products']} on {result['expected_pages']}")
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            current, before = result.get(metric), previous.get(metric)
+            if current is None or not before:
+                continue
+            if higher_is_better and current < before * (1 - tolerance):
+                problems.append(f"{name}: {metric} {current} < baseline {before}")
+            elif not higher_is_better and current > before * (1 + tolerance):
+                problems.append(f"{name}: {metric} {current} > baseline {before}")
+    return problems
+
+
+def print_table(results):
+    print(f"{'category':<26}{'pages':>6}{'rows':>6}{'pages/s':>9}{'rows/s':>9}"
+          f"{'p50 s':>8}{'p90 s':>8}{'p99 s':>8}{'trips':>7}")
+    for name, r in results.items():
+        print(f"{name:<26}{r['pages']:>6}{r['products']:>6}{r['pages_per_sec']:>9}{r['products_per_sec']:>9}"
+              f"{r['p50_page_seconds'] or 0:>8.2f}{r['p90_page_seconds'] or 0:>8.2f}{r['p99_page_seconds'] or 0:>8.2f}"
+              f"{r['round_trips']:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='scrapes per category (medians are reported)')
+    parser.add_argument('--only', help='run only categories whose name contains this')
+    parser.add_argument('--latency-ms', type=int, default=0, help='delay added to every fixture response')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=BENCH_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--headed', action='store_true', help='show the browser')
+    parser.add_argument('--nahdi-concurrency', type=int, default=NAHDI_PAGE_CONCURRENCY,
+                        help='Nahdi pages loaded at once in tabs (1 = one after another)')
+    args = parser.parse_args(argv)
+
+    categories = [c for c in load_manifest() if not args.only or args.only in c['name']]
+    if not categories:
+        print(f"No fixture categories match {args.only!r}")
+        return 2
+
+    results = {}
+    driver = get_driver(headless=not args.headed)
+    try:
+        counts = count_round_trips(driver)
+        with FixtureServer(categories, latency_ms=args.latency_ms) as server:
+            for category in categories:
+                runs = []
+                for run in range(args.runs):
+                    runs.append(run_category(driver, counts, category, server.base_url, args.nahdi_concurrency))
+                    print(f"{category['name']} run {run + 1}: {runs[-1]['products']} products, "
+                          f"{runs[-1]['pages']} pages in {runs[-1]['seconds']:.2f}s")
+                results[category['name']] = summarize(category, runs)
+    finally:
+        driver.quit()
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    problems = compare(results, {} if args.update_baseline else baseline, args.tolerance)
+
+    if args.update_baseline and not problems:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+    elif not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to record one")
+
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,443 @@
+import json
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import METRICS
+
+# Hard limits per browser (chromedriver + Chrome process tree); a browser over either is killed.
+# CPU counts from when the browser was last handed to a job, not over its life in the pool
+BROWSER_MAX_RSS_MB = int(os.environ.get('BROWSER_MAX_RSS_MB', 1500))
+BROWSER_MAX_CPU_SECONDS = int(os.environ.get('BROWSER_MAX_CPU_SECONDS', 3600))
+GOVERNOR_INTERVAL = float(os.environ.get('GOVERNOR_INTERVAL', 5))
+# Untracked browser processes younger than this may still be starting up, so are left alone
+ORPHAN_GRACE_SECONDS = int(os.environ.get('ORPHAN_GRACE_SECONDS', 120))
+# Pids of the browsers each app process started (one file per process), so the next start
+# can reap what a crashed process left behind
+GOVERNOR_STATE_DIR = os.environ.get('GOVERNOR_STATE_DIR', '.browser_pids')
+GOVERNOR_SWEEP_ON_START = os.environ.get('GOVERNOR_SWEEP_ON_START', '1') == '1'
+
+BROWSER_NAMES = ('chrome', 'chromedriver', 'undetected_chromedriver', 'google-chrome', 'chrome_crashpad_handler')
+MAX_JOB_REPORTS = 200
+# Monitor ticks between orphan sweeps
+ORPHAN_SWEEP_EVERY = 6
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _read_proc_children():
+    # Map ppid -> [pid] from /proc (Linux only)
+    children = {}
+    try:
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    stat = f.read()
+                # comm may contain spaces, so split after the closing paren
+                ppid = int(stat.rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except Exception:
+                continue
+    except Exception:
+        pass
+    return children
+
+
+def process_tree(pid):
+    """Return pid and all of its descendants."""
+    if not pid:
+        return []
+    children = _read_proc_children()
+    tree = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def process_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except Exception:
+        pass
+    return 0.0
+
+
+def process_stat(pid):
+    """comm, ppid, CPU seconds and start time (ticks since boot) of a process, or None if it's gone."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except Exception:
+        return None
+    try:
+        comm = stat[stat.index('(') + 1:stat.rindex(')')]
+        fields = stat.rsplit(')', 1)[1].split()
+        # fields[0] is state (stat field 3); utime/stime are fields 14/15, starttime 22
+        return {
+            'comm': comm,
+            'state': fields[0],
+            'ppid': int(fields[1]),
+            'cpu_seconds': (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+            'start': int(fields[19]),
+        }
+    except (ValueError, IndexError):
+        return None
+
+
+def process_age_seconds(stat):
+    try:
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except Exception:
+        return None
+    return uptime - stat['start'] / _CLOCK_TICKS
+
+
+def is_browser_process(stat):
+    return stat is not None and any(name in stat['comm'].lower() for name in BROWSER_NAMES)
+
+
+def driver_root_pid(driver):
+    # chromedriver's pid is the root of the browser process tree
+    try:
+        return driver.service.process.pid
+    except Exception:
+        pass
+    return getattr(driver, 'browser_pid', None)
+
+
+def driver_pids(driver):
+    """Every live pid of the driver's chromedriver and Chrome process trees."""
+    pids = process_tree(driver_root_pid(driver))
+    browser_pid = getattr(driver, 'browser_pid', None)
+    if browser_pid and browser_pid not in pids:
+        # UC launches Chrome as a sibling of chromedriver
+        pids.extend(process_tree(browser_pid))
+    return [pid for pid in set(pids) if os.path.exists(f'/proc/{pid}')]
+
+
+def driver_rss_mb(driver):
+    """Resident memory of the driver's whole process tree, or None if unknown."""
+    pids = driver_pids(driver)
+    if not pids:
+        return None
+    return sum(process_rss_mb(pid) for pid in pids)
+
+
+def _kill(pid, start=None, sig=signal.SIGKILL):
+    """Signal pid unless it has exited or the pid now belongs to another process."""
+    if start is not None:
+        stat = process_stat(pid)
+        if stat is None or stat['start'] != start:
+            return False
+    try:
+        os.kill(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        return False
+    return True
+
+
+def _reap(pid):
+    # Collect the exit status of our own children so they don't linger as zombies
+    try:
+        os.waitpid(pid, os.WNOHANG)
+    except (ChildProcessError, OSError):
+        pass
+
+
+def kill_processes(pids, starts=None, grace=2.0):
+    """SIGTERM, wait up to grace seconds, then SIGKILL whatever is left. Returns how many were signalled."""
+    starts = starts or {}
+    signalled = [pid for pid in pids if _kill(pid, starts.get(pid), signal.SIGTERM)]
+    deadline = time.time() + grace
+    while signalled and time.time() < deadline:
+        for pid in signalled:
+            _reap(pid)
+        alive = [pid for pid in signalled if (process_stat(pid) or {}).get('state', 'Z') != 'Z']
+        if not alive:
+            break
+        time.sleep(0.1)
+    for pid in signalled:
+        _kill(pid, starts.get(pid))
+        _reap(pid)
+    return len(signalled)
+
+
+class BrowserGovernor:
+    """Tracks every Chrome/chromedriver process the driver pool starts and keeps them in check.
+
+    A monitor thread samples each browser's process tree: memory and CPU
+    time are charged to the job holding it, and a browser over
+    BROWSER_MAX_RSS_MB, or over BROWSER_MAX_CPU_SECONDS of CPU since it was
+    last handed to a job or returned to the pool, is killed (the job's next
+    WebDriver call fails and it retries on a fresh browser). Pooled browsers
+    outlive many jobs, so their lifetime CPU is never held against them. Processes left
+    after driver.quit(), untracked browsers spawned by this process and, at
+    start-up, those a crashed run left behind are killed and reaped.
+    """
+
+    def __init__(self, max_rss_mb=BROWSER_MAX_RSS_MB, max_cpu_seconds=BROWSER_MAX_CPU_SECONDS,
+                 interval=GOVERNOR_INTERVAL, state_dir=GOVERNOR_STATE_DIR):
+        self.max_rss_mb = max_rss_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.interval = interval
+        self.state_dir = state_dir
+        self.state_path = os.path.join(state_dir, f'{os.getpid()}.json')
+        self._lock = threading.Lock()
+        # id(driver) -> {'driver', 'pids': {pid: start}, 'req_id', 'rss_mb', 'cpu_seconds', 'cpu_base'}
+        self._browsers = {}
+        self._jobs = OrderedDict()
+        self._monitor = None
+
+    # -- registration ----------------------------------------------------
+
+    def track(self, driver):
+        with self._lock:
+            self._browsers[id(driver)] = {'driver': driver, 'pids': {}, 'req_id': None,
+                                          'rss_mb': 0.0, 'cpu_seconds': 0.0, 'cpu_base': 0.0}
+        self._sample(driver)
+        self._save_state()
+        self._start_monitor()
+
+    def assign(self, driver, req_id):
+        """Charge the driver's resource use to req_id (None when it goes back to the pool)."""
+        # CPU used so far belongs to earlier jobs; this assignment is measured from here
+        self._sample(driver)
+        with self._lock:
+            browser = self._browsers.get(id(driver))
+            if browser is not None:
+                browser['req_id'] = req_id
+                browser['cpu_base'] = browser['cpu_seconds']
+            if req_id is not None and req_id not in self._jobs:
+                self._jobs[req_id] = {'rss_mb': 0.0, 'peak_rss_mb': 0.0, 'cpu_seconds': 0.0, 'browsers': 0,
+                                      'killed': 0}
+                while len(self._jobs) > MAX_JOB_REPORTS:
+                    self._jobs.popitem(last=False)
+            if req_id is not None:
+                self._jobs[req_id]['browsers'] += 1
+
+    def forget(self, driver):
+        """After driver.quit(): kill and reap anything of its process tree still running."""
+        with self._lock:
+            browser = self._browsers.pop(id(driver), None)
+        if browser is None:
+            return 0
+        leftover = {pid: start for pid, start in browser['pids'].items()
+                    if (process_stat(pid) or {}).get('start') == start}
+        for pid in driver_pids(driver):
+            stat = process_stat(pid)
+            if stat is not None:
+                leftover.setdefault(pid, stat['start'])
+        killed = kill_processes(list(leftover), leftover) if leftover else 0
+        if killed:
+            print(f"Governor: reaped {killed} browser processes left after quit")
+            METRICS.count('browser_processes_reaped', killed, reason='after_quit')
+        self._save_state()
+        return killed
+
+    # -- sampling and limits ---------------------------------------------
+
+    def _sample(self, driver):
+        """Refresh the driver's pid set; returns (rss_mb, CPU seconds since its last assignment)."""
+        pids = driver_pids(driver)
+        rss = cpu = 0.0
+        known = {}
+        for pid in pids:
+            stat = process_stat(pid)
+            if stat is None:
+                continue
+            known[pid] = stat['start']
+            rss += process_rss_mb(pid)
+            cpu += stat['cpu_seconds']
+        with self._lock:
+            browser = self._browsers.get(id(driver))
+            if browser is None:
+                return rss, 0.0
+            # Renderers come and go; keep every pid seen so forget() can reap stragglers
+            browser['pids'].update(known)
+            browser['rss_mb'] = rss
+            # The tree's total drops when a busy renderer exits, so keep the highest seen
+            browser['cpu_seconds'] = max(browser['cpu_seconds'], cpu)
+            assigned_cpu = browser['cpu_seconds'] - browser['cpu_base']
+            job = self._jobs.get(browser['req_id'])
+            if job is not None:
+                job['rss_mb'] = round(rss, 1)
+                job['peak_rss_mb'] = round(max(job['peak_rss_mb'], rss), 1)
+                job['cpu_seconds'] = round(max(job['cpu_seconds'], assigned_cpu), 1)
+        return rss, assigned_cpu
+
+    def check(self):
+        """Sample every browser once and kill those over a limit."""
+        with self._lock:
+            drivers = [browser['driver'] for browser in self._browsers.values()]
+        for driver in drivers:
+            rss, cpu = self._sample(driver)
+            reason = None
+            if self.max_rss_mb and rss > self.max_rss_mb:
+                reason = f"{rss:.0f}MB RSS over the {self.max_rss_mb}MB limit"
+            elif self.max_cpu_seconds and cpu > self.max_cpu_seconds:
+                reason = f"{cpu:.0f}s CPU since assignment over the {self.max_cpu_seconds}s limit"
+            if reason:
+                self._kill_browser(driver, reason, 'rss' if 'RSS' in reason else 'cpu')
+
+    def _kill_browser(self, driver, reason, kind):
+        with self._lock:
+            browser = self._browsers.get(id(driver))
+            if browser is None:
+                return
+            pids = dict(browser['pids'])
+            req_id = browser['req_id']
+            if req_id in self._jobs:
+                self._jobs[req_id]['killed'] += 1
+        print(f"Governor: killing browser of job {req_id or '(idle)'}: {reason}")
+        METRICS.count('browser_kills', reason=kind)
+        kill_processes(list(pids), pids, grace=0)
+
+    def _start_monitor(self):
+        with self._lock:
+            if self._monitor is not None or not self.interval:
+                return
+            self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor.start()
+
+    def _monitor_loop(self):
+        ticks = 0
+        while True:
+            time.sleep(self.interval)
+            ticks += 1
+            try:
+                self.check()
+                # Failed launches can leave browsers no driver owns
+                if ticks % ORPHAN_SWEEP_EVERY == 0:
+                    self.sweep_orphans()
+            except Exception as e:
+                print(f"Governor check failed: {e}")
+
+    # -- orphans -----------------------------------------------------------
+
+    def sweep_orphans(self):
+        """Kill browser processes this app started that no live driver owns (e.g. from a failed launch)."""
+        with self._lock:
+            drivers = [browser['driver'] for browser in self._browsers.values()]
+        owned = set()
+        for driver in drivers:
+            owned.update(driver_pids(driver))
+        orphans = {}
+        for pid in process_tree(os.getpid()):
+            if pid == os.getpid() or pid in owned:
+                continue
+            stat = process_stat(pid)
+            if not is_browser_process(stat):
+                continue
+            age = process_age_seconds(stat)
+            if age is not None and age < ORPHAN_GRACE_SECONDS:
+                continue
+            orphans[pid] = stat['start']
+        killed = kill_processes(list(orphans), orphans) if orphans else 0
+        if killed:
+            print(f"Governor: reaped {killed} orphaned browser processes")
+            METRICS.count('browser_processes_reaped', killed, reason='orphan')
+        return killed
+
+    def _dead_owner_pids(self):
+        """Browser pids recorded by app processes that are no longer running; their files are removed."""
+        stale = {}
+        try:
+            names = os.listdir(self.state_dir)
+        except OSError:
+            return stale
+        for name in names:
+            path = os.path.join(self.state_dir, name)
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            owner = (process_stat(state.get('owner')) or {}) if state.get('owner') else {}
+            if owner.get('start') == state.get('owner_start'):
+                # Another live worker's browsers
+                continue
+            stale.update({int(pid): start for pid, start in state.get('pids', {}).items()})
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return stale
+
+    def sweep_stale(self):
+        """At start-up: kill the browsers recorded by app processes that are no longer running.
+
+        Only recorded pids are touched; a Chrome re-parented to init may belong
+        to another live worker or a benchmark run on the same host.
+        """
+        stale = self._dead_owner_pids()
+        # Only pids whose start time still matches; anything else is a recycled pid
+        stale = {pid: start for pid, start in stale.items() if (process_stat(pid) or {}).get('start') == start}
+        killed = kill_processes(list(stale), stale) if stale else 0
+        if killed:
+            print(f"Governor: killed {killed} stale browser processes from an earlier run")
+            METRICS.count('browser_processes_reaped', killed, reason='startup')
+        self._save_state()
+        return killed
+
+    def _save_state(self):
+        with self._lock:
+            pids = {}
+            for browser in self._browsers.values():
+                pids.update(browser['pids'])
+        owner = process_stat(os.getpid()) or {}
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'owner': os.getpid(), 'owner_start': owner.get('start'),
+                           'pids': {str(pid): start for pid, start in pids.items()}}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"Governor: could not save browser pids: {e}")
+
+    # -- reporting -------------------------------------------------------
+
+    def job_finished(self, req_id):
+        """Called when a job ends however it ended; reaps anything it left behind."""
+        self.sweep_orphans()
+        return self.job_report(req_id)
+
+    def job_report(self, req_id):
+        with self._lock:
+            report = self._jobs.get(req_id)
+            return dict(report) if report else None
+
+    def stats(self):
+        with self._lock:
+            browsers = list(self._browsers.values())
+        return {
+            'browsers': len(browsers),
+            'processes': sum(len(browser['pids']) for browser in browsers),
+            'rss_mb': round(sum(browser['rss_mb'] for browser in browsers), 1),
+        }
+
+
+_GOVERNOR = None
+_GOVERNOR_LOCK = threading.Lock()
+
+
+def get_governor():
+    """The process-wide governor; the first call sweeps what an earlier run left behind."""
+    global _GOVERNOR
+    with _GOVERNOR_LOCK:
+        if _GOVERNOR is None:
+            _GOVERNOR = BrowserGovernor()
+            if GOVERNOR_SWEEP_ON_START:
+                _GOVERNOR.sweep_stale()
+        return _GOVERNOR
@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from browser_governor import get_governor, driver_rss_mb
+from metrics import METRICS
+from scraper_lib import get_driver
+from sites import STOREFRONT_ORIGINS
+
+# Pool configuration (environment overrides for small instances)
+POOL_SIZE = int(os.environ.get('DRIVER_POOL_SIZE', 1))
+POOL_MAX_JOBS = int(os.environ.get('DRIVER_MAX_JOBS', 20))
+POOL_MAX_RSS_MB = int(os.environ.get('DRIVER_MAX_RSS_MB', 900))
+POOL_PREWARM = os.environ.get('DRIVER_POOL_PREWARM', '1') == '1'
+POOL_PREWARM_HEADLESS = os.environ.get('DRIVER_POOL_PREWARM_HEADLESS', '1') == '1'
+# Site data cleared from every storefront origin when a driver goes back to the pool
+STORAGE_TYPES = 'local_storage,indexeddb,websql,service_workers,cache_storage'
+
+
+class DriverPool:
+    """A small pool of pre-launched Chrome drivers that scrape jobs borrow and return."""
+
+    def __init__(self, size=POOL_SIZE, max_jobs=POOL_MAX_JOBS, max_rss_mb=POOL_MAX_RSS_MB, factory=get_driver):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.factory = factory
+        self._cond = threading.Condition()
+        self._idle = []      # drivers ready to hand out
+        self._info = {}      # id(driver) -> {'headless', 'jobs', 'created'}
+        self._closed = False
+
+    @property
+    def live_count(self):
+        return len(self._info)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'live': len(self._info),
+                'idle': len(self._idle),
+                'busy': len(self._info) - len(self._idle),
+            }
+
+    def _launch(self, headless):
+        start = time.time()
+        driver = METRICS.instrument_driver(self.factory(headless=headless))
+        get_governor().track(driver)
+        print(f"Pool: launched driver (headless={headless}) in {time.time() - start:.1f}s")
+        return driver
+
+    def _discard(self, driver):
+        # Caller must not hold a reference in _idle anymore
+        self._info.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        # quit() can leave Chrome behind (UC starts it as a separate process)
+        get_governor().forget(driver)
+
+    def _is_healthy(self, driver):
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _needs_recycle(self, driver):
+        info = self._info.get(id(driver), {})
+        if self.max_jobs and info.get('jobs', 0) >= self.max_jobs:
+            print(f"Pool: recycling driver after {info.get('jobs')} jobs")
+            return True
+        if self.max_rss_mb:
+            rss = driver_rss_mb(driver)
+            if rss is not None and rss > self.max_rss_mb:
+                print(f"Pool: recycling driver at {rss:.0f}MB RSS")
+                return True
+        return False
+
+    def _reset(self, driver):
+        # Clear cookies and storage so jobs don't leak session state into each other.
+        # The HTTP cache stays: keeping it warm across jobs is part of what the pool is for.
+        try:
+            driver.delete_all_cookies()
+        except Exception:
+            pass
+        try:
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        except Exception:
+            pass
+        # localStorage.clear() would only reach the page's own origin
+        for origin in STOREFRONT_ORIGINS:
+            try:
+                driver.execute_cdp_cmd('Storage.clearDataForOrigin',
+                                       {'origin': origin, 'storageTypes': STORAGE_TYPES})
+            except Exception:
+                pass
+        try:
+            driver.execute_script("try { sessionStorage.clear(); } catch (e) {}")
+        except Exception:
+            pass
+        try:
+            driver.get("about:blank")
+        except Exception:
+            pass
+
+    def acquire(self, headless=True, timeout=None):
+        """Borrow a healthy driver, launching one if the pool has room."""
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            launch = False
+            evict = None
+            with self._cond:
+                if self._closed:
+                    raise Exception("Driver pool is shut down")
+
+                for driver in list(self._idle):
+                    if self._info[id(driver)]['headless'] == headless:
+                        self._idle.remove(driver)
+                        break
+                else:
+                    driver = None
+
+                if driver is None:
+                    if len(self._info) < self.size:
+                        launch = True
+                        # Reserve the slot before launching outside the lock
+                        placeholder = object()
+                        self._info[id(placeholder)] = {'headless': headless, 'jobs': 0, 'created': time.time()}
+                    elif self._idle:
+                        # Idle driver with the wrong display mode; replace it
+                        evict = self._idle.pop(0)
+                    else:
+                        remaining = deadline - time.time() if deadline else None
+                        if remaining is not None and remaining <= 0:
+                            raise Exception("Timed out waiting for a free driver")
+                        self._cond.wait(remaining)
+                        continue
+
+            if evict is not None:
+                with self._cond:
+                    self._discard(evict)
+                continue
+
+            if launch:
+                try:
+                    driver = self._launch(headless)
+                except Exception:
+                    with self._cond:
+                        self._info.pop(id(placeholder), None)
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._info.pop(id(placeholder), None)
+                    self._info[id(driver)] = {'headless': headless, 'jobs': 0, 'created': time.time()}
+
+            if launch or self._is_healthy(driver):
+                with self._cond:
+                    self._info[id(driver)]['jobs'] += 1
+                return driver
+
+            print("Pool: idle driver failed health check, replacing")
+            with self._cond:
+                self._discard(driver)
+                self._cond.notify()
+
+    def release(self, driver, broken=False):
+        """Return a borrowed driver. Broken or worn-out drivers are quit instead."""
+        if driver is None:
+            return
+        if not broken:
+            broken = not self._is_healthy(driver) or self._needs_recycle(driver)
+        if not broken:
+            self._reset(driver)
+
+        with self._cond:
+            if broken or self._closed or id(driver) not in self._info:
+                self._discard(driver)
+            else:
+                self._idle.append(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def borrow(self, headless=True, timeout=None):
+        driver = self.acquire(headless=headless, timeout=timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = not self._is_healthy(driver)
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def prewarm(self, headless=True, count=None):
+        """Launch drivers up to count (default: pool size) so the first job doesn't pay start-up."""
+        count = self.size if count is None else min(count, self.size)
+        for _ in range(count):
+            with self._cond:
+                if len(self._info) >= self.size:
+                    return
+            try:
+                driver = self.acquire(headless=headless)
+            except Exception as e:
+                print(f"Pool: pre-warm failed: {e}")
+                return
+            with self._cond:
+                # Pre-warming isn't a job
+                self._info[id(driver)]['jobs'] -= 1
+                self._idle.append(driver)
+                self._cond.notify()
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for driver in idle:
+                self._discard(driver)
+            self._cond.notify_all()
+
+
+class DriverLease:
+    """One pool driver held across several scrapes (e.g. a batch's categories).
+
+    The driver is only acquired when first needed, and a broken one is
+    discarded so the next acquire() brings up a fresh browser.
+    """
+
+    def __init__(self, pool, headless=True, req_id=None):
+        self.pool = pool
+        self.headless = headless
+        self.req_id = req_id
+        self.driver = None
+
+    def acquire(self):
+        if self.driver is None:
+            with METRICS.span('driver_acquire'):
+                self.driver = self.pool.acquire(headless=self.headless)
+            # The governor charges the browser's memory and CPU to this job
+            get_governor().assign(self.driver, self.req_id)
+        return self.driver
+
+    def discard(self):
+        if self.driver is not None:
+            get_governor().assign(self.driver, None)
+            self.pool.release(self.driver, broken=True)
+            self.driver = None
+
+    def release(self):
+        if self.driver is not None:
+            get_governor().assign(self.driver, None)
+            # The pool health-checks the driver and quits it if a failure broke it
+            self.pool.release(self.driver)
+            self.driver = None
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = DriverPool()
+        return _POOL
+
+
+def prewarm_in_background(headless=POOL_PREWARM_HEADLESS):
+    if not POOL_PREWARM:
+        return None
+    thread = threading.Thread(target=get_pool().prewarm, kwargs={'headless': headless}, daemon=True)
+    thread.start()
+    return thread
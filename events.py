@@ -0,0 +1,58 @@
+import threading
+
+from job_state import get_job_state
+
+HEARTBEAT_SECONDS = 15
+# How often subscribers look for events published by other processes
+EVENT_POLL_SECONDS = 1.0
+TERMINAL_EVENTS = ('completed', 'failed', 'cancelled')
+
+
+class JobEvents:
+    """Pub/sub of job progress events, consumed by the SSE endpoint.
+
+    Events live in the shared job state, so a subscriber on any web worker
+    sees what a scrape worker process publishes; publishers in the same
+    process also wake subscribers immediately.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+
+    def publish(self, req_id, event, data):
+        event_id = get_job_state().publish(req_id, event, data)
+        with self._cond:
+            self._cond.notify_all()
+        return event_id
+
+    def last_id(self, req_id):
+        return get_job_state().last_event_id(req_id)
+
+    def listen(self, req_id, last_id=0, heartbeat=HEARTBEAT_SECONDS):
+        """Yield (id, event, data) after last_id until a terminal event; None means heartbeat."""
+        state = get_job_state()
+        while True:
+            pending = state.events_after(req_id, last_id)
+            waited = 0.0
+            while not pending and waited < heartbeat:
+                with self._cond:
+                    self._cond.wait(EVENT_POLL_SECONDS)
+                waited += EVENT_POLL_SECONDS
+                pending = state.events_after(req_id, last_id)
+            if not pending:
+                yield None
+                continue
+            for event_id, event, data in pending:
+                last_id = event_id
+                yield event_id, event, data
+                if event in TERMINAL_EVENTS:
+                    return
+
+
+JOB_EVENTS = JobEvents()
+
+
+def format_sse(event_id, event, data_json):
+    # Events without an id (e.g. the initial snapshot) don't move the client's Last-Event-ID
+    id_line = f"id: {event_id}\n" if event_id else ""
+    return f"{id_line}event: {event}\ndata: {data_json}\n\n"
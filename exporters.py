@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+
+from result_store import PRICE_COLUMNS
+
+# Rows pulled from the store per write; bounds memory whatever the job size
+EXPORT_BATCH_ROWS = 5000
+INTEGER_COLUMNS = ('No.',)
+
+# format -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'csv.zst': ('csv.zst', 'application/zstd'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'jsonl.gz': ('jsonl.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.stream'),
+}
+
+
+class ExportUnavailable(Exception):
+    """The format needs an optional package that isn't installed."""
+
+
+def _batches(rows, size=EXPORT_BATCH_ROWS):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, restval='', extrasaction='ignore')
+    # BOM so Excel opens it as UTF-8, like the CSV the job writes
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for batch in _batches(rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl_chunks(columns, rows):
+    for batch in _batches(rows):
+        yield ''.join(
+            json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False) + '\n' for row in batch
+        ).encode('utf-8')
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)   # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _zstd(chunks, zstandard):
+    compressor = zstandard.ZstdCompressor(level=10).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ExportUnavailable("csv.zst exports need the 'zstandard' package")
+    return zstandard
+
+
+def _arrow_schema(pa, columns):
+    fields = []
+    for column in columns:
+        if column in INTEGER_COLUMNS:
+            fields.append(pa.field(column, pa.int64()))
+        elif column in PRICE_COLUMNS:
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def _record_batches(pa, schema, rows):
+    for batch in _batches(rows):
+        yield pa.RecordBatch.from_pydict(
+            {field.name: [row.get(field.name) for row in batch] for field in schema}, schema=schema
+        )
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportUnavailable("parquet and arrow exports need the 'pyarrow' package")
+    return pyarrow
+
+
+def _arrow_chunks(pa, columns, rows):
+    schema = _arrow_schema(pa, columns)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for record_batch in _record_batches(pa, schema, rows):
+            writer.write_batch(record_batch)
+            # Hand over what's been written so far and reuse the buffer
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def _parquet_chunks(pa, columns, rows):
+    # Parquet's footer is written last, so spool to a temp file and stream it out afterwards
+    schema = _arrow_schema(pa, columns)
+    with tempfile.TemporaryFile() as spool:
+        with pa.parquet.ParquetWriter(spool, schema, compression='zstd') as writer:
+            for record_batch in _record_batches(pa, schema, rows):
+                writer.write_batch(record_batch)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(1024 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_chunks(fmt, columns, rows):
+    """Byte chunks of rows (an iterator of dicts) encoded as fmt; nothing holds the whole job in memory.
+
+    Raises ExportUnavailable up front, before any bytes are produced, when an
+    optional package is missing.
+    """
+    if fmt in ('csv', 'csv.gz', 'csv.zst'):
+        chunks = _csv_chunks(columns, rows)
+    elif fmt in ('jsonl', 'jsonl.gz'):
+        chunks = _jsonl_chunks(columns, rows)
+    elif fmt == 'parquet':
+        return _parquet_chunks(_import_pyarrow(), columns, rows)
+    elif fmt == 'arrow':
+        return _arrow_chunks(_import_pyarrow(), columns, rows)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    if fmt.endswith('.gz'):
+        return _gzip(chunks)
+    if fmt.endswith('.zst'):
+        return _zstd(chunks, _import_zstandard())
+    return chunks
+
+
+def export_filename(filename, fmt):
+    return f"{os.path.splitext(os.path.basename(filename))[0]}.{EXPORT_FORMATS[fmt][0]}"
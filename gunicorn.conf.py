@@ -0,0 +1,31 @@
+# Production web server: gunicorn -c gunicorn.conf.py app:app
+# Web workers only queue jobs and serve state; scrapes and browsers run in worker.py processes.
+import os
+
+from browser_governor import process_rss_mb, process_stat, process_age_seconds
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', 5500)}"
+# Requests are short SQLite reads except SSE streams, which hold a thread each for the life of a job
+workers = int(os.environ.get('WEB_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 16))
+# Import the app once in the master; workers fork with it loaded and share its pages
+preload_app = True
+# Long enough for a large export to stream; SSE keepalives arrive every 15s
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks can't grow forever
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    pid = os.getpid()
+    server.log.info(f"Ready in {process_age_seconds(process_stat(pid)):.2f}s, master RSS {process_rss_mb(pid):.0f} MB")
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Web worker {worker.pid} idle RSS {process_rss_mb(worker.pid):.0f} MB")
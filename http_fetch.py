@@ -0,0 +1,488 @@
+import json
+import os
+import re
+import threading
+import time
+from html import unescape
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+from page_cache import get_cache
+from product_ids import product_id
+from sites import supported_site
+from scraper_lib import (
+    JobCancelled, ScrapeComplete, RowSink, unseen_products, mostly_seen, new_job_stats, report_progress, extract_category_from_url, nahdi_page_template, build_nahdi_product, build_aldawaa_product,
+    parse_aldawaa_toolbar, aldawaa_total_pages, aldawaa_page_url
+)
+
+# Browserless tier: plain HTTP + HTML/JSON parsing, Selenium only when this fails
+HTTP_FETCH = os.environ.get('HTTP_FETCH', '1') == '1'
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 20))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 8))
+HTTP_MAX_PAGES = int(os.environ.get('HTTP_MAX_PAGES', 200))
+# Most category URLs a sitemap or category root may expand into
+DISCOVER_MAX_URLS = int(os.environ.get('DISCOVER_MAX_URLS', 100))
+# Most sitemap/root documents one discovery fetches, and how long it may keep fetching them
+DISCOVER_MAX_FETCHES = int(os.environ.get('DISCOVER_MAX_FETCHES', 20))
+DISCOVER_MAX_SECONDS = float(os.environ.get('DISCOVER_MAX_SECONDS', 60))
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9,ar;q=0.8",
+}
+
+CHALLENGE_MARKERS = [
+    "cf-chl", "challenge-platform", "just a moment...", "attention required",
+    "px-captcha", "captcha-delivery", "g-recaptcha", "h-captcha", "_incapsula_resource",
+    "access denied", "request unsuccessful",
+]
+
+
+class BotChallenge(Exception):
+    """The site answered with a bot check instead of the listing."""
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session():
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(HEADERS)
+            _SESSION = session
+        return _SESSION
+
+
+def looks_like_challenge(status_code, html):
+    if status_code in (403, 429, 503):
+        return True
+    head = html[:20000].lower()
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+def fetch_html(url, max_staleness=None):
+    """GET a listing page, served from the page cache when a fresh copy exists."""
+    cache = get_cache()
+    if cache is not None and max_staleness != 0:
+        html = cache.get(url, "html", max_age=max_staleness)
+        if html is not None:
+            return html
+    with METRICS.span('http_fetch'):
+        response = get_session().get(url, timeout=HTTP_TIMEOUT)
+    if looks_like_challenge(response.status_code, response.text):
+        raise BotChallenge(f"Bot challenge on {url} (HTTP {response.status_code})")
+    response.raise_for_status()
+    if cache is not None:
+        cache.put(url, "html", response.text)
+    return response.text
+
+
+def _text(element):
+    # Approximates Selenium's .text: whitespace-collapsed visible text
+    if element is None:
+        return None
+    return " ".join(element.get_text(" ").split())
+
+
+def _select_text(card, selector):
+    return _text(card.select_one(selector))
+
+
+# --- Nahdi -----------------------------------------------------------------
+
+def _nahdi_raw_from_html(card, page_url):
+    # Same raw dict shape as scraper_lib.NAHDI_CARDS_JS so build_nahdi_product applies unchanged
+    img = card.find("img")
+    badge = card.select_one("div[class*='bg-red'], div[class*='bg-yellow']")
+    href = card.get("href")
+    raw = {
+        "name_text": _select_text(card, "span.line-clamp-3"),
+        "img_alt": (img.get("alt") or "") if img is not None else None,
+        "aria_label": card.get("aria-label"),
+        "href": urljoin(page_url, href) if href else None,
+        "gray_text": _select_text(card, "span.text-gray-dark"),
+        "strike_text": _select_text(card, ".line-through"),
+        "red_text": _select_text(card, ".text-red"),
+        "badge_text": badge.get_text() if badge is not None else None,
+        "white_text": _select_text(card, "span.text-white"),
+        "inner_text": None,
+    }
+    if not raw["gray_text"] and not raw["strike_text"] and not raw["red_text"]:
+        raw["inner_text"] = card.get_text(" ")
+    return raw
+
+
+def _nahdi_cards_from_html(soup):
+    cards = soup.select("a.flex.h-full.flex-col")
+    if cards:
+        return cards
+    unique_cards = []
+    seen_links = set()
+    for span in soup.select("span.line-clamp-3"):
+        anchor = span.find_parent("a")
+        if anchor is not None and anchor.get("href") and anchor.get("href") not in seen_links:
+            seen_links.add(anchor.get("href"))
+            unique_cards.append(anchor)
+    return unique_cards
+
+
+def _walk_json(node):
+    # Depth-first in document order so rows keep the listing order
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            yield current
+            stack.extend(reversed(list(current.values())))
+        elif isinstance(current, list):
+            stack.extend(reversed(current))
+
+
+def _first(item, keys):
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, "", [], {}):
+            return value
+    return None
+
+
+def _as_price(value):
+    if isinstance(value, dict):
+        value = _first(value, ["value", "amount", "price"])
+    try:
+        return float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def _nahdi_products_from_next_data(soup, page_url, category_name):
+    # Fallback when the server HTML has no rendered cards: read the Next.js data blob
+    script = soup.find("script", id="__NEXT_DATA__")
+    if script is None or not script.string:
+        return []
+    try:
+        data = json.loads(script.string)
+    except ValueError:
+        return []
+
+    products = []
+    seen = set()
+    for item in _walk_json(data):
+        name = _first(item, ["name", "title", "product_name"])
+        final = _as_price(_first(item, ["final_price", "special_price", "price", "selling_price"]))
+        link = _first(item, ["url", "href", "canonical_url", "url_key", "slug"])
+        if not isinstance(name, str) or final is None or not isinstance(link, str):
+            continue
+        if not link.startswith(("http", "/")):
+            link = "/en-sa/" + link
+        link = urljoin(page_url, link)
+        if link in seen:
+            continue
+        seen.add(link)
+
+        original = _as_price(_first(item, ["regular_price", "original_price", "old_price", "price_before_discount"]))
+        regular_price = price_after_discount = price_without_discount = ""
+        if original and original > final:
+            regular_price = f"{original:.2f}"
+            price_after_discount = f"{final:.2f}"
+        else:
+            price_without_discount = f"{final:.2f}"
+
+        discount_percent = ""
+        percent = _first(item, ["discount_percentage", "discount_percent", "discount"])
+        if isinstance(percent, (int, float)) and percent > 0:
+            discount_percent = f"Save {percent:g}%"
+
+        products.append({
+            "Product Name": name.strip(),
+            "Regular Price": regular_price,
+            "Price After Discount": price_after_discount,
+            "Price Without Discount": price_without_discount,
+            "Discount %": discount_percent,
+            "Category": category_name,
+            "Image Link": link,
+            "Source": "Nahdi"
+        })
+    return products
+
+
+def parse_nahdi_html(html, page_url, category_name):
+    soup = BeautifulSoup(html, "html.parser")
+    cards = _nahdi_cards_from_html(soup)
+    if cards:
+        return [build_nahdi_product(_nahdi_raw_from_html(card, page_url), category_name) for card in cards]
+    return _nahdi_products_from_next_data(soup, page_url, category_name)
+
+
+def fetch_nahdi(base_url, status_callback=None, row_sink=None, max_staleness=None):
+    """Scrape a Nahdi category over plain HTTP. Returns None to request the browser path."""
+    category_name = extract_category_from_url(base_url)
+    base_url = nahdi_page_template(base_url)
+    sink = RowSink(row_sink)
+    job_stats = new_job_stats()
+    seen_ids = set()
+
+    for page in range(1, HTTP_MAX_PAGES + 1):
+        url = base_url.format(page)
+        report_progress(status_callback, page, sink.count, job_stats)
+        print(f"HTTP fetching page {page}: {url}")
+        page_products = parse_nahdi_html(fetch_html(url, max_staleness), url, category_name)
+        if not page_products:
+            if page == 1:
+                # Client-rendered listing; only a browser can see the cards
+                return None
+            break
+
+        new_products = unseen_products(page_products, seen_ids)
+        if not new_products:
+            break
+        sink.emit(new_products)
+        report_progress(status_callback, page, sink.count, job_stats, event="page_done", cards=len(page_products))
+        if sink.count > len(new_products) and mostly_seen(len(page_products), len(new_products)):
+            break
+
+    return sink.result()
+
+
+# --- Al-Dawaa --------------------------------------------------------------
+
+def _aldawaa_product_from_html(card, page_url, category_name):
+    context = card.select_one(".product-detail-section") or card
+
+    name = _select_text(context, ".product-name") or _select_text(context, "a.product-item-link") or ""
+
+    selling_price = ""
+    icon = context.select_one(".icon-saudi_riyal")
+    if icon is not None and icon.parent is not None:
+        selling_price = _text(icon.parent)
+    if not selling_price:
+        selling_price = _select_text(context, "[data-price-type='finalPrice'] .price") or ""
+
+    old_price = (_select_text(context, ".price-section.total")
+                 or _select_text(context, "[data-price-type='oldPrice'] .price") or "")
+    discount_percent = _select_text(context, ".promotion-style span") or ""
+
+    product_link = ""
+    for scope in (context, card):
+        for link in scope.find_all("a", href=True):
+            if "/p/" in link["href"]:
+                product_link = urljoin(page_url, link["href"])
+                break
+        if product_link:
+            break
+
+    return build_aldawaa_product(name, selling_price, old_price, discount_percent, product_link, category_name)
+
+
+def _aldawaa_next_url(soup, page_url):
+    for selector in ["a.action.next", "li.pages-item-next a", "link[rel='next']", "a[rel='next']"]:
+        element = soup.select_one(selector)
+        if element is not None and element.get("href"):
+            return urljoin(page_url, element["href"])
+    return None
+
+
+def _aldawaa_toolbar_info(soup, page_url):
+    # Same shape as scraper_lib.ALDAWAA_TOOLBAR_JS returns
+    amount = soup.select_one(".toolbar-amount, #toolbar-amount")
+    pager_links = soup.select(".pages a, .pages-items a")
+    return {
+        "limits": [
+            {"value": option.get("value") or "", "text": _text(option)}
+            for option in soup.select("select#limiter option, .limiter-options option, .limiter select option")
+        ],
+        "amount": _text(amount) or "",
+        "hrefs": [urljoin(page_url, a.get("href") or "") for a in pager_links],
+    }
+
+
+def parse_aldawaa_html(html, page_url, category_name):
+    """Return (products, next_page_url, toolbar) for one Al-Dawaa listing page."""
+    soup = BeautifulSoup(html, "html.parser")
+    cards = (soup.select(".product-detail-section")
+             or soup.select("li.product-item")
+             or soup.select("[class*='product-item-info']"))
+    products = [_aldawaa_product_from_html(card, page_url, category_name) for card in cards]
+    toolbar = parse_aldawaa_toolbar(_aldawaa_toolbar_info(soup, page_url))
+    return products, _aldawaa_next_url(soup, page_url), toolbar
+
+
+def fetch_aldawaa(start_url, status_callback=None, row_sink=None, max_staleness=None):
+    """Scrape an Al-Dawaa category over plain HTTP. Returns None to request the browser path."""
+    category_name = extract_category_from_url(start_url)
+    job_stats = new_job_stats()
+    report_progress(status_callback, 1, 0, job_stats)
+    print(f"HTTP fetching page 1: {start_url}")
+    page_products, next_url, toolbar = parse_aldawaa_html(fetch_html(start_url, max_staleness), start_url, category_name)
+    if not page_products:
+        return None
+
+    limit = toolbar["current_limit"]
+    if toolbar["limits"] and (limit is None or toolbar["limits"][-1] > limit):
+        # Re-read page 1 at the largest page size the limiter offers
+        limit = toolbar["limits"][-1]
+        url = aldawaa_page_url(start_url, 1, toolbar, limit)
+        resized_products, next_url, resized = parse_aldawaa_html(fetch_html(url, max_staleness), url, category_name)
+        if resized_products:
+            resized["limit_param"] = toolbar["limit_param"]
+            page_products, toolbar = resized_products, resized
+    sink = RowSink(row_sink)
+    seen_ids = set()
+
+    def emit_page(page, page_products):
+        """Emit the page's unseen rows; True when it mostly repeats earlier pages."""
+        new_products = unseen_products(page_products, seen_ids)
+        sink.emit(new_products)
+        report_progress(status_callback, page, sink.count, job_stats, event="page_done", cards=len(page_products))
+        return sink.count > len(new_products) and mostly_seen(len(page_products), len(new_products))
+
+    total_pages = aldawaa_total_pages(toolbar, toolbar["current_limit"] or limit)
+    job_stats["total_pages"] = total_pages
+    emit_page(1, page_products)
+    if total_pages:
+        # Every page is known upfront, so address them directly
+        for page in range(2, min(total_pages, HTTP_MAX_PAGES) + 1):
+            url = aldawaa_page_url(start_url, page, toolbar, limit)
+            report_progress(status_callback, page, sink.count, job_stats)
+            print(f"HTTP fetching page {page}: {url}")
+            page_products = parse_aldawaa_html(fetch_html(url, max_staleness), url, category_name)[0]
+            if not page_products or emit_page(page, page_products):
+                break
+        return sink.result()
+
+    visited = {start_url}
+    page = 2
+    # A pager link is page content, so it must not lead the server off the storefront
+    while next_url and next_url not in visited and supported_site(next_url) and page <= HTTP_MAX_PAGES:
+        visited.add(next_url)
+        report_progress(status_callback, page, sink.count, job_stats)
+        print(f"HTTP fetching page {page}: {next_url}")
+        page_products, next_url, _ = parse_aldawaa_html(fetch_html(next_url, max_staleness), next_url, category_name)
+        if not page_products or emit_page(page, page_products):
+            break
+        page += 1
+
+    return sink.result()
+
+
+def fetch_category(url, status_callback=None, row_sink=None, max_staleness=None):
+    """Try the browserless tier. Returns rows (or the row count with row_sink), or None when the browser must take over.
+
+    Rows may already have reached row_sink when None is returned. The browser
+    must then start over at page 1, since its page size and numbering can
+    differ from this tier's: callers either discard those rows first or pass
+    their product identities as the browser's seen_ids.
+    """
+    # Only storefront hosts are ever requested from the server; anything else is left to the browser scrapers
+    if not HTTP_FETCH or not supported_site(url):
+        return None
+    host = urlparse(url).hostname.lower()
+    try:
+        result = None
+        if "nahdionline" in host:
+            result = fetch_nahdi(url, status_callback=status_callback, row_sink=row_sink,
+                                 max_staleness=max_staleness)
+        elif "al-dawaa" in host:
+            result = fetch_aldawaa(url, status_callback=status_callback, row_sink=row_sink,
+                                   max_staleness=max_staleness)
+        if result is not None:
+            return result
+        METRICS.count('fallbacks', path='browser', reason='no_cards')
+    except (JobCancelled, ScrapeComplete):
+        raise
+    except BotChallenge as e:
+        print(f"{e}; falling back to the browser")
+        METRICS.count('fallbacks', path='browser', reason='bot_challenge')
+    except Exception as e:
+        print(f"HTTP fetch failed ({e}); falling back to the browser")
+        METRICS.count('fallbacks', path='browser', reason='error')
+    return None
+
+
+SITEMAP_LOC_RE = re.compile(r"<loc>\s*([^<]+?)\s*</loc>")
+# What a category listing looks like on each storefront; sitemaps also list CMS, help and account pages
+LISTING_PATH_RES = {
+    "nahdionline.com": re.compile(r"/plp/"),
+    "al-dawaa.com": re.compile(
+        r"^/(english|arabic)/(?!(customer|checkout|cart|wishlist|sales|cms|contact|about|help|faq|privacy|terms|"
+        r"blog|stores|catalogsearch)\b)[^.]+(\.html)?$"
+    ),
+}
+
+
+def _listing_page(parts):
+    host = (parts.hostname or "").lower()
+    return any(
+        (host == domain or host.endswith("." + domain)) and pattern.search(parts.path)
+        for domain, pattern in LISTING_PATH_RES.items()
+    )
+
+
+def _category_link(url, root):
+    """True for listing pages on the root's site and under its path (not product pages or assets)."""
+    parts = urlparse(url)
+    if parts.scheme not in ("http", "https") or parts.netloc.lower() != root.netloc.lower():
+        return False
+    if product_id(url) or not _listing_page(parts):
+        return False
+    root_path = root.path.rstrip("/")
+    path = parts.path.rstrip("/")
+    return path != root_path and path.startswith(root_path)
+
+
+def discover_category_urls(root_url, limit=DISCOVER_MAX_URLS, max_fetches=DISCOVER_MAX_FETCHES,
+                           max_seconds=DISCOVER_MAX_SECONDS):
+    """Category URLs found under a sitemap (XML, nested indexes followed) or a category root page.
+
+    Only listing pages under the root's directory are kept, in the order they
+    are listed. Only Nahdi and Al-Dawaa hosts are fetched: a root elsewhere
+    raises ValueError and nested sitemaps pointing elsewhere are skipped. At
+    most max_fetches documents are read, and none is started after max_seconds.
+    """
+    if not supported_site(root_url):
+        raise ValueError(f"Not a Nahdi or Al-Dawaa URL: {root_url}")
+    root = urlparse(root_url)
+    deadline = time.time() + max_seconds
+    found = []
+    seen = set()
+    pending = [root_url]
+    while pending and len(found) < limit:
+        # The root itself is always read
+        if seen and (len(seen) >= max_fetches or time.time() > deadline):
+            print(f"Discovery under {root_url} stopped after {len(seen)} documents with {len(pending)} unread")
+            break
+        url = pending.pop(0)
+        if url in seen:
+            continue
+        seen.add(url)
+        text = fetch_html(url)
+        head = text[:2000]
+        if "<urlset" in head or "<sitemapindex" in head:
+            locs = [unescape(loc) for loc in SITEMAP_LOC_RE.findall(text)]
+            if "<sitemapindex" in head:
+                pending.extend(loc for loc in locs if supported_site(loc) and loc not in seen)
+                continue
+            links = locs
+            # A sitemap's entries live under the directory it sits in, not under the sitemap file itself
+            scope = root._replace(path=root.path.rsplit("/", 1)[0] + "/")
+        else:
+            soup = BeautifulSoup(text, "html.parser")
+            links = [urljoin(url, a["href"]).split("#")[0] for a in soup.select("a[href]")]
+            scope = root
+        for link in links:
+            if link not in found and _category_link(link, scope):
+                found.append(link)
+                if len(found) >= limit:
+                    break
+    return found
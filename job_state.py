@@ -0,0 +1,292 @@
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from result_store import RESULTS_DB
+
+# 'sqlite' (one file shared by every process on the host or volume) or 'package.module:Class'
+# for a network-backed implementation of JobStateBackend
+JOB_STATE_BACKEND = os.environ.get('JOB_STATE_BACKEND', 'sqlite')
+JOB_STATE_DB = os.environ.get('JOB_STATE_DB', RESULTS_DB)
+# Finished jobs (status, events, rows and files) are evicted this long after their last update
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 7 * 24 * 3600))
+# Events kept per job so late or reconnecting subscribers can catch up
+MAX_EVENTS_PER_JOB = 500
+# A worker whose heartbeat is older than this is gone; its running jobs are abandoned
+WORKER_STALE_SECONDS = int(os.environ.get('WORKER_STALE_SECONDS', 60))
+
+ACTIVE_STATES = ('queued', 'running', 'cancelling')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_queue (
+    req_id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    args TEXT,
+    priority INTEGER,
+    state TEXT,
+    worker TEXT,
+    submitted REAL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS idx_job_queue_state ON job_queue (state, priority, submitted);
+CREATE TABLE IF NOT EXISTS job_status (
+    req_id TEXT PRIMARY KEY,
+    status TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    req_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    event TEXT,
+    data TEXT,
+    PRIMARY KEY (req_id, id)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    info TEXT,
+    updated_at REAL
+);
+"""
+
+
+def worker_id():
+    """Identity of this process in the shared state: host and pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobStateBackend:
+    """Job status, progress events, the job queue and worker heartbeats, shared by every process.
+
+    Web workers read status and events and enqueue jobs; scrape workers claim
+    jobs and write status and events. SqliteJobState covers one host (or a
+    shared volume); set JOB_STATE_BACKEND to 'module:Class' to plug in a
+    network store implementing the same methods.
+    """
+
+    # Status shown by /progress
+    def get_status(self, req_id):
+        raise NotImplementedError
+
+    def set_status(self, req_id, status):
+        raise NotImplementedError
+
+    # Progress events for the SSE endpoint
+    def publish(self, req_id, event, data):
+        """Append an event; returns its id (increasing per job)."""
+        raise NotImplementedError
+
+    def events_after(self, req_id, last_id):
+        """[(id, event, data)] newer than last_id, oldest first."""
+        raise NotImplementedError
+
+    def last_event_id(self, req_id):
+        raise NotImplementedError
+
+    # Job queue
+    def enqueue(self, req_id, task, args, priority):
+        raise NotImplementedError
+
+    def claim(self, worker):
+        """Atomically mark the next queued job running on worker; returns the job or None."""
+        raise NotImplementedError
+
+    def finish(self, req_id):
+        raise NotImplementedError
+
+    def cancel(self, req_id):
+        """'cancelled' for a queued job, 'cancelling' for a running one, None when it isn't active."""
+        raise NotImplementedError
+
+    def job(self, req_id):
+        """Queue entry: task, args, priority, state, worker, submitted, started, finished."""
+        raise NotImplementedError
+
+    def jobs(self, states):
+        """Queue entries in the given states, in the order they run."""
+        raise NotImplementedError
+
+    def recent_durations(self, limit=20):
+        raise NotImplementedError
+
+    # Scrape worker processes
+    def heartbeat(self, worker, info):
+        raise NotImplementedError
+
+    def workers(self, max_age=WORKER_STALE_SECONDS):
+        """{worker id: info} for workers seen within max_age seconds."""
+        raise NotImplementedError
+
+    # Eviction
+    def expired_jobs(self, cutoff):
+        """Jobs no longer active whose status was last updated before cutoff."""
+        raise NotImplementedError
+
+    def delete(self, req_id):
+        raise NotImplementedError
+
+
+class SqliteJobState(JobStateBackend):
+    """JobStateBackend in an SQLite file; WAL and SQLite's file locks make it safe across processes."""
+
+    def __init__(self, path=JOB_STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_status(self, req_id):
+        row = self._connect().execute('SELECT status FROM job_status WHERE req_id = ?', (req_id,)).fetchone()
+        return json.loads(row['status']) if row else None
+
+    def set_status(self, req_id, status):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO job_status (req_id, status, updated_at) VALUES (?, ?, ?)',
+                (req_id, json.dumps(status), time.time())
+            )
+
+    def publish(self, req_id, event, data):
+        with self._connect() as conn:
+            # Taken before reading MAX(id) so concurrent publishers can't reuse an id
+            conn.execute('BEGIN IMMEDIATE')
+            event_id = conn.execute(
+                'SELECT COALESCE(MAX(id), 0) + 1 FROM job_events WHERE req_id = ?', (req_id,)
+            ).fetchone()[0]
+            conn.execute('INSERT INTO job_events (req_id, id, event, data) VALUES (?, ?, ?, ?)',
+                         (req_id, event_id, event, json.dumps(data)))
+            conn.execute('DELETE FROM job_events WHERE req_id = ? AND id <= ?',
+                         (req_id, event_id - MAX_EVENTS_PER_JOB))
+        return event_id
+
+    def events_after(self, req_id, last_id):
+        rows = self._connect().execute(
+            'SELECT id, event, data FROM job_events WHERE req_id = ? AND id > ? ORDER BY id', (req_id, last_id)
+        ).fetchall()
+        return [(row['id'], row['event'], json.loads(row['data'])) for row in rows]
+
+    def last_event_id(self, req_id):
+        return self._connect().execute(
+            'SELECT COALESCE(MAX(id), 0) FROM job_events WHERE req_id = ?', (req_id,)
+        ).fetchone()[0]
+
+    def enqueue(self, req_id, task, args, priority):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO job_queue (req_id, task, args, priority, state, worker, submitted, started, '
+                'finished) VALUES (?, ?, ?, ?, ?, NULL, ?, NULL, NULL)',
+                (req_id, task, json.dumps(list(args)), priority, 'queued', time.time())
+            )
+
+    def _job_dict(self, row):
+        job = dict(row)
+        job['args'] = json.loads(job['args']) if job['args'] else []
+        return job
+
+    def claim(self, worker):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT * FROM job_queue WHERE state = 'queued' ORDER BY priority, submitted LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            started = time.time()
+            conn.execute("UPDATE job_queue SET state = 'running', worker = ?, started = ? WHERE req_id = ?",
+                         (worker, started, row['req_id']))
+        job = self._job_dict(row)
+        job.update(state='running', worker=worker, started=started)
+        return job
+
+    def finish(self, req_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE job_queue SET state = 'done', finished = ? WHERE req_id = ?", (time.time(), req_id))
+
+    def cancel(self, req_id):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT state FROM job_queue WHERE req_id = ?', (req_id,)).fetchone()
+            if row is None or row['state'] not in ACTIVE_STATES:
+                return None
+            state = 'cancelled' if row['state'] == 'queued' else 'cancelling'
+            conn.execute('UPDATE job_queue SET state = ? WHERE req_id = ?', (state, req_id))
+        return state
+
+    def job(self, req_id):
+        row = self._connect().execute('SELECT * FROM job_queue WHERE req_id = ?', (req_id,)).fetchone()
+        return self._job_dict(row) if row else None
+
+    def jobs(self, states):
+        rows = self._connect().execute(
+            f"SELECT * FROM job_queue WHERE state IN ({', '.join('?' * len(states))}) ORDER BY priority, submitted",
+            tuple(states)
+        ).fetchall()
+        return [self._job_dict(row) for row in rows]
+
+    def recent_durations(self, limit=20):
+        rows = self._connect().execute(
+            "SELECT finished - started FROM job_queue WHERE state = 'done' AND started IS NOT NULL "
+            "ORDER BY finished DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def heartbeat(self, worker, info):
+        with self._connect() as conn:
+            now = time.time()
+            conn.execute('INSERT OR REPLACE INTO workers (worker_id, info, updated_at) VALUES (?, ?, ?)',
+                         (worker, json.dumps(info), now))
+            # Workers that stopped long ago
+            conn.execute('DELETE FROM workers WHERE updated_at < ?', (now - 24 * 3600,))
+
+    def workers(self, max_age=WORKER_STALE_SECONDS):
+        cutoff = time.time() - max_age
+        conn = self._connect()
+        rows = conn.execute('SELECT worker_id, info FROM workers WHERE updated_at >= ?', (cutoff,)).fetchall()
+        return {row['worker_id']: json.loads(row['info']) for row in rows}
+
+    def expired_jobs(self, cutoff):
+        rows = self._connect().execute(
+            'SELECT s.req_id FROM job_status s LEFT JOIN job_queue q ON q.req_id = s.req_id '
+            f"WHERE s.updated_at < ? AND COALESCE(q.state, 'done') NOT IN ({', '.join('?' * len(ACTIVE_STATES))})",
+            (cutoff,) + ACTIVE_STATES
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def delete(self, req_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM job_queue WHERE req_id = ?', (req_id,))
+            conn.execute('DELETE FROM job_status WHERE req_id = ?', (req_id,))
+            conn.execute('DELETE FROM job_events WHERE req_id = ?', (req_id,))
+
+
+def _load_backend(spec):
+    if spec == 'sqlite':
+        return SqliteJobState()
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+_JOB_STATE = None
+_JOB_STATE_LOCK = threading.Lock()
+
+
+def get_job_state():
+    global _JOB_STATE
+    with _JOB_STATE_LOCK:
+        if _JOB_STATE is None:
+            _JOB_STATE = _load_backend(JOB_STATE_BACKEND)
+        return _JOB_STATE
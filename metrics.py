@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Histogram buckets (seconds) for stage timings
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Per-job breakdowns kept for /progress after a job ends
+MAX_JOB_BREAKDOWNS = 200
+METRIC_PREFIX = 'scraper_'
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metrics:
+    """Process-wide stage timings and counters, plus a breakdown per job.
+
+    Work is attributed to a job through bind_job(), which tags the current
+    thread; spans and counters recorded on that thread also land in the
+    job's breakdown. render() produces the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {}     # (name, label key) -> value
+        self._stages = {}       # label key (stage first) -> [bucket counts..., sum, count]
+        self._jobs = OrderedDict()
+
+    @contextmanager
+    def bind_job(self, req_id):
+        """Attribute everything recorded on this thread to req_id until the block exits."""
+        previous = getattr(self._local, 'req_id', None)
+        self._local.req_id = req_id
+        with self._lock:
+            job = self._jobs.get(req_id)
+            if job is None:
+                job = self._jobs[req_id] = {'started': time.time(), 'stages': {}, 'counters': {}, 'threads': 0}
+                while len(self._jobs) > MAX_JOB_BREAKDOWNS:
+                    self._jobs.popitem(last=False)
+            job['threads'] += 1
+            job['finished'] = None
+        try:
+            yield
+        finally:
+            self._local.req_id = previous
+            with self._lock:
+                job = self._jobs.get(req_id)
+                if job is not None:
+                    job['threads'] -= 1
+                    if not job['threads']:
+                        job['finished'] = time.time()
+
+    def _job(self):
+        req_id = getattr(self._local, 'req_id', None)
+        return self._jobs.get(req_id) if req_id is not None else None
+
+    def observe(self, stage, seconds, **labels):
+        key = (('stage', stage),) + _label_key(labels)
+        with self._lock:
+            entry = self._stages.get(key)
+            if entry is None:
+                entry = self._stages[key] = [0] * len(STAGE_BUCKETS) + [0.0, 0]
+            for index, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    entry[index] += 1
+            entry[-2] += seconds
+            entry[-1] += 1
+            job = self._job()
+            if job is not None:
+                timing = job['stages'].setdefault(stage, {'seconds': 0.0, 'count': 0})
+                timing['seconds'] += seconds
+                timing['count'] += 1
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time the block as one occurrence of stage (recorded even when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def count(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            job = self._job()
+            if job is not None:
+                job_key = name + _format_labels(key[1])
+                job['counters'][job_key] = job['counters'].get(job_key, 0) + value
+
+    def instrument_driver(self, driver):
+        """Count every WebDriver command the driver sends; element calls go through driver.execute too."""
+        execute = driver.execute
+
+        def counting_execute(driver_command, params=None):
+            self.count('webdriver_commands', command=driver_command)
+            return execute(driver_command, params)
+
+        driver.execute = counting_execute
+        return driver
+
+    def job_breakdown(self, req_id):
+        """Seconds and occurrences per stage for a job, slowest stage first, plus its counters."""
+        with self._lock:
+            job = self._jobs.get(req_id)
+            if job is None:
+                return None
+            end = job['finished'] or time.time()
+            stages = sorted(job['stages'].items(), key=lambda item: -item[1]['seconds'])
+            return {
+                'elapsed_seconds': round(end - job['started'], 2),
+                'stages': {stage: {'seconds': round(timing['seconds'], 3), 'count': timing['count']}
+                           for stage, timing in stages},
+                'counters': dict(job['counters']),
+            }
+
+    def snapshot(self):
+        """Stages and counters in JSON-safe form, for render() in another process."""
+        with self._lock:
+            return {
+                'stages': [[[list(pair) for pair in key], list(entry)] for key, entry in self._stages.items()],
+                'counters': [[name, [list(pair) for pair in key], value]
+                             for (name, key), value in self._counters.items()],
+            }
+
+    def render(self, gauges=None, snapshots=()):
+        """Prometheus text exposition of all stages and counters; gauges maps name -> value.
+
+        snapshots (from snapshot() in other processes) are added to this
+        process's own stages and counters.
+        """
+        lines = []
+        with self._lock:
+            stages = {key: list(entry) for key, entry in self._stages.items()}
+            counters = dict(self._counters)
+        for snapshot in snapshots:
+            for key, entry in snapshot.get('stages', ()):
+                key = tuple(tuple(pair) for pair in key)
+                total = stages.get(key)
+                stages[key] = entry if total is None else [a + b for a, b in zip(total, entry)]
+            for name, key, value in snapshot.get('counters', ()):
+                key = (name, tuple(tuple(pair) for pair in key))
+                counters[key] = counters.get(key, 0) + value
+        stages = sorted(stages.items())
+        counters = sorted(counters.items())
+        if stages:
+            name = f'{METRIC_PREFIX}stage_seconds'
+            lines.append(f'# HELP {name} Time spent in each scrape stage.')
+            lines.append(f'# TYPE {name} histogram')
+            for key, entry in stages:
+                for bound, bucket in zip(STAGE_BUCKETS, entry):
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", f"{bound:g}")])} {bucket}')
+                lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {entry[-1]}')
+                lines.append(f'{name}_sum{_format_labels(key)} {entry[-2]:.6f}')
+                lines.append(f'{name}_count{_format_labels(key)} {entry[-1]}')
+        typed = set()
+        for (counter, key), value in counters:
+            name = f'{METRIC_PREFIX}{counter}_total'
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_format_labels(key)} {value}')
+        for gauge, value in sorted((gauges or {}).items()):
+            if value is None:
+                continue
+            name = f'{METRIC_PREFIX}{gauge}'
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
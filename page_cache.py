@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+# On-disk cache of fetched listing HTML / extracted page rows
+PAGE_CACHE = os.environ.get('PAGE_CACHE', '1') == '1'
+PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', '.page_cache')
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 6 * 3600))
+PAGE_CACHE_MAX_MB = int(os.environ.get('PAGE_CACHE_MAX_MB', 200))
+
+TRACKING_PARAMS = ('utm_', 'gclid', 'fbclid', 'msclkid', '_ga')
+# Scanning the directory is O(entries), so only check the size budget every N writes
+EVICT_EVERY = 25
+
+
+def normalize_url(url):
+    """Canonical form for cache keys: lower-case host, sorted query, no tracking params or fragment."""
+    parts = urlparse(url.strip())
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    path = parts.path.rstrip('/') or '/'
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), path, '', urlencode(query), ''))
+
+
+class PageCache:
+    """Content-addressed page cache with a TTL and size-bounded LRU eviction.
+
+    Entries are gzip'd JSON files named by the hash of (kind, normalized URL).
+    A read touches the file's mtime, which is what LRU eviction orders by.
+    """
+
+    def __init__(self, directory=PAGE_CACHE_DIR, ttl=PAGE_CACHE_TTL, max_mb=PAGE_CACHE_MAX_MB):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, kind):
+        key = hashlib.sha256(f"{kind}|{normalize_url(url)}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, url, kind, max_age=None):
+        """Return the cached payload if it is younger than max_age (default: the TTL)."""
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        path = self._path(url, kind)
+        if max_age <= 0 or not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except Exception:
+            self.misses += 1
+            return None
+        if time.time() - entry.get('fetched_at', 0) > max_age:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry.get('payload')
+
+    def put(self, url, kind, payload):
+        path = self._path(url, kind)
+        entry = {'url': normalize_url(url), 'kind': kind, 'fetched_at': time.time(), 'payload': payload}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Page cache write failed: {e}")
+            return
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 1:
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            now = time.time()
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Expired entries can never be served, so drop them first
+                if now - stat.st_mtime > self.ttl * 2:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                self._remove(path)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """The shared page cache, or None when PAGE_CACHE=0."""
+    global _CACHE
+    if not PAGE_CACHE:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = PageCache()
+        return _CACHE
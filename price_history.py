@@ -0,0 +1,327 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from page_cache import normalize_url
+from result_store import RESULTS_DB, numeric_fields
+from product_ids import product_id
+
+# Incremental mode stops once this many pages in a row match the previous run (0 = never stop early).
+# The pages after the stop are copied from the previous run, so price changes, new listings and
+# removals on them go unrecorded until a full run; only opt in where the deep pages rarely change.
+INCREMENTAL_STOP_AFTER = int(os.environ.get('INCREMENTAL_STOP_AFTER', 0))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_fingerprints (
+    category TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    fingerprint TEXT,
+    links TEXT,
+    updated_at REAL,
+    PRIMARY KEY (category, page)
+);
+CREATE TABLE IF NOT EXISTS products (
+    category TEXT NOT NULL,
+    link TEXT NOT NULL,
+    row TEXT,
+    price_num REAL,
+    regular_num REAL,
+    discount_num REAL,
+    first_seen REAL,
+    last_seen REAL,
+    PRIMARY KEY (category, link)
+);
+CREATE TABLE IF NOT EXISTS price_history (
+    link TEXT NOT NULL,
+    recorded_at REAL,
+    req_id TEXT,
+    price TEXT,
+    price_num REAL,
+    regular_num REAL,
+    discount_num REAL
+);
+CREATE TABLE IF NOT EXISTS job_diffs (
+    req_id TEXT NOT NULL,
+    change TEXT NOT NULL,
+    link TEXT,
+    name TEXT,
+    old_price REAL,
+    new_price REAL
+);
+CREATE INDEX IF NOT EXISTS idx_history_link ON price_history (link, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_products_seen ON products (category, last_seen);
+CREATE INDEX IF NOT EXISTS idx_diffs_req ON job_diffs (req_id, change);
+"""
+
+DIFF_CHANGES = ('new', 'removed', 'price_changed')
+
+
+def product_key(row):
+    """Canonical product ID from the link, else the link itself, else the name."""
+    link = row.get('Image Link')
+    return product_id(link) or link or f"name:{row.get('Product Name')}"
+
+
+def page_fingerprint(rows):
+    """Order-independent hash of a page's products and their prices."""
+    digest = hashlib.sha1()
+    for line in sorted(
+        f"{product_key(row)}|{row.get('Regular Price')}|{row.get('Price After Discount')}|"
+        f"{row.get('Price Without Discount')}|{row.get('Discount %')}"
+        for row in rows
+    ):
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class PriceHistory:
+    """Per-category product state, append-only price history and per-job diffs (same SQLite file as the results)."""
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def previous_page(self, category, page):
+        row = self._connect().execute(
+            'SELECT fingerprint, links FROM page_fingerprints WHERE category = ? AND page = ?', (category, page)
+        ).fetchone()
+        return (row['fingerprint'], json.loads(row['links'])) if row else (None, [])
+
+    def save_page(self, category, page, fingerprint, links):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO page_fingerprints (category, page, fingerprint, links, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (category, page, fingerprint, json.dumps(links), time.time())
+            )
+
+    def drop_pages_after(self, category, page):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM page_fingerprints WHERE category = ? AND page > ?', (category, page))
+
+    def touch(self, category, links, seen_at):
+        """Mark products as still listed without re-diffing them."""
+        with self._connect() as conn:
+            conn.executemany(
+                'UPDATE products SET last_seen = ? WHERE category = ? AND link = ?',
+                [(seen_at, category, link) for link in links]
+            )
+
+    def record_rows(self, req_id, category, rows, seen_at):
+        """Upsert product state; append history and diff entries for new and re-priced products."""
+        conn = self._connect()
+        with conn:
+            for row in rows:
+                link = product_key(row)
+                price, regular, discount = numeric_fields(row)
+                previous = conn.execute(
+                    'SELECT price_num, regular_num FROM products WHERE category = ? AND link = ?', (category, link)
+                ).fetchone()
+                if previous is None:
+                    change = 'new'
+                elif (previous['price_num'], previous['regular_num']) != (price, regular):
+                    change = 'price_changed'
+                else:
+                    change = None
+
+                conn.execute(
+                    'INSERT INTO products (category, link, row, price_num, regular_num, discount_num, first_seen, last_seen) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (category, link) DO UPDATE SET row = excluded.row, price_num = excluded.price_num, '
+                    'regular_num = excluded.regular_num, discount_num = excluded.discount_num, last_seen = excluded.last_seen',
+                    (category, link, json.dumps(row), price, regular, discount, seen_at, seen_at)
+                )
+                if change is None:
+                    continue
+                conn.execute(
+                    'INSERT INTO price_history (link, recorded_at, req_id, price, price_num, regular_num, discount_num) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (link, seen_at, req_id,
+                     row.get('Price After Discount') or row.get('Price Without Discount') or row.get('Regular Price'),
+                     price, regular, discount)
+                )
+                conn.execute(
+                    'INSERT INTO job_diffs (req_id, change, link, name, old_price, new_price) VALUES (?, ?, ?, ?, ?, ?)',
+                    (req_id, change, link, row.get('Product Name'),
+                     previous['price_num'] if previous else None, price)
+                )
+
+    def product_rows(self, category, links):
+        """Last known rows for these links, in the given order."""
+        conn = self._connect()
+        rows = []
+        for link in links:
+            found = conn.execute(
+                'SELECT row FROM products WHERE category = ? AND link = ?', (category, link)
+            ).fetchone()
+            if found is not None:
+                rows.append(json.loads(found['row']))
+        return rows
+
+    def close_run(self, req_id, category, run_started):
+        """Products not seen since run_started have been delisted: record them and forget their state."""
+        conn = self._connect()
+        with conn:
+            gone = conn.execute(
+                'SELECT link, row, price_num FROM products WHERE category = ? AND last_seen < ?', (category, run_started)
+            ).fetchall()
+            conn.executemany(
+                'INSERT INTO job_diffs (req_id, change, link, name, old_price, new_price) VALUES (?, ?, ?, ?, ?, NULL)',
+                [(req_id, 'removed', row['link'], json.loads(row['row']).get('Product Name'), row['price_num'])
+                 for row in gone]
+            )
+            conn.execute('DELETE FROM products WHERE category = ? AND last_seen < ?', (category, run_started))
+
+    def clear_diff(self, req_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM job_diffs WHERE req_id = ?', (req_id,))
+
+    def diff(self, req_id, change=None):
+        conn = self._connect()
+        summary = {name: 0 for name in DIFF_CHANGES}
+        for row in conn.execute('SELECT change, COUNT(*) FROM job_diffs WHERE req_id = ? GROUP BY change', (req_id,)):
+            summary[row[0]] = row[1]
+        sql = 'SELECT change, link, name, old_price, new_price FROM job_diffs WHERE req_id = ?'
+        params = [req_id]
+        if change:
+            sql += ' AND change = ?'
+            params.append(change)
+        return {'summary': summary, 'items': [dict(row) for row in conn.execute(sql + ' ORDER BY change, name', params)]}
+
+    def history(self, link, limit=100):
+        key = product_key({'Image Link': link})
+        return [dict(row) for row in self._connect().execute(
+            'SELECT recorded_at, req_id, price, price_num, regular_num, discount_num FROM price_history '
+            'WHERE link = ? ORDER BY recorded_at DESC LIMIT ?', (key, limit)
+        )]
+
+
+class DeltaRun:
+    """Incremental bookkeeping for one job.
+
+    Rows are collected as they are emitted and fingerprinted when their page
+    finishes. A page that matches the previous run is only touched, not
+    re-diffed. With INCREMENTAL_STOP_AFTER set, after that many such pages in
+    a row page_done() says the scrape can stop and carry_forward() supplies
+    the remaining pages from the previous run, unverified; finish() reports
+    how many rows were carried and after which page.
+
+    Between hold() and commit() the history writes are queued instead, so a
+    tier that gives up partway (discard()) leaves no diffs or fingerprints
+    behind for the next tier to match against.
+    """
+
+    def __init__(self, history, req_id, url, stop_after=INCREMENTAL_STOP_AFTER, resume=False):
+        self.history = history
+        self.req_id = req_id
+        self.category = normalize_url(url)
+        self.stop_after = stop_after
+        self.started = time.time()
+        self.last_page = 0
+        self.unchanged_streak = 0
+        self.unchanged_pages = 0
+        self.carried = 0
+        self._page_rows = []
+        self._held = None
+        if not resume:
+            history.clear_diff(req_id)
+
+    def _write(self, method, *args):
+        if self._held is None:
+            method(*args)
+        else:
+            self._held.append((method, args))
+
+    def hold(self):
+        """Queue history writes until commit() or discard()."""
+        self._held = []
+
+    def commit(self):
+        held, self._held = self._held, None
+        for method, args in held or ():
+            method(*args)
+
+    def discard(self):
+        """Forget the pages seen since hold(), as if the run started over."""
+        self._held = None
+        self._page_rows = []
+        self.last_page = 0
+        self.unchanged_streak = 0
+        self.unchanged_pages = 0
+
+    def restore(self, rows):
+        """Rows an interrupted attempt already diffed: keep them listed without diffing them again."""
+        self.history.touch(self.category, [product_key(row) for row in rows], time.time())
+
+    def add_rows(self, rows):
+        self._page_rows.extend(rows)
+
+    def page_done(self, page):
+        """Fingerprint the page just finished; True when the rest of the category can be skipped."""
+        rows, self._page_rows = self._page_rows, []
+        fingerprint = page_fingerprint(rows)
+        links = [product_key(row) for row in rows]
+        previous, _ = self.history.previous_page(self.category, page)
+        self.last_page = page
+        if rows and fingerprint == previous:
+            self.unchanged_streak += 1
+            self.unchanged_pages += 1
+            self._write(self.history.touch, self.category, links, time.time())
+        else:
+            self.unchanged_streak = 0
+            self._write(self.history.record_rows, self.req_id, self.category, rows, time.time())
+            self._write(self.history.save_page, self.category, page, fingerprint, links)
+        return bool(self.stop_after) and self.unchanged_streak >= self.stop_after
+
+    def carry_forward(self):
+        """Rows of the pages after the last one scraped, as the previous run saw them."""
+        rows = []
+        page = self.last_page + 1
+        while True:
+            fingerprint, links = self.history.previous_page(self.category, page)
+            if fingerprint is None:
+                break
+            page_rows = self.history.product_rows(self.category, links)
+            self.history.touch(self.category, links, time.time())
+            rows.extend(page_rows)
+            page += 1
+        self.carried = len(rows)
+        return rows
+
+    def finish(self, stopped_early=False):
+        if not stopped_early:
+            # The category may have shrunk since the last run
+            self.history.drop_pages_after(self.category, self.last_page)
+        self.history.close_run(self.req_id, self.category, self.started)
+        summary = self.history.diff(self.req_id)['summary']
+        summary.update(unchanged_pages=self.unchanged_pages, carried_rows=self.carried,
+                       carried_after_page=self.last_page if stopped_early else None)
+        return summary
+
+
+_HISTORY = None
+_HISTORY_LOCK = threading.Lock()
+
+
+def get_history():
+    global _HISTORY
+    with _HISTORY_LOCK:
+        if _HISTORY is None:
+            _HISTORY = PriceHistory()
+        return _HISTORY
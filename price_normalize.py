@@ -0,0 +1,61 @@
+# pandas is imported on first use: only scrape workers normalize rows, and it's slow to load
+
+# Scraped text columns the typed ones are derived from; they are kept as-is for auditing
+PRICE_TEXT_COLUMNS = ['Regular Price', 'Price After Discount', 'Price Without Discount', 'Discount %']
+# Typed columns added to every row
+PRICE_COLUMNS = ['Price', 'Original Price', 'Discount Amount', 'Discount Percent']
+
+DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹٫٬', '01234567890123456789.,')
+NUMBER = r'(\d+(?:\.\d+)?)'
+
+
+def _clean(series):
+    """Text with Western digits and no thousands separators."""
+    return (series.fillna('').astype(str)
+            .str.translate(DIGITS)
+            .str.replace(r'(?<=\d),(?=\d{3}\b)', '', regex=True))
+
+
+def _number(pd, series, pattern=NUMBER):
+    return pd.to_numeric(series.str.extract(pattern, expand=False), errors='coerce').astype(float)
+
+
+def normalize_prices(rows):
+    """Return the rows with typed price columns, parsed for the whole batch at once.
+
+    Price is what the product sells for now, Original Price the list price
+    (equal to Price when there is no discount). The discount comes from the
+    two prices when both are shown, otherwise from the badge ("Save 15%",
+    "Save SAR 5").
+    """
+    if not rows:
+        return rows
+    import pandas as pd
+    frame = pd.DataFrame.from_records(rows)
+    # Al-Dawaa rows have no 'Price Without Discount'; don't add columns a source never had
+    text = {
+        column: _clean(frame[column]) if column in frame else pd.Series('', index=frame.index)
+        for column in PRICE_TEXT_COLUMNS
+    }
+
+    after = _number(pd, text['Price After Discount'])
+    regular = _number(pd, text['Regular Price'])
+    without = _number(pd, text['Price Without Discount'])
+    badge = text['Discount %']
+    badge_percent = _number(pd, badge, NUMBER + r'\s*%')
+    badge_amount = _number(pd, badge.str.replace(NUMBER + r'\s*%', ' ', regex=True))
+
+    price = after.fillna(without).fillna(regular)
+    original = regular.where(regular >= price, price)
+    amount = (original - price).where(original > price)
+    # A badge with an amount but no list price implies one
+    amount = amount.fillna(badge_amount.where(original == price))
+    original = original.where(~(amount.notna() & (original == price)), price + amount)
+    percent = badge_percent.fillna(amount * 100 / original)
+
+    frame['Price'] = price.round(2)
+    frame['Original Price'] = original.round(2)
+    frame['Discount Amount'] = amount.round(2)
+    frame['Discount Percent'] = percent.round(1)
+    # NaN -> None so rows serialize to JSON/SQLite/CSV cleanly
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
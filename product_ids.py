@@ -0,0 +1,20 @@
+import re
+from urllib.parse import urlparse
+
+# Pure helpers shared by the scrapers and the web side (price history), kept free of selenium
+PRODUCT_ID_RE = re.compile(r'/(?:pdp|p)/([^/]+)')
+
+
+def product_id(link):
+    """Canonical SKU from a product URL (Nahdi .../pdp/<sku>, Al-Dawaa .../p/<sku>), or None."""
+    if not link:
+        return None
+    match = PRODUCT_ID_RE.search(urlparse(link).path)
+    return match.group(1).lower() if match else None
+
+
+def product_identity(product):
+    # Name + prices only for cards without a usable link
+    return product_id(product.get("Image Link")) or (
+        product.get("Product Name"), product.get("Price After Discount"), product.get("Regular Price")
+    )
@@ -0,0 +1,313 @@
+import gzip
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from result_store import numeric_fields
+
+# Built indexes are kept here so a catalog is only tokenized once
+MATCH_INDEX_DIR = os.environ.get('MATCH_INDEX_DIR', '.match_index')
+# Minimum cosine similarity (IDF-weighted tokens) for a pair to count as the same product
+MATCH_THRESHOLD = float(os.environ.get('MATCH_THRESHOLD', 0.55))
+# Tokens in more than this share of the catalog are scored but never used to find candidates
+BLOCKING_MAX_DF = 0.05
+INDEX_VERSION = 1
+
+ARABIC_DIACRITICS = re.compile(r'[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTERS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ى': 'ي', 'ة': 'ه', 'ؤ': 'و', 'ئ': 'ي',
+    # Arabic-Indic and Persian digits
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4', '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4', '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+    '٫': '.', '،': ' ',
+})
+
+# Unit spelling -> (dimension, canonical unit, multiplier)
+UNITS = {
+    'ml': ('volume', 'ml', 1), 'mls': ('volume', 'ml', 1), 'مل': ('volume', 'ml', 1), 'ملل': ('volume', 'ml', 1),
+    'l': ('volume', 'ml', 1000), 'ltr': ('volume', 'ml', 1000), 'liter': ('volume', 'ml', 1000),
+    'litre': ('volume', 'ml', 1000), 'لتر': ('volume', 'ml', 1000),
+    'mg': ('strength', 'mg', 1), 'ملغ': ('strength', 'mg', 1), 'مجم': ('strength', 'mg', 1),
+    'mcg': ('strength', 'mg', 0.001), 'g': ('weight', 'g', 1), 'gm': ('weight', 'g', 1), 'gr': ('weight', 'g', 1),
+    'gram': ('weight', 'g', 1), 'grams': ('weight', 'g', 1), 'جم': ('weight', 'g', 1), 'غ': ('weight', 'g', 1),
+    'غرام': ('weight', 'g', 1), 'جرام': ('weight', 'g', 1), 'kg': ('weight', 'g', 1000), 'كغ': ('weight', 'g', 1000),
+    'iu': ('units', 'iu', 1), 'oz': ('volume', 'ml', 29.57),
+    'tab': ('count', 'pcs', 1), 'tabs': ('count', 'pcs', 1), 'tablet': ('count', 'pcs', 1),
+    'tablets': ('count', 'pcs', 1), 'cap': ('count', 'pcs', 1), 'caps': ('count', 'pcs', 1),
+    'capsule': ('count', 'pcs', 1), 'capsules': ('count', 'pcs', 1), 'softgels': ('count', 'pcs', 1),
+    'pcs': ('count', 'pcs', 1), 'pieces': ('count', 'pcs', 1), 'piece': ('count', 'pcs', 1),
+    'sachets': ('count', 'pcs', 1), 'sachet': ('count', 'pcs', 1), 'pack': ('count', 'pcs', 1),
+    "'s": ('count', 'pcs', 1), 's': ('count', 'pcs', 1),
+    'قرص': ('count', 'pcs', 1), 'اقراص': ('count', 'pcs', 1), 'حبه': ('count', 'pcs', 1),
+    'حبات': ('count', 'pcs', 1), 'كبسوله': ('count', 'pcs', 1), 'كبسولات': ('count', 'pcs', 1),
+    'كيس': ('count', 'pcs', 1), 'اكياس': ('count', 'pcs', 1),
+}
+SIZE_RE = re.compile(
+    r"(\d+(?:\.\d+)?)\s*(" + '|'.join(sorted((re.escape(unit) for unit in UNITS), key=len, reverse=True)) +
+    r")(?![a-z\u0600-\u06ff])"
+)
+# "x 30", "pack of 24"
+COUNT_RE = re.compile(r"(?:\bx\s*|pack of\s*)(\d+)\b")
+
+# Arabic and English words that name the same thing, folded to one token
+SYNONYMS = {
+    'بنادول': 'panadol', 'فيتامين': 'vitamin', 'شامبو': 'shampoo', 'كريم': 'cream', 'غسول': 'wash',
+    'شراب': 'syrup', 'بلسم': 'conditioner', 'مرطب': 'moisturizer', 'لوشن': 'lotion', 'جل': 'gel',
+    'اطفال': 'kids', 'للاطفال': 'kids', 'children': 'kids', 'child': 'kids', 'baby': 'kids',
+    'ممتد': 'extra', 'اكسترا': 'extra', 'moisturiser': 'moisturizer', 'colour': 'color',
+}
+STOP_WORDS = {
+    'the', 'and', 'for', 'with', 'of', 'in', 'a', 'an', 'to', 'by', 'new', 'offer', 'sale', 'free',
+    'pack', 'piece', 'pcs', 'size', 'from', 'و', 'مع', 'من', 'في', 'ل', 'عرض',
+    # Dosage forms are spelled too many ways to help matching; the pack size carries the signal
+    'tab', 'tablet', 'cap', 'capsule', 'softgel', 'sachet', 'قرص', 'اقراص', 'حبه', 'كبسوله',
+}
+TOKEN_RE = re.compile(r"[a-z0-9\u0600-\u06ff]+")
+
+
+def normalize_text(text):
+    text = ARABIC_DIACRITICS.sub('', str(text or '').lower()).translate(ARABIC_LETTERS)
+    return text.replace('&', ' and ')
+
+
+def extract_sizes(text):
+    """{dimension: value} for pack sizes and strengths in already-normalized text."""
+    sizes = {}
+    for number, unit in SIZE_RE.findall(text):
+        dimension, _, multiplier = UNITS[unit]
+        sizes.setdefault(dimension, round(float(number) * multiplier, 3))
+    for number in COUNT_RE.findall(text):
+        sizes.setdefault('count', float(number))
+    return sizes
+
+
+def name_tokens(text):
+    """Brand/product words of a normalized name, with sizes removed and synonyms folded."""
+    text = COUNT_RE.sub(' ', SIZE_RE.sub(' ', text))
+    tokens = []
+    for token in TOKEN_RE.findall(text):
+        # Arabic definite article
+        if token.startswith('ال') and len(token) > 4:
+            token = token[2:]
+        token = SYNONYMS.get(token, token)
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        if token in STOP_WORDS or len(token) < 2:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def sizes_conflict(left, right):
+    """Both name a size in the same dimension and they differ (1% tolerance)."""
+    for dimension, value in left.items():
+        other = right.get(dimension)
+        if other is not None and abs(value - other) > 0.01 * max(value, other):
+            return True
+    return False
+
+
+class MatchIndex:
+    """Inverted index (token -> products) over one catalog, with IDF weights.
+
+    Candidates for a query product come only from the postings of its rarer
+    tokens, so matching is roughly linear in catalog size instead of a full
+    pairwise compare.
+    """
+
+    def __init__(self, products):
+        self.products = products   # [{'name', 'price', 'link', 'source', 'tokens', 'sizes'}]
+        self.postings = {}
+        for position, product in enumerate(products):
+            for token in set(product['tokens']):
+                self.postings.setdefault(token, []).append(position)
+        total = max(1, len(products))
+        self.idf = {token: math.log(1 + total / len(positions)) for token, positions in self.postings.items()}
+        self.max_postings = max(20, int(total * BLOCKING_MAX_DF))
+        self.token_sets = [set(product['tokens']) for product in products]
+        self.norms = [self._norm(tokens) for tokens in self.token_sets]
+
+    @classmethod
+    def from_rows(cls, rows):
+        products = []
+        for row in rows:
+            name = normalize_text(row.get('Product Name'))
+            products.append({
+                'name': row.get('Product Name'),
+                'price': numeric_fields(row)[0],
+                'link': row.get('Image Link'),
+                'source': row.get('Source'),
+                'tokens': name_tokens(name),
+                'sizes': extract_sizes(name),
+            })
+        return cls(products)
+
+    def _norm(self, tokens):
+        return math.sqrt(sum(self.idf.get(token, 0.0) ** 2 for token in tokens)) or 1.0
+
+    def candidates(self, tokens, sizes, limit=3):
+        """Best (score, position) pairs for a tokenized query product."""
+        query = set(tokens)
+        query_norm = math.sqrt(sum(self.idf.get(token, math.log(1 + len(self.products))) ** 2 for token in query)) or 1.0
+        overlap = {}
+        for token in query:
+            positions = self.postings.get(token)
+            if positions and len(positions) <= self.max_postings:
+                for position in positions:
+                    overlap[position] = 0.0
+        if not overlap:
+            return []
+        for position in overlap:
+            overlap[position] = sum(self.idf[token] ** 2 for token in query & self.token_sets[position])
+        scored = []
+        for position, dot in overlap.items():
+            if sizes and sizes_conflict(sizes, self.products[position]['sizes']):
+                continue
+            scored.append((dot / (query_norm * self.norms[position]), position))
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+    def to_json(self):
+        return {'version': INDEX_VERSION, 'products': self.products}
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            return None
+        return cls(data['products'])
+
+
+def match_catalogs(left_index, right_index, threshold=MATCH_THRESHOLD):
+    """One-to-one (score, left, right) matches between two indexed catalogs, best scores first."""
+    left = left_index.products
+    pairs = []
+    for left_position, product in enumerate(left):
+        for score, right_position in right_index.candidates(product['tokens'], product['sizes']):
+            if score >= threshold:
+                pairs.append((score, left_position, right_position))
+    pairs.sort(reverse=True)
+
+    used_left, used_right = set(), set()
+    matches = []
+    for score, left_position, right_position in pairs:
+        if left_position in used_left or right_position in used_right:
+            continue
+        used_left.add(left_position)
+        used_right.add(right_position)
+        matches.append((round(score, 3), left[left_position], right_index.products[right_position]))
+    return matches
+
+
+def comparison_rows(matches):
+    """Comparison table: both listings side by side with the cheaper source and the price gap."""
+    rows = []
+    for score, left, right in matches:
+        left_price, right_price = left['price'], right['price']
+        cheaper = delta = delta_percent = None
+        if left_price is not None and right_price is not None:
+            delta = round(abs(left_price - right_price), 2)
+            if left_price != right_price:
+                cheaper = left['source'] if left_price < right_price else right['source']
+                delta_percent = round(delta * 100 / max(left_price, right_price), 1)
+            else:
+                cheaper = 'Same'
+        rows.append({
+            'Product': left['name'],
+            'Matched Product': right['name'],
+            'Source': left['source'],
+            'Price': left_price,
+            'Matched Source': right['source'],
+            'Matched Price': right_price,
+            'Cheaper At': cheaper,
+            'Price Delta': delta,
+            'Delta %': delta_percent,
+            'Match Score': score,
+            'Link': left['link'],
+            'Matched Link': right['link'],
+        })
+    return rows
+
+
+class IndexCache:
+    """Match indexes per scrape job, in memory and on disk, rebuilt when the job's row count changes."""
+
+    def __init__(self, directory=MATCH_INDEX_DIR, keep=8):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._indexes = {}   # (req_id, row_count) -> (last_used, MatchIndex)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, req_id, row_count):
+        return os.path.join(self.directory, f"{self._file_prefix(req_id)}-{row_count}.json.gz")
+
+    @staticmethod
+    def _file_prefix(req_id):
+        return re.sub(r'[^A-Za-z0-9_-]', '_', req_id)
+
+    def forget(self, req_id):
+        """Drop a job's indexes from memory and disk (the job was deleted)."""
+        with self._lock:
+            for key in [key for key in self._indexes if key[0] == req_id]:
+                del self._indexes[key]
+        prefix = self._file_prefix(req_id) + '-'
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.json.gz'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def get(self, req_id, row_count, rows_factory):
+        key = (req_id, row_count)
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached is not None:
+                self._indexes[key] = (time.time(), cached[1])
+                return cached[1]
+
+        path = self._path(req_id, row_count)
+        index = None
+        if os.path.exists(path):
+            try:
+                index = MatchIndex.load(path)
+            except Exception as e:
+                print(f"Could not load match index {path}: {e}")
+        if index is None:
+            started = time.time()
+            index = MatchIndex.from_rows(rows_factory())
+            print(f"Built match index for {req_id}: {len(index.products)} products in {time.time() - started:.2f}s")
+            try:
+                index.save(path)
+            except Exception as e:
+                print(f"Could not save match index {path}: {e}")
+
+        with self._lock:
+            self._indexes[key] = (time.time(), index)
+            if len(self._indexes) > self.keep:
+                oldest = min(self._indexes, key=lambda k: self._indexes[k][0])
+                del self._indexes[oldest]
+        return index
+
+
+_INDEX_CACHE = None
+_INDEX_CACHE_LOCK = threading.Lock()
+
+
+def get_index_cache():
+    global _INDEX_CACHE
+    with _INDEX_CACHE_LOCK:
+        if _INDEX_CACHE is None:
+            _INDEX_CACHE = IndexCache()
+        return _INDEX_CACHE
@@ -0,0 +1,311 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from metrics import METRICS
+
+# Scraped rows live here (indexed per job) instead of being re-read from CSV
+RESULTS_DB = os.environ.get('RESULTS_DB', 'sws_results.db')
+MAX_PER_PAGE = 500
+
+# Output column -> rows table column
+ROW_COLUMNS = {
+    'No.': 'no',
+    'Product Name': 'name',
+    'Regular Price': 'regular_price',
+    'Price After Discount': 'price_after_discount',
+    'Price Without Discount': 'price_without_discount',
+    'Discount %': 'discount',
+    'Category': 'category',
+    'Image Link': 'link',
+    'Source': 'source',
+}
+# Typed price columns (see price_normalize) -> rows table column
+PRICE_COLUMNS = {
+    'Price': 'price_num',
+    'Original Price': 'regular_num',
+    'Discount Amount': 'discount_amount',
+    'Discount Percent': 'discount_num',
+}
+
+# API sort keys -> SQL expressions
+SORT_KEYS = {
+    'no': 'no',
+    'name': 'name COLLATE NOCASE',
+    'price': 'price_num',
+    'regular_price': 'regular_num',
+    'discount': 'discount_num',
+    'discount_amount': 'discount_amount',
+    'source': 'source',
+    'category': 'category',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    req_id TEXT PRIMARY KEY,
+    url TEXT,
+    filename TEXT,
+    columns TEXT,
+    created_at REAL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    req_id TEXT NOT NULL,
+    no INTEGER NOT NULL,
+    name TEXT,
+    regular_price TEXT,
+    price_after_discount TEXT,
+    price_without_discount TEXT,
+    discount TEXT,
+    category TEXT,
+    link TEXT,
+    source TEXT,
+    price_num REAL,
+    regular_num REAL,
+    discount_num REAL,
+    discount_amount REAL,
+    PRIMARY KEY (req_id, no)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    req_id TEXT PRIMARY KEY,
+    status TEXT,
+    tier TEXT,
+    page INTEGER DEFAULT 0,
+    count INTEGER DEFAULT 0,
+    options TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_rows_source ON rows (req_id, source);
+CREATE INDEX IF NOT EXISTS idx_rows_category ON rows (req_id, category);
+CREATE INDEX IF NOT EXISTS idx_rows_price ON rows (req_id, price_num);
+CREATE INDEX IF NOT EXISTS idx_rows_discount ON rows (req_id, discount_num);
+"""
+
+
+def _first_number(text):
+    if not text:
+        return None
+    match = re.search(r'\d+(?:[.,]\d+)?', str(text).replace(',', ''))
+    return float(match.group(0)) if match else None
+
+
+def numeric_fields(row):
+    """Effective price, list price and discount percent used for sorting and filtering.
+
+    Rows from the scrapers already carry them as typed columns; the text is
+    only parsed for rows stored before those existed.
+    """
+    if 'Price' in row:
+        return row['Price'], row['Original Price'], row['Discount Percent']
+    regular = _first_number(row.get('Regular Price'))
+    price = (_first_number(row.get('Price After Discount'))
+             or _first_number(row.get('Price Without Discount'))
+             or regular)
+    discount = None
+    percent = re.search(r'(\d+(?:\.\d+)?)\s*%', str(row.get('Discount %') or ''))
+    if percent:
+        discount = float(percent.group(1))
+    elif regular and price and regular > price:
+        discount = round((regular - price) * 100 / regular, 1)
+    return price, regular, discount
+
+
+def _row_dict(row):
+    values = {column: row[field] for column, field in ROW_COLUMNS.items()}
+    values.update((column, row[field]) for column, field in PRICE_COLUMNS.items())
+    return values
+
+
+class ResultStore:
+    """SQLite store of scraped rows keyed by job, with paginated queries."""
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Databases created before the typed price columns
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(rows)')}
+            if 'discount_amount' not in columns:
+                conn.execute('ALTER TABLE rows ADD COLUMN discount_amount REAL')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create_job(self, req_id, url, filename):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (req_id, url, filename, columns, created_at) VALUES (?, ?, ?, ?, ?)',
+                (req_id, url, filename, None, time.time())
+            )
+            conn.execute('DELETE FROM rows WHERE req_id = ?', (req_id,))
+
+    def clear_rows(self, req_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM rows WHERE req_id = ?', (req_id,))
+            conn.execute('UPDATE jobs SET columns = NULL WHERE req_id = ?', (req_id,))
+
+    def add_rows(self, req_id, rows):
+        """Insert numbered rows (each must carry 'No.')."""
+        if not rows:
+            return
+        values = []
+        for row in rows:
+            price, regular, discount = numeric_fields(row)
+            values.append(
+                (req_id,) + tuple(row.get(key) for key in ROW_COLUMNS)
+                + (price, regular, discount, row.get('Discount Amount'))
+            )
+        with METRICS.span('store_write'), self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET columns = ? WHERE req_id = ? AND columns IS NULL',
+                (json.dumps(list(rows[0].keys())), req_id)
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO rows (req_id, no, name, regular_price, price_after_discount, '
+                'price_without_discount, discount, category, link, source, price_num, regular_num, discount_num, '
+                'discount_amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                values
+            )
+
+    def job(self, req_id):
+        row = self._connect().execute('SELECT * FROM jobs WHERE req_id = ?', (req_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['columns'] = json.loads(job['columns']) if job['columns'] else []
+        return job
+
+    def truncate_rows(self, req_id, count):
+        """Drop rows numbered past count (written after the last checkpoint)."""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM rows WHERE req_id = ? AND no > ?', (req_id, count))
+
+    def delete_job(self, req_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM rows WHERE req_id = ?', (req_id,))
+            conn.execute('DELETE FROM jobs WHERE req_id = ?', (req_id,))
+            conn.execute('DELETE FROM checkpoints WHERE req_id = ?', (req_id,))
+
+    def jobs_updated_before(self, cutoff):
+        """Jobs created, and last checkpointed, before cutoff (a timestamp)."""
+        rows = self._connect().execute(
+            'SELECT j.req_id FROM jobs j LEFT JOIN checkpoints c ON c.req_id = j.req_id '
+            'WHERE MAX(j.created_at, COALESCE(c.updated_at, 0)) < ?', (cutoff,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def save_checkpoint(self, req_id, **fields):
+        """Upsert a job's resume point: status, tier, page (last finished), count, options, error."""
+        if 'options' in fields:
+            fields['options'] = json.dumps(fields['options'])
+        fields['updated_at'] = time.time()
+        columns = ', '.join(fields)
+        updates = ', '.join(f'{column} = excluded.{column}' for column in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f'INSERT INTO checkpoints (req_id, {columns}) VALUES (?{", ?" * len(fields)}) '
+                f'ON CONFLICT (req_id) DO UPDATE SET {updates}',
+                (req_id,) + tuple(fields.values())
+            )
+
+    def checkpoint(self, req_id):
+        row = self._connect().execute('SELECT * FROM checkpoints WHERE req_id = ?', (req_id,)).fetchone()
+        if row is None:
+            return None
+        checkpoint = dict(row)
+        checkpoint['options'] = json.loads(checkpoint['options']) if checkpoint['options'] else {}
+        return checkpoint
+
+    def _where(self, req_id, filters):
+        clauses = ['req_id = ?']
+        params = [req_id]
+        if filters.get('source'):
+            clauses.append('source = ?')
+            params.append(filters['source'])
+        if filters.get('category'):
+            clauses.append('category = ?')
+            params.append(filters['category'])
+        if filters.get('min_price') is not None:
+            clauses.append('price_num >= ?')
+            params.append(filters['min_price'])
+        if filters.get('max_price') is not None:
+            clauses.append('price_num <= ?')
+            params.append(filters['max_price'])
+        if filters.get('min_discount') is not None:
+            clauses.append('discount_num >= ?')
+            params.append(filters['min_discount'])
+        if filters.get('discounted'):
+            clauses.append('discount_num > 0')
+        if filters.get('q'):
+            clauses.append('name LIKE ?')
+            params.append(f"%{filters['q']}%")
+        return ' AND '.join(clauses), params
+
+    def query(self, req_id, page=1, per_page=50, sort='no', order='asc', **filters):
+        """Return one page of rows (as output-column dicts) plus the filtered total."""
+        per_page = max(1, min(per_page, MAX_PER_PAGE))
+        page = max(1, page)
+        sort_sql = SORT_KEYS.get(sort, 'no')
+        direction = 'DESC' if str(order).lower() == 'desc' else 'ASC'
+        where, params = self._where(req_id, filters)
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM rows WHERE {where}', params).fetchone()[0]
+        # NULL prices/discounts sort last either way
+        cursor = conn.execute(
+            f'SELECT * FROM rows WHERE {where} '
+            f'ORDER BY ({sort_sql}) IS NULL, {sort_sql} {direction}, no ASC LIMIT ? OFFSET ?',
+            params + [per_page, (page - 1) * per_page]
+        )
+        rows = [_row_dict(row) for row in cursor]
+        return {'total': total, 'page': page, 'per_page': per_page, 'rows': rows}
+
+    def row_count(self, req_id):
+        return self._connect().execute('SELECT COUNT(*) FROM rows WHERE req_id = ?', (req_id,)).fetchone()[0]
+
+    def facets(self, req_id):
+        conn = self._connect()
+        return {
+            'sources': [r[0] for r in conn.execute(
+                'SELECT DISTINCT source FROM rows WHERE req_id = ? AND source IS NOT NULL ORDER BY source', (req_id,))],
+            'categories': [r[0] for r in conn.execute(
+                'SELECT DISTINCT category FROM rows WHERE req_id = ? AND category IS NOT NULL ORDER BY category', (req_id,))],
+        }
+
+    def iter_rows(self, req_id, batch_size=1000):
+        """Yield a job's rows in 'No.' order without loading them all at once."""
+        last_no = 0
+        conn = self._connect()
+        while True:
+            batch = conn.execute(
+                'SELECT * FROM rows WHERE req_id = ? AND no > ? ORDER BY no LIMIT ?',
+                (req_id, last_no, batch_size)
+            ).fetchall()
+            if not batch:
+                return
+            for row in batch:
+                yield _row_dict(row)
+            last_no = batch[-1]['no']
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ResultStore()
+        return _STORE
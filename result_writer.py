@@ -0,0 +1,56 @@
+import csv
+import os
+import threading
+
+from metrics import METRICS
+
+
+class CsvRowWriter:
+    """Appends scraped rows to a CSV as they arrive, numbering them with 'No.'.
+
+    The file is flushed after every batch so /download can serve it while
+    the job is still running. Columns come from the first row written.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.filename, 'w', newline='', encoding='utf-8-sig')
+        self._writer = None
+        self.count = 0
+
+    def write_rows(self, rows):
+        """Append rows and return them with their 'No.' assigned."""
+        numbered_rows = []
+        with self._lock, METRICS.span('csv_write'):
+            for row in rows:
+                if self._writer is None:
+                    columns = ['No.'] + [key for key in row if key != 'No.']
+                    self._writer = csv.DictWriter(self._file, fieldnames=columns, restval='', extrasaction='ignore')
+                    self._writer.writeheader()
+                self.count += 1
+                numbered = {'No.': self.count}
+                numbered.update(row)
+                self._writer.writerow(numbered)
+                numbered_rows.append(numbered)
+            self._file.flush()
+        return numbered_rows
+
+    def reset(self):
+        """Throw away everything written so far (e.g. before a fallback re-scrape)."""
+        with self._lock:
+            self._file.close()
+            self._open()
+
+    def close(self, remove_if_empty=False):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+            if remove_if_empty and self.count == 0 and os.path.exists(self.filename):
+                os.remove(self.filename)
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+
+from job_state import get_job_state, worker_id, ACTIVE_STATES
+from metrics import METRICS
+
+# Bounded job execution: each scrape worker process runs this many jobs at a time
+SCRAPE_WORKERS = max(1, int(os.environ.get('SCRAPE_WORKERS', 1)))
+# Free memory a new job needs before it may start (one more Chrome)
+BROWSER_RESERVE_MB = int(os.environ.get('BROWSER_RESERVE_MB', 350))
+DEFAULT_PRIORITY = 10
+# Used for start estimates until some jobs have finished
+DEFAULT_JOB_SECONDS = 120
+# How often an idle worker thread looks for queued jobs
+SCHEDULER_POLL_SECONDS = float(os.environ.get('SCHEDULER_POLL_SECONDS', 1))
+
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo, or None where it can't be read."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.0
+    except Exception:
+        pass
+    return None
+
+
+class JobScheduler:
+    """Queues jobs in the shared job state and runs them on a bounded set of worker threads.
+
+    submit(), cancel() and queue_info() work from any process, so the web
+    workers only enqueue; start() runs worker threads in a scrape worker
+    process, each claiming the next queued job. Lower priority numbers run
+    first; equal priorities run FIFO. A worker only claims a job when there
+    is memory headroom for another browser, unless its process runs nothing.
+    """
+
+    def __init__(self, workers=SCRAPE_WORKERS, reserve_mb=BROWSER_RESERVE_MB):
+        self.workers = workers
+        self.reserve_mb = reserve_mb
+        self.worker_id = worker_id()
+        self._lock = threading.Lock()
+        self._tasks = {}         # task name -> function, in a process running jobs
+        self._running = set()    # jobs running in this process
+        self._threads = []
+
+    def start(self, tasks):
+        """Run queued jobs in this process; tasks maps each task name to its function."""
+        with self._lock:
+            if self._threads:
+                return
+            self._tasks = dict(tasks)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"scrape-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, req_id, task, args=(), priority=DEFAULT_PRIORITY):
+        """Queue task (a name from the worker's task table) with JSON-serialisable args."""
+        get_job_state().enqueue(req_id, task, args, priority)
+
+    def cancel(self, req_id):
+        """Drop a queued job or ask a running one to stop. Returns the new state or None."""
+        return get_job_state().cancel(req_id)
+
+    def is_cancelled(self, req_id):
+        job = get_job_state().job(req_id)
+        return job is not None and job['state'] in ('cancelling', 'cancelled')
+
+    def is_active(self, req_id):
+        job = get_job_state().job(req_id)
+        return job is not None and job['state'] in ACTIVE_STATES
+
+    def capacity(self):
+        """Jobs the live scrape workers can run at once."""
+        workers = get_job_state().workers()
+        return sum(info.get('threads', 0) for info in workers.values()) or self.workers
+
+    def queue_info(self, req_id):
+        """Queue position (1-based) and estimated seconds until start for a queued job."""
+        state = get_job_state()
+        job = state.job(req_id)
+        if job is None or job['state'] != 'queued':
+            return None
+        queued = [j['req_id'] for j in state.jobs(('queued',))]
+        if req_id not in queued:
+            return None
+        position = queued.index(req_id) + 1
+        durations = state.recent_durations()
+        average = sum(durations) / len(durations) if durations else DEFAULT_JOB_SECONDS
+        capacity = self.capacity()
+        now = time.time()
+        # Earliest a worker frees up, then whole jobs for everyone ahead of us
+        remaining = sorted(
+            max(0.0, average - (now - j['started'])) for j in state.jobs(('running', 'cancelling'))
+        )
+        if len(remaining) < capacity:
+            first_free = 0.0
+        else:
+            first_free = remaining[0]
+        waves = (position - 1) // capacity
+        return {
+            'queue_position': position,
+            'queued_jobs': len(queued),
+            'estimated_start': round(first_free + waves * average),
+        }
+
+    def stats(self):
+        state = get_job_state()
+        return {
+            'workers': self.capacity(),
+            'running': len(state.jobs(('running', 'cancelling'))),
+            'queued': len(state.jobs(('queued',))),
+            'available_mb': available_memory_mb(),
+        }
+
+    def local_jobs(self):
+        with self._lock:
+            return sorted(self._running)
+
+    def reap_abandoned(self):
+        """Mark done the running jobs of workers that stopped heartbeating; returns those jobs."""
+        state = get_job_state()
+        live = state.workers()
+        abandoned = [job for job in state.jobs(('running', 'cancelling')) if job['worker'] not in live]
+        for job in abandoned:
+            state.finish(job['req_id'])
+        return abandoned
+
+    def _has_headroom(self):
+        if not self._running:
+            return True
+        available = available_memory_mb()
+        return available is None or available >= self.reserve_mb
+
+    def _claim(self):
+        # Memory-aware admission: leave the job queued until another browser fits
+        with self._lock:
+            if not self._has_headroom():
+                return None
+            job = get_job_state().claim(self.worker_id)
+            if job is not None:
+                self._running.add(job['req_id'])
+            return job
+
+    def _worker(self):
+        state = get_job_state()
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"Scheduler: could not claim a job: {e}")
+                job = None
+            if job is None:
+                time.sleep(SCHEDULER_POLL_SECONDS)
+                continue
+
+            req_id = job['req_id']
+            try:
+                # Stage timings recorded on this thread go to the job's breakdown
+                with METRICS.bind_job(req_id):
+                    METRICS.observe('queue_wait', job['started'] - job['submitted'])
+                    self._tasks[job['task']](*job['args'])
+            except Exception as e:
+                print(f"Job {req_id} raised: {e}")
+            finally:
+                with self._lock:
+                    self._running.discard(req_id)
+                state.finish(req_id)
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler():
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = JobScheduler()
+        return _SCHEDULER
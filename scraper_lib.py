@@ -1,16 +1,66 @@
-from selenium import webdriver
-from webdriver_manager.chrome import ChromeDriverManager
+# selenium's webdriver, undetected_chromedriver and webdriver_manager are imported where a browser
+# is started, so processes that never start one (the web workers) don't pay for them
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import undetected_chromedriver as uc
+from selenium.common.exceptions import TimeoutException, JavascriptException, StaleElementReferenceException
 import time
 import re
+import json
 import random
 import sys
 import os
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+
+from metrics import METRICS
+from page_cache import get_cache
+from price_normalize import normalize_prices
+from product_ids import product_identity
+from strategy_cache import first_success
+from virtual_display import ensure_display
+
+# Number of Nahdi listing pages loaded at once (one browser tab each); 1 loads them one after another
+NAHDI_PAGE_CONCURRENCY = max(1, int(os.environ.get('NAHDI_PAGE_CONCURRENCY', 3)))
+# Stop paginating once this share of a page's cards were already seen
+DUPLICATE_STOP_RATIO = float(os.environ.get('DUPLICATE_STOP_RATIO', 0.8))
+
+class JobCancelled(Exception):
+    """Raised from a status_callback to stop a scrape between pages."""
+
+class ScrapeComplete(Exception):
+    """Raised from a status_callback to end a scrape early; rows emitted so far stand."""
+
+class PageFailed(Exception):
+    """A listing page could not be loaded; pages before it have already been emitted."""
+
+    def __init__(self, page, message=None):
+        super().__init__(message or f"Page {page} failed to load")
+        self.page = page
+
+class RowSink:
+    """Collects scraped rows, or hands them to a consumer page by page.
+
+    Each batch gets its typed price columns (normalize_prices) on the way
+    through. With a consumer nothing is kept in memory and result() is the
+    row count; without one, result() is the list of rows as before.
+    """
+
+    def __init__(self, consumer=None, count=0):
+        self.consumer = consumer
+        self.rows = [] if consumer is None else None
+        # Rows already delivered by an earlier, interrupted run
+        self.count = count
+
+    def emit(self, rows):
+        if not rows:
+            return
+        rows = normalize_prices(rows)
+        self.count += len(rows)
+        if self.consumer is None:
+            self.rows.extend(rows)
+        else:
+            self.consumer(rows)
+
+    def result(self):
+        return self.rows if self.consumer is None else self.count
 
 def extract_category_from_url(url):
     try:
@@ -42,10 +92,14 @@ def extract_category_from_url(url):
 
 def get_driver(headless=False):
     print("Attempting to initialize Chrome Driver...")
+    if not headless:
+        # A visible browser needs an X display; Xvfb is only started for these
+        ensure_display()
 
     # Method 0: Undetected Chromedriver (Best for bypassing blocks)
     try:
         print("Method 0: Undetected Chromedriver...")
+        import undetected_chromedriver as uc
         options = uc.ChromeOptions()
         options.add_argument("--start-maximized")
         options.add_argument("--disable-popup-blocking")
@@ -56,26 +110,33 @@ def get_driver(headless=False):
         options.add_argument("--blink-settings=imagesEnabled=false") # Disable images for speed
         options.add_argument("--disable-extensions")
         options.add_argument("--dns-prefetch-disable")
+        # Performance log feeds the blocked-request counters
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
         
         if headless:
             options.add_argument("--headless=new")
             
         # Try without version_main first, let UC detect it
-        driver = uc.Chrome(options=options, use_subprocess=True)
+        with METRICS.span('driver_start', method='uc'):
+            driver = uc.Chrome(options=options, use_subprocess=True)
         driver.set_page_load_timeout(30) # Set timeout
         return driver
     except Exception as e:
         print(f"Method 0 (UC) failed: {e}")
+        METRICS.count('driver_start_failures', method='uc')
         # Retry with version_main=131 as fallback
         try:
             print("Retrying Method 0 with version_main=131...")
-            driver = uc.Chrome(options=options, use_subprocess=True, version_main=131)
+            with METRICS.span('driver_start', method='uc_131'):
+                driver = uc.Chrome(options=options, use_subprocess=True, version_main=131)
             driver.set_page_load_timeout(30)
             return driver
         except Exception as e2:
             print(f"Method 0 (UC) retry failed: {e2}")
+            METRICS.count('driver_start_failures', method='uc_131')
 
     # Standard Selenium Options (Fallback)
+    from selenium import webdriver
     options = webdriver.ChromeOptions()
     options.add_argument("--start-maximized")
     options.add_argument("--log-level=3") 
@@ -93,33 +154,503 @@ def get_driver(headless=False):
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36")
     options.add_argument("--disable-popup-blocking")
     options.add_argument("--ignore-certificate-errors")
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
     # Method 1: Selenium Manager
     try:
         print("Method 1: Selenium Manager...")
-        driver = webdriver.Chrome(options=options)
+        with METRICS.span('driver_start', method='selenium_manager'):
+            driver = webdriver.Chrome(options=options)
         return driver
     except Exception as e:
         print(f"Method 1 failed: {e}")
+        METRICS.count('driver_start_failures', method='selenium_manager')
 
     # Method 2: WebDriver Manager
     try:
         print("Method 2: WebDriver Manager...")
-        path = ChromeDriverManager().install()
-        service = Service(path)
-        driver = webdriver.Chrome(service=service, options=options)
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
+        with METRICS.span('driver_start', method='webdriver_manager'):
+            path = ChromeDriverManager().install()
+            service = Service(path)
+            driver = webdriver.Chrome(service=service, options=options)
         return driver
     except Exception as e:
         print(f"Method 2 failed: {e}")
+        METRICS.count('driver_start_failures', method='webdriver_manager')
 
     raise Exception("Could not initialize Chrome Driver.")
 
-def scrape_nahdi(driver, base_url, status_callback=None):
-    products = []
-    seen_signatures = set() 
-    
-    category_name = extract_category_from_url(base_url)
+# Reads every field the Nahdi card loop needs in a single execute_script call.
+# Missing elements come back as null so build_nahdi_product can apply the same
+# fallbacks the per-element find_element path uses.
+NAHDI_CARDS_JS = """
+var cards = arguments[0] || [];
+function q(card, sel) { try { return card.querySelector(sel); } catch (e) { return null; } }
+function txt(el) { return el ? (el.innerText || '').trim() : null; }
+var out = [];
+for (var i = 0; i < cards.length; i++) {
+    var card = cards[i];
+    if (!card) { continue; }
+    var img = q(card, 'img');
+    var badge = q(card, "div[class*='bg-red'], div[class*='bg-yellow']");
+    var row = {
+        name_text: txt(q(card, 'span.line-clamp-3')),
+        img_alt: img ? (img.getAttribute('alt') || '') : null,
+        aria_label: card.getAttribute('aria-label'),
+        href: card.href || card.getAttribute('href'),
+        gray_text: txt(q(card, 'span.text-gray-dark')),
+        strike_text: txt(q(card, '.line-through')),
+        red_text: txt(q(card, '.text-red')),
+        badge_text: badge ? (badge.textContent || '') : null,
+        white_text: txt(q(card, 'span.text-white')),
+        inner_text: null
+    };
+    if (!row.gray_text && !row.strike_text && !row.red_text) {
+        row.inner_text = card.innerText || '';
+    }
+    out.push(row);
+}
+return out;
+"""
+
+def _read_nahdi_card(card):
+    # Per-element fallback used when the bulk script cannot run.
+    def text_of(selector):
+        try:
+            return card.find_element(By.CSS_SELECTOR, selector).text.strip()
+        except:
+            return None
+
+    raw = {
+        "name_text": text_of("span.line-clamp-3"),
+        "gray_text": text_of("span.text-gray-dark"),
+        "strike_text": text_of(".line-through"),
+        "red_text": text_of(".text-red"),
+        "white_text": text_of("span.text-white"),
+        "img_alt": None,
+        "aria_label": None,
+        "href": None,
+        "badge_text": None,
+        "inner_text": None,
+    }
+    try:
+        raw["img_alt"] = card.find_element(By.TAG_NAME, "img").get_attribute("alt")
+    except:
+        pass
+    try:
+        raw["aria_label"] = card.get_attribute("aria-label")
+    except:
+        pass
+    try:
+        raw["href"] = card.get_attribute("href")
+    except:
+        pass
+    try:
+        badge = card.find_element(By.CSS_SELECTOR, "div[class*='bg-red'], div[class*='bg-yellow']")
+        raw["badge_text"] = badge.get_attribute("textContent")
+    except:
+        pass
+    if not raw["gray_text"] and not raw["strike_text"] and not raw["red_text"]:
+        try:
+            raw["inner_text"] = card.get_attribute("innerText")
+        except:
+            pass
+    return raw
+
+def read_nahdi_cards(driver, cards, bulk=True):
+    """Return one raw field dict per card, in a single round trip when bulk is on."""
+    if not cards:
+        return []
+    METRICS.count('cards_extracted', len(cards), site='nahdi')
+
+    if bulk:
+        start = time.time()
+        try:
+            with METRICS.span('card_extraction', site='nahdi', mode='bulk'):
+                rows = driver.execute_script(NAHDI_CARDS_JS, cards)
+            if isinstance(rows, list) and len(rows) == len(cards):
+                print(f"Bulk extracted {len(rows)} cards in {(time.time() - start) * 1000:.0f}ms")
+                return rows
+        except Exception as e:
+            print(f"Bulk extraction failed, falling back to per-card reads: {e}")
+        METRICS.count('fallbacks', path='per_card_extraction')
+
+    with METRICS.span('card_extraction', site='nahdi', mode='per_card'):
+        return [_read_nahdi_card(card) for card in cards]
+
+def build_nahdi_product(raw, category_name):
+    """Turn a raw card dict into an output row using the Nahdi fallback order."""
+    try:
+        name = raw.get("name_text") or ""
+
+        if not name:
+            alt = raw.get("img_alt")
+            if alt and len(alt) > 3:
+                name = alt
+
+        if not name:
+            name = raw.get("aria_label")
+
+        if not name or len(name) < 3 or "{" in name or "sar_symbol" in name:
+            href = raw.get("href")
+            if href:
+                parts = href.split("/")
+                for part in parts:
+                    if part and part not in ["en-sa", "pdp", "https:", "", "www.nahdionline.com"]:
+                        if "-" in part:
+                            name = part.replace("-", " ").title()
+                            break
+    except:
+        name = "Unknown Product"
+
+    price_without_discount = raw.get("gray_text") or ""
+    regular_price = raw.get("strike_text") or ""
+    price_after_discount = raw.get("red_text") or ""
+
+    if (not regular_price and not price_after_discount and not price_without_discount):
+        try:
+            full_text = raw.get("inner_text")
+            found_prices = re.findall(r'(\d{1,5}\.\d{2})', full_text)
+
+            # Keep the text as shown; typed values come from normalize_prices
+            if len(found_prices) >= 2:
+                found_prices.sort(key=float, reverse=True)
+                regular_price, price_after_discount = found_prices[0], found_prices[1]
+            elif len(found_prices) == 1:
+                price_without_discount = found_prices[0]
+        except Exception:
+            pass
+
+    discount_percent = ""
+    badge_text = raw.get("badge_text")
+    if badge_text is not None:
+        discount_percent = " ".join(badge_text.split())
+
+    if not discount_percent:
+        discount_percent = raw.get("white_text") or ""
+
+    product_link = raw.get("href") or ""
+    if product_link.startswith("/"):
+        product_link = "https://www.nahdionline.com" + product_link
+
+    return {
+        "Product Name": name,
+        "Regular Price": regular_price,
+        "Price After Discount": price_after_discount,
+        "Price Without Discount": price_without_discount,
+        "Discount %": discount_percent,
+        "Category": category_name,
+        "Image Link": product_link,
+        "Source": "Nahdi"
+    }
+
+# Resource blocking applied through CDP Network.setBlockedURLs. Patterns use
+# Chrome's wildcard syntax. setBlockedURLs has no exceptions, so a site's allow
+# list removes entries from the shared deny list instead.
+RESOURCE_BLOCKING = os.environ.get('RESOURCE_BLOCKING', '1') == '1'
+
+DEFAULT_BLOCKED_URLS = [
+    # Fonts and media
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.m3u8",
+    # Images (imagesEnabled=false doesn't stop CSS backgrounds or favicons)
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.css",
+    # Analytics, tag managers and ad beacons
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*googleadservices.com*", "*facebook.net*",
+    "*facebook.com/tr*", "*connect.facebook.net*", "*hotjar.com*", "*clarity.ms*",
+    "*analytics.tiktok.com*", "*sc-static.net*", "*snap.licdn.com*", "*bat.bing.com*",
+    "*criteo.com*", "*criteo.net*", "*segment.io*", "*nr-data.net*", "*newrelic.com*",
+    "*cdn.mxpnl.com*", "*onesignal.com*", "*useinsider.com*", "*api.insider*",
+]
+
+SITE_BLOCKING = {
+    "nahdi": {
+        # Card heights and the lazy-loaded grid depend on the Tailwind stylesheet
+        "allow": ["*.css"],
+        "deny": ["*webengage.com*", "*moengage.com*", "*branch.io*", "*intercom.io*"],
+    },
+    "aldawaa": {
+        # The Next button's is_displayed() check needs Magento's styles
+        "allow": ["*.css"],
+        "deny": ["*webengage.com*", "*zopim.com*", "*zendesk.com*", "*tawk.to*"],
+    },
+}
+
+# Rough transfer sizes per CDP resource type, used to estimate bytes saved
+BLOCKED_BYTES_ESTIMATE = {
+    "Font": 35000,
+    "Image": 25000,
+    "Media": 400000,
+    "Stylesheet": 20000,
+    "Script": 60000,
+}
+
+def blocked_url_patterns(site):
+    profile = SITE_BLOCKING.get(site, {})
+    allow = set(profile.get("allow", []))
+    patterns = [p for p in DEFAULT_BLOCKED_URLS if p not in allow]
+    patterns.extend(p for p in profile.get("deny", []) if p not in patterns)
+    return patterns
+
+def apply_blocking_profile(driver, site):
+    """Block non-essential requests for this site. Returns True when active."""
+    patterns = blocked_url_patterns(site) if RESOURCE_BLOCKING else []
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        # Drop performance log entries from earlier jobs on a pooled driver
+        collect_blocking_stats(driver)
+        return bool(patterns)
+    except Exception as e:
+        print(f"Could not apply blocking profile for {site}: {e}")
+        return False
+
+def disable_blocking(driver):
+    try:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+    except Exception:
+        pass
+
+def collect_blocking_stats(driver, stats=None):
+    """Drain the performance log and add blocked request counts to stats."""
+    if stats is None:
+        stats = {"blocked": 0, "bytes_saved": 0}
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return stats
+    for entry in entries:
+        message = entry.get("message", "")
+        if "Network.loadingFailed" not in message or "blockedReason" not in message:
+            continue
+        try:
+            params = json.loads(message)["message"]["params"]
+        except Exception:
+            continue
+        if params.get("blockedReason") != "inspector":
+            continue
+        stats["blocked"] += 1
+        stats["bytes_saved"] += BLOCKED_BYTES_ESTIMATE.get(params.get("type"), 2000)
+    return stats
 
+# Per-site readiness settings. legacy_wait is the mean of the fixed sleeps the
+# scrapers used to do per page and is only used to report time saved.
+SITE_READINESS = {
+    "nahdi": {
+        "card_selector": "a.flex.h-full.flex-col, span.line-clamp-3",
+        "timeout": float(os.environ.get('NAHDI_READY_TIMEOUT', 10)),
+        "quiet_ms": 600,
+        "min_jitter": float(os.environ.get('NAHDI_MIN_JITTER', os.environ.get('SCRAPE_MIN_JITTER', 0))),
+        "legacy_wait": 5.5,
+    },
+    "aldawaa": {
+        "card_selector": ".product-detail-section, li.product-item, [class*='product-item-info']",
+        "timeout": float(os.environ.get('ALDAWAA_READY_TIMEOUT', 20)),
+        "quiet_ms": 800,
+        "min_jitter": float(os.environ.get('ALDAWAA_MIN_JITTER', os.environ.get('SCRAPE_MIN_JITTER', 0))),
+        "legacy_wait": 10.0,
+    },
+}
+
+# Fixed wait used only when the readiness script could not finish a single check before the timeout
+READINESS_FALLBACK_WAIT = float(os.environ.get('READINESS_FALLBACK_WAIT', 3))
+# What a readiness check raises when its document is unloaded under it, e.g. by the navigation a
+# Next click starts; the check is rerun on the new document
+READINESS_RETRY_ERRORS = (JavascriptException, StaleElementReferenceException)
+
+# Resolves once the document is complete and the card count, page height and
+# number of loaded resources have all been stable for quiet_ms. Scrolls to the
+# bottom whenever the page grows so lazy-loaded cards are triggered.
+READINESS_JS = """
+var selector = arguments[0], quietMs = arguments[1], timeoutMs = arguments[2];
+var done = arguments[arguments.length - 1];
+var start = performance.now(), lastChange = start;
+var lastCount = -1, lastHeight = -1, lastResources = -1;
+var finished = false, observer = null;
+function resources() { try { return performance.getEntriesByType('resource').length; } catch (e) { return 0; } }
+function sample() {
+    var now = performance.now();
+    var count = document.querySelectorAll(selector).length;
+    var height = document.body ? document.body.scrollHeight : 0;
+    var res = resources();
+    if (count !== lastCount || height !== lastHeight || res !== lastResources) {
+        lastChange = now;
+        if (height !== lastHeight) { window.scrollTo(0, height); }
+        lastCount = count; lastHeight = height; lastResources = res;
+    }
+    return now;
+}
+function finish(timedOut) {
+    if (finished) { return; }
+    finished = true;
+    if (observer) { observer.disconnect(); }
+    done({cards: lastCount, waited_ms: performance.now() - start, timed_out: timedOut});
+}
+try {
+    observer = new MutationObserver(function () { if (!finished) { sample(); } });
+    observer.observe(document.documentElement, {childList: true, subtree: true});
+} catch (e) {}
+function tick() {
+    if (finished) { return; }
+    var now = sample();
+    var fresh = !document.querySelector('[data-sws-stale]');
+    var quiet = now - lastChange;
+    var complete = document.readyState === 'complete';
+    // An empty listing (end of category) gets a longer quiet window before giving up on cards
+    if (fresh && complete && ((lastCount > 0 && quiet >= quietMs) || quiet >= quietMs * 3)) { finish(false); return; }
+    if (now - start >= timeoutMs) { finish(true); return; }
+    setTimeout(tick, 100);
+}
+tick();
+"""
+
+def mark_page_stale(driver, selector):
+    # Tag the current cards so readiness waits for them to be replaced
+    try:
+        driver.execute_script(
+            "var el = document.querySelector(arguments[0]); if (el) { el.setAttribute('data-sws-stale', '1'); }",
+            selector
+        )
+    except Exception:
+        pass
+
+def wait_for_page_ready(driver, site):
+    """Block until the listing page is settled instead of sleeping a fixed time.
+
+    Returns a dict with the seconds waited, the seconds saved against the old
+    fixed sleeps, the card count seen and whether the timeout was hit.
+    """
+    config = SITE_READINESS[site]
+    start = time.time()
+    deadline = start + config["timeout"]
+    result = None
+    while result is None and time.time() < deadline:
+        remaining = deadline - time.time()
+        try:
+            driver.set_script_timeout(remaining + 5)
+            result = driver.execute_async_script(
+                READINESS_JS, config["card_selector"], config["quiet_ms"], remaining * 1000
+            ) or {}
+        except READINESS_RETRY_ERRORS:
+            # Navigation replaced the document mid-check; wait on the new one
+            METRICS.count('readiness_retries', site=site)
+            time.sleep(0.1)
+        except TimeoutException:
+            break
+        except Exception as e:
+            print(f"Readiness check failed on {site}: {e}")
+            result = {"timed_out": True}
+    if result is None:
+        print(f"Readiness check on {site} never completed; waiting {READINESS_FALLBACK_WAIT:.0f}s instead")
+        time.sleep(READINESS_FALLBACK_WAIT)
+        result = {"timed_out": True}
+
+    min_jitter = config["min_jitter"]
+    if min_jitter:
+        elapsed = time.time() - start
+        if elapsed < min_jitter:
+            time.sleep(min_jitter - elapsed + random.uniform(0, min_jitter * 0.25))
+
+    waited = time.time() - start
+    METRICS.observe('readiness_wait', waited, site=site)
+    if result.get("timed_out"):
+        METRICS.count('readiness_timeouts', site=site)
+    saved = max(0.0, config["legacy_wait"] - waited)
+    print(f"{site} page ready in {waited:.2f}s ({result.get('cards', 0)} cards, saved {saved:.1f}s)")
+    return {
+        "waited": waited,
+        "saved": saved,
+        "cards": result.get("cards") or 0,
+        "timed_out": bool(result.get("timed_out")),
+    }
+
+def new_job_stats(blocking=False):
+    return {
+        "saved": 0.0, "last_wait": 0.0, "blocking": blocking, "blocked": 0, "bytes_saved": 0,
+        "total_pages": None, "page_started_at": time.time(),
+    }
+
+def wait_and_record(driver, site, job_stats):
+    readiness = wait_for_page_ready(driver, site)
+    job_stats["saved"] += readiness["saved"]
+    job_stats["last_wait"] = readiness["waited"]
+    if job_stats["blocking"]:
+        collect_blocking_stats(driver, job_stats)
+    return readiness
+
+def reload_without_blocking(driver, job_stats):
+    # Safe fallback: the first page rendered no cards with blocking on, so retry it unblocked
+    print("No cards with resource blocking on; reloading without it")
+    METRICS.count('fallbacks', path='unblocked_reload')
+    disable_blocking(driver)
+    job_stats["blocking"] = False
+    try:
+        driver.refresh()
+    except Exception:
+        pass
+
+def load_page(driver, url, page):
+    """driver.get that turns a timeout into PageFailed instead of ending the scrape."""
+    try:
+        with METRICS.span('page_load'):
+            driver.get(url)
+    except TimeoutException:
+        METRICS.count('page_load_timeouts')
+        raise PageFailed(page, f"Timeout loading page {page}")
+
+def report_progress(status_callback, page, count, job_stats, event="page_started", **details):
+    """Send a progress event: page_started before a page loads, page_done once its rows are in."""
+    now = time.time()
+    if event == "page_started":
+        job_stats["page_started_at"] = now
+    elif event == "page_done":
+        details["page_seconds"] = round(now - job_stats.get("page_started_at", now), 2)
+    if job_stats.get("total_pages"):
+        details["total_pages"] = job_stats["total_pages"]
+    if status_callback:
+        status_callback(
+            page=page,
+            count=count,
+            event=event,
+            time_saved=round(job_stats["saved"], 1),
+            blocked_requests=job_stats["blocked"],
+            bytes_saved=job_stats["bytes_saved"],
+            **details
+        )
+
+def cached_page_rows(url, max_staleness=None):
+    """Rows extracted from this page URL earlier, if fresh enough. max_staleness=0 bypasses the cache."""
+    cache = get_cache()
+    if cache is None or url is None or max_staleness == 0:
+        return None
+    rows = cache.get(url, "rows", max_age=max_staleness)
+    METRICS.count('page_cache_lookups', result='miss' if rows is None else 'hit')
+    return rows
+
+def store_page_rows(url, rows):
+    cache = get_cache()
+    if cache is not None and url is not None:
+        cache.put(url, "rows", rows)
+
+def unseen_products(page_products, seen_ids):
+    """Rows whose identity isn't in seen_ids yet (which they are added to)."""
+    new_products = []
+    for product in page_products:
+        identity = product_identity(product)
+        if identity not in seen_ids:
+            seen_ids.add(identity)
+            new_products.append(product)
+    return new_products
+
+def mostly_seen(page_count, new_count):
+    """True when a page repeats earlier cards, i.e. the listing has run out or wrapped around."""
+    return page_count > 0 and page_count - new_count >= page_count * DUPLICATE_STOP_RATIO
+
+def nahdi_page_template(base_url):
     if "?page=" not in base_url and "&page=" not in base_url:
         if "?" in base_url:
             base_url += "&page={}"
@@ -127,351 +658,559 @@ def scrape_nahdi(driver, base_url, status_callback=None):
             base_url += "?page={}"
     else:
         base_url = re.sub(r'page=\d+', 'page={}', base_url)
+    return base_url
 
-    page = 1
-    
-    while True:
-        url = base_url.format(page)
-        if status_callback:
-            status_callback(page=page, count=len(products))
-        
-        print(f"Scraping page {page}: {url}")
-        try:
-            driver.get(url)
-        except TimeoutException:
-            print(f"Timeout loading page {page}")
-            break
-        
-        # Wait for products to appear
-        try:
-            WebDriverWait(driver, 8).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "a.flex.h-full.flex-col"))
-            )
-        except:
-            pass
-            
-        time.sleep(random.uniform(1, 2))
-        
+def _find_nahdi_cards(driver):
+    with METRICS.span('card_discovery', site='nahdi'):
+        product_cards, strategy = _discover_nahdi_cards(driver)
+    METRICS.count('card_strategy', site='nahdi', strategy=strategy)
+    return product_cards
+
+def _nahdi_cards_by_name_span(driver):
+    # Walk up from each product name to its link
+    name_spans = driver.find_elements(By.CSS_SELECTOR, "span.line-clamp-3")
+    unique_cards = []
+    seen_links = set()
+    for span in name_spans:
         try:
-            last_height = driver.execute_script("return document.body.scrollHeight")
+            parent_anchor = span.find_element(By.XPATH, "./ancestor::a")
+            link = parent_anchor.get_attribute("href")
+            if link and link not in seen_links:
+                unique_cards.append(parent_anchor)
+                seen_links.add(link)
         except:
-            last_height = 0
-            
-        for _ in range(3): 
-            try:
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
-                new_height = driver.execute_script("return document.body.scrollHeight")
-                if new_height == last_height:
+            continue
+    return unique_cards
+
+def _discover_nahdi_cards(driver):
+    """Return (cards, strategy name) for the current listing, trying last time's winner first."""
+    strategy, cards = first_success("nahdi", "cards", [
+        ("card_anchor", lambda: driver.find_elements(By.CSS_SELECTOR, "a.flex.h-full.flex-col")),
+        ("name_span_ancestor", lambda: _nahdi_cards_by_name_span(driver)),
+    ])
+    return cards or [], strategy or "none"
+
+def _extract_nahdi_page(driver, category_name, bulk_extract=True, job_stats=None, allow_fallback=False):
+    """Wait for the current page to settle and return its product rows ([] when no cards)."""
+    if job_stats is None:
+        job_stats = new_job_stats()
+    wait_and_record(driver, "nahdi", job_stats)
+    product_cards = _find_nahdi_cards(driver)
+    if not product_cards and allow_fallback and job_stats["blocking"]:
+        reload_without_blocking(driver, job_stats)
+        wait_and_record(driver, "nahdi", job_stats)
+        product_cards = _find_nahdi_cards(driver)
+    return [build_nahdi_product(raw, category_name)
+            for raw in read_nahdi_cards(driver, product_cards, bulk=bulk_extract)]
+
+def _merge_nahdi_page(page_products, sink, seen_ids):
+    """Emit a page's rows not seen before; return how many there were."""
+    new_products = unseen_products(page_products, seen_ids)
+    sink.emit(new_products)
+    return len(new_products)
+
+def _scrape_nahdi_tabs(driver, base_url, category_name, concurrency, status_callback, bulk_extract, job_stats, sink,
+                       max_staleness=None, start_page=1, seen_ids=None):
+    # Pages are URL-addressable, so load a wave of them in parallel tabs and harvest in page order.
+    from selenium.webdriver.support.ui import WebDriverWait
+    if seen_ids is None:
+        seen_ids = set()
+    original_handle = driver.current_window_handle
+    handles = [original_handle]
+    try:
+        for _ in range(concurrency - 1):
+            driver.switch_to.new_window('tab')
+            handles.append(driver.current_window_handle)
+            if job_stats["blocking"]:
+                # Blocked URLs are set per tab
+                apply_blocking_profile(driver, "nahdi")
+    except Exception as e:
+        print(f"Could not open extra tabs ({e}), continuing with {len(handles)}")
+
+    page = start_page
+    try:
+        while True:
+            wave = list(range(page, page + len(handles)))
+            report_progress(status_callback, page, sink.count, job_stats)
+            cached = {}
+            for page_no in wave:
+                rows = cached_page_rows(base_url.format(page_no), max_staleness)
+                if rows is not None:
+                    cached[page_no] = rows
+
+            # Kick off every load without blocking on any of them
+            for handle, page_no in zip(handles, wave):
+                if page_no in cached:
+                    continue
+                url = base_url.format(page_no)
+                print(f"Scraping page {page_no}: {url}")
+                driver.switch_to.window(handle)
+                if not job_stats["blocking"]:
+                    disable_blocking(driver)
+                # The flag disappears with the old document, so readyState below belongs to the new page
+                driver.execute_script("window.__swsPending = true; window.location.href = arguments[0];", url)
+
+            results = []
+            for handle, page_no in zip(handles, wave):
+                if page_no in cached:
+                    print(f"Page {page_no} served from cache")
+                    results.append(cached[page_no])
+                    continue
+                driver.switch_to.window(handle)
+                try:
+                    with METRICS.span('page_load'):
+                        WebDriverWait(driver, 30).until(
+                            lambda d: d.execute_script(
+                                "return !window.__swsPending && document.readyState === 'complete'"
+                            )
+                        )
+                except TimeoutException:
+                    print(f"Timeout loading page {page_no}")
+                    METRICS.count('page_load_timeouts')
+                    results.append(None)
                     break
-                last_height = new_height
-            except Exception:
+                page_products = _extract_nahdi_page(
+                    driver, category_name, bulk_extract, job_stats, allow_fallback=not sink.count and not results
+                )
+                if page_products or page_no > 1:
+                    store_page_rows(base_url.format(page_no), page_products)
+                results.append(page_products)
+
+            # Merge in page order and keep the sequential stop conditions
+            stop = False
+            for page_no, page_products in zip(wave, results):
+                if page_products is None:
+                    # Everything before the failed page is merged, so a retry resumes exactly there
+                    raise PageFailed(page_no, f"Timeout loading page {page_no}")
+                if not page_products:
+                    stop = True
+                    break
+                if page_no != page:
+                    report_progress(status_callback, page_no, sink.count, job_stats)
+                new_products_count = _merge_nahdi_page(page_products, sink, seen_ids)
+                report_progress(status_callback, page_no, sink.count, job_stats, event="page_done",
+                                cards=len(page_products))
+                if sink.count > new_products_count and mostly_seen(len(page_products), new_products_count):
+                    stop = True
+                    break
+            if stop:
                 break
-            
-        product_cards = []
-        
-        # Strategy 1
-        cards1 = driver.find_elements(By.CSS_SELECTOR, "a.flex.h-full.flex-col")
-        if len(cards1) > 0:
-            product_cards = cards1
-        
-        # Strategy 2
-        if not product_cards:
+            page += len(handles)
+    finally:
+        for handle in handles:
+            if handle == original_handle:
+                continue
             try:
-                name_spans = driver.find_elements(By.CSS_SELECTOR, "span.line-clamp-3")
-                unique_cards = []
-                seen_links = set()
-                for span in name_spans:
-                    try:
-                        parent_anchor = span.find_element(By.XPATH, "./ancestor::a")
-                        link = parent_anchor.get_attribute("href")
-                        if link and link not in seen_links:
-                            unique_cards.append(parent_anchor)
-                            seen_links.add(link)
-                    except:
-                        continue
-                if unique_cards:
-                    product_cards = unique_cards
-            except Exception as e:
+                driver.switch_to.window(handle)
+                driver.close()
+            except Exception:
                 pass
+        try:
+            driver.switch_to.window(original_handle)
+        except Exception:
+            pass
 
-        if not product_cards:
-            break
-            
-        new_products_count = 0
-        for i, card in enumerate(product_cards):
-            try:
-                name = ""
-                try:
-                    name = card.find_element(By.CSS_SELECTOR, "span.line-clamp-3").text.strip()
-                except:
-                    pass
-
-                if not name:
-                    try:
-                        img = card.find_element(By.TAG_NAME, "img")
-                        alt = img.get_attribute("alt")
-                        if alt and len(alt) > 3:
-                            name = alt
-                    except:
-                        pass
-                
-                if not name:
-                    try:
-                        name = card.get_attribute("aria-label")
-                    except:
-                        pass
-
-                if not name or len(name) < 3 or "{" in name or "sar_symbol" in name:
-                    href = card.get_attribute("href")
-                    if href:
-                        parts = href.split("/")
-                        for part in parts:
-                            if part and part not in ["en-sa", "pdp", "https:", "", "www.nahdionline.com"]:
-                                if "-" in part:
-                                    name = part.replace("-", " ").title()
-                                    break
-            except:
-                name = "Unknown Product"
+def scrape_nahdi(driver, base_url, status_callback=None, bulk_extract=True, concurrency=None, row_sink=None,
+                 max_staleness=None, start_page=1, start_count=0, seen_ids=None):
+    """Scrape a Nahdi category from start_page on.
+
+    Resuming passes the number of rows already delivered (start_count) and
+    their product identities, so progress counts continue and no row is emitted twice.
+    Raises PageFailed when a page won't load.
+    """
+    category_name = extract_category_from_url(base_url)
+    base_url = nahdi_page_template(base_url)
+
+    job_stats = new_job_stats(blocking=apply_blocking_profile(driver, "nahdi"))
+    # Rows are deduplicated by product ID as they're merged, so the sink only ever sees unique ones
+    sink = RowSink(row_sink, count=start_count)
+    if seen_ids is None:
+        seen_ids = set()
+
+    if concurrency is None:
+        concurrency = NAHDI_PAGE_CONCURRENCY
+    if concurrency > 1:
+        _scrape_nahdi_tabs(driver, base_url, category_name, concurrency, status_callback, bulk_extract, job_stats, sink,
+                           max_staleness, start_page, seen_ids)
+    else:
+        page = start_page
+        
+        while True:
+            url = base_url.format(page)
+            report_progress(status_callback, page, sink.count, job_stats)
             
-            try:
-                price_without_discount = card.find_element(By.CSS_SELECTOR, "span.text-gray-dark").text.strip()
-            except:
-                price_without_discount = ""
-                
-            try:
-                regular_price = card.find_element(By.CSS_SELECTOR, ".line-through").text.strip()
-            except:
-                regular_price = ""
-                
-            try:
-                price_after_discount = card.find_element(By.CSS_SELECTOR, ".text-red").text.strip()
-            except:
-                price_after_discount = ""
+            page_products = cached_page_rows(url, max_staleness)
+            if page_products is not None:
+                print(f"Page {page} served from cache")
+            else:
+                print(f"Scraping page {page}: {url}")
+                load_page(driver, url, page)
                 
-            if (not regular_price and not price_after_discount and not price_without_discount):
-                try:
-                    full_text = card.get_attribute("innerText")
-                    found_prices = re.findall(r'(\d{1,5}\.\d{2})', full_text)
-                    
-                    if len(found_prices) >= 2:
-                        float_prices = sorted([float(p) for p in found_prices], reverse=True)
-                        regular_price = str(float_prices[0])
-                        price_after_discount = str(float_prices[1])
-                    elif len(found_prices) == 1:
-                        price_without_discount = str(found_prices[0])
-                except Exception:
-                    pass
-
-            try:
-                discount_percent = ""
-                try:
-                    badge = card.find_element(By.CSS_SELECTOR, "div[class*='bg-red'], div[class*='bg-yellow']")
-                    raw_text = badge.get_attribute("textContent").strip()
-                    raw_text = " ".join(raw_text.split())
-                    if "Save" in raw_text and not " _ " in raw_text:
-                         discount_percent = raw_text.replace("Save", " _ Save")
-                    else:
-                         discount_percent = raw_text
-                except:
-                    pass
+                page_products = _extract_nahdi_page(
+                    driver, category_name, bulk_extract, job_stats, allow_fallback=not sink.count
+                )
+                # An empty first page is more likely a glitch than an empty category, so don't cache it
+                if page_products or page > 1:
+                    store_page_rows(url, page_products)
+            if not page_products:
+                break
                 
-                if not discount_percent:
-                    discount_percent = card.find_element(By.CSS_SELECTOR, "span.text-white").text.strip()
-            except:
-                discount_percent = ""
-            
-            try:
-                product_link = card.get_attribute("href")
-                if product_link and product_link.startswith("/"):
-                    product_link = "https://www.nahdionline.com" + product_link
-            except:
-                product_link = ""
-            
-            product_signature = (name, price_after_discount, regular_price)
-            
-            if product_signature not in seen_signatures:
-                seen_signatures.add(product_signature)
-                new_products_count += 1
+            new_products_count = _merge_nahdi_page(page_products, sink, seen_ids)
+            report_progress(status_callback, page, sink.count, job_stats, event="page_done",
+                            cards=len(page_products))
+            if sink.count > new_products_count and mostly_seen(len(page_products), new_products_count):
+                break
                 
-            products.append({
-                "Product Name": name,
-                "Regular Price": regular_price,
-                "Price After Discount": price_after_discount,
-                "Price Without Discount": price_without_discount,
-                "Discount %": discount_percent,
-                "Category": category_name,
-                "Image Link": product_link,
-                "Source": "Nahdi"
-            })
-        
-        if new_products_count == 0 and len(products) > 0:
-            break
+            page += 1
             
-        page += 1
-            
-    unique_products = []
-    seen = set()
-    for p in products:
-        sig = (p["Product Name"], p["Price After Discount"], p["Regular Price"])
-        if sig not in seen:
-            seen.add(sig)
-            unique_products.append(p)
-            
-    return unique_products
+    return sink.result()
 
-def scrape_aldawaa(driver, start_url, status_callback=None):
-    products = []
-    
-    category_name = extract_category_from_url(start_url)
-    
+def build_aldawaa_product(name, selling_price, old_price, discount_percent, product_link, category_name):
+    """Shape the fields read from an Al-Dawaa card into an output row."""
+    if old_price:
+        regular_price = old_price
+        price_after_discount = selling_price
+    else:
+        regular_price = selling_price
+        price_after_discount = ""
+
+    if product_link and not product_link.startswith("http"):
+        product_link = "https://www.al-dawaa.com" + product_link
+
+    return {
+        "Product Name": name,
+        "Regular Price": regular_price,
+        "Price After Discount": price_after_discount,
+        "Discount %": discount_percent,
+        "Image Link": product_link,
+        "Category": category_name,
+        "Source": "Al-Dawaa"
+    }
+
+# Magento toolbar: limiter options, "Items 1-12 of 345" and pager links
+ALDAWAA_TOOLBAR_JS = """
+var out = {limits: [], amount: '', hrefs: []};
+document.querySelectorAll('select#limiter option, .limiter-options option, .limiter select option').forEach(function (o) {
+    out.limits.push({value: o.value || '', text: (o.textContent || '').trim()});
+});
+var amount = document.querySelector('.toolbar-amount, #toolbar-amount');
+out.amount = amount ? (amount.textContent || '').trim() : '';
+document.querySelectorAll('.pages a, .pages-items a').forEach(function (a) {
+    out.hrefs.push(a.href || '');
+});
+return out;
+"""
+
+def parse_aldawaa_toolbar(info):
+    """Work out the pager's query parameters, page sizes and item total from toolbar data."""
+    toolbar = {
+        "page_param": "p",
+        "limit_param": "product_list_limit",
+        "limits": [],
+        "current_limit": None,
+        "total_items": None,
+    }
+    if not info:
+        return toolbar
+
+    for option in info.get("limits") or []:
+        value = option.get("value") or ""
+        if "?" in value:
+            for key, values in parse_qs(urlparse(value).query).items():
+                if "limit" in key and values and values[0].isdigit():
+                    toolbar["limit_param"] = key
+                    toolbar["limits"].append(int(values[0]))
+        elif value.isdigit():
+            toolbar["limits"].append(int(value))
+        else:
+            digits = re.findall(r'\d+', option.get("text") or "")
+            if digits:
+                toolbar["limits"].append(int(digits[0]))
+    toolbar["limits"] = sorted(set(toolbar["limits"]))
+
+    amount = " ".join((info.get("amount") or "").split())
+    numbers = [int(n) for n in re.findall(r'\d+', amount.replace(",", ""))]
+    if len(numbers) >= 3:
+        # "Items 13-24 of 345"
+        toolbar["current_limit"] = numbers[1] - numbers[0] + 1
+        toolbar["total_items"] = numbers[2]
+    elif numbers:
+        # "345 Items" (everything fits on one page)
+        toolbar["total_items"] = numbers[-1]
+
+    for href in info.get("hrefs") or []:
+        query = parse_qs(urlparse(href).query)
+        for key in ("p", "page"):
+            if key in query:
+                toolbar["page_param"] = key
+
+    return toolbar
+
+def aldawaa_total_pages(toolbar, limit):
+    """Total page count for a page size, or None if the toolbar didn't give one."""
+    if toolbar["total_items"] is not None and limit:
+        return max(1, -(-toolbar["total_items"] // limit))
+    return None
+
+def aldawaa_page_url(url, page, toolbar, limit=None):
+    parts = urlparse(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query[toolbar["page_param"]] = [str(page)]
+    if limit:
+        query[toolbar["limit_param"]] = [str(limit)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+def plan_aldawaa_pages(driver, start_url, job_stats):
+    """Read the toolbar, switch to the largest page size and return (toolbar, limit, total_pages).
+
+    total_pages is None when the listing doesn't expose a count, in which case
+    the caller keeps following the Next button.
+    """
+    with METRICS.span('pagination', site='aldawaa', step='plan'):
+        return _plan_aldawaa_pages(driver, start_url, job_stats)
+
+def _plan_aldawaa_pages(driver, start_url, job_stats):
     try:
-        time.sleep(2)
-        driver.get(start_url)
-    except Exception:
-        return []
-        
-    wait = WebDriverWait(driver, 20)
-    page_num = 1
-    
-    while True:
-        if status_callback:
-            status_callback(page=page_num, count=len(products))
-            
-        try:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(random.uniform(2, 3))
-        except:
-            pass
-        
+        toolbar = parse_aldawaa_toolbar(driver.execute_script(ALDAWAA_TOOLBAR_JS))
+    except Exception as e:
+        print(f"Could not read Al-Dawaa toolbar: {e}")
+        return None, None, None
+
+    limit = toolbar["current_limit"]
+    if toolbar["limits"] and (limit is None or toolbar["limits"][-1] > limit):
+        limit = toolbar["limits"][-1]
         try:
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, ".product-detail-section, li.product-item")))
+            driver.get(aldawaa_page_url(start_url, 1, toolbar, limit))
+            wait_and_record(driver, "aldawaa", job_stats)
+            resized = parse_aldawaa_toolbar(driver.execute_script(ALDAWAA_TOOLBAR_JS))
+            resized["limit_param"] = toolbar["limit_param"]
+            toolbar = resized
         except TimeoutException:
-            pass
+            print("Timeout loading Al-Dawaa page with the larger page size")
+            return None, None, None
+
+    total_pages = aldawaa_total_pages(toolbar, toolbar["current_limit"] or limit)
+    print(f"Al-Dawaa pagination: {total_pages or '?'} pages of {limit or '?'} items")
+    return toolbar, limit, total_pages
+
+def _find_aldawaa_cards(driver):
+    with METRICS.span('card_discovery', site='aldawaa'):
+        cards, strategy = _discover_aldawaa_cards(driver)
+    METRICS.count('card_strategy', site='aldawaa', strategy=strategy)
+    return cards
+
+# Card selectors for Al-Dawaa listings, in the order they're tried until one has worked
+ALDAWAA_CARD_SELECTORS = [
+    ("detail_section", ".product-detail-section"),
+    ("product_item", "li.product-item"),
+    ("item_info", "[class*='product-item-info']"),
+]
+# Next-button XPaths for Al-Dawaa pagination, likewise
+ALDAWAA_NEXT_XPATHS = [
+    ("next_class", "//a[contains(@class, 'next')]"),
+    ("next_item", "//li[contains(@class, 'next')]/a"),
+    ("next_title", "//a[@title='Next']"),
+    ("next_text", "//a[contains(text(), 'Next')]"),
+    ("chevron_text", "//a[contains(text(), '›')]"),
+    ("arrow_text", "//a[contains(text(), '>')]"),
+    ("next_label", "//a[contains(@aria-label, 'Next')]"),
+]
+
+def _discover_aldawaa_cards(driver):
+    """Return (cards, strategy name) for the current listing, trying last time's winner first."""
+    strategy, cards = first_success("aldawaa", "cards", [
+        (name, lambda selector=selector: driver.find_elements(By.CSS_SELECTOR, selector))
+        for name, selector in ALDAWAA_CARD_SELECTORS
+    ])
+    return cards or [], strategy or "none"
+
+def _click_aldawaa_next(driver, card_selector):
+    """Click the Next button; returns False when there is no further page."""
+    with METRICS.span('pagination', site='aldawaa', step='next_click'):
+        return _find_and_click_next(driver, card_selector)
+
+def _find_and_click_next(driver, card_selector):
+    def visible(xpath):
+        button = driver.find_element(By.XPATH, xpath)
+        return button if button.is_displayed() else None
+
+    try:
+        _, next_button = first_success("aldawaa", "next_button", [
+            (name, lambda xpath=xpath: visible(xpath)) for name, xpath in ALDAWAA_NEXT_XPATHS
+        ])
         
-        cards = driver.find_elements(By.CSS_SELECTOR, ".product-detail-section")
+        if not next_button or "disabled" in next_button.get_attribute("class"):
+            return False
         
-        if not cards:
-            cards = driver.find_elements(By.CSS_SELECTOR, "li.product-item")
+        mark_page_stale(driver, card_selector)
+        driver.execute_script("arguments[0].scrollIntoView();", next_button)
+        driver.execute_script("arguments[0].click();", next_button)
+        return True
+    except Exception:
+        return False
 
-        if not cards:
-            cards = driver.find_elements(By.CSS_SELECTOR, "[class*='product-item-info']")
+def _read_aldawaa_card(card, category_name):
+    context = card
+    try:
+        context = card.find_element(By.CSS_SELECTOR, ".product-detail-section")
+    except:
+        pass
 
-        if not cards:
-            break
-            
-        for card in cards:
-            context = card
-            try:
-                context = card.find_element(By.CSS_SELECTOR, ".product-detail-section")
-            except:
-                pass
+    def element(selector, by=By.CSS_SELECTOR):
+        return context.find_element(by, selector)
 
-            try:
-                name = context.find_element(By.CLASS_NAME, "product-name").text.strip()
-            except:
-                try:
-                    name = context.find_element(By.CSS_SELECTOR, "a.product-item-link").text.strip()
-                except:
-                    name = ""
-            
-            selling_price = ""
-            old_price = ""
-            
-            try:
-                price_element = context.find_element(By.CSS_SELECTOR, ".icon-saudi_riyal")
-                selling_price = price_element.find_element(By.XPATH, "..").text.strip()
-            except:
-                try:
-                    selling_price = context.find_element(By.CSS_SELECTOR, "[data-price-type='finalPrice'] .price").text.strip()
-                except:
-                    selling_price = ""
+    def text_of(found):
+        try:
+            return found.text.strip() if found is not None else ""
+        except Exception:
+            return ""
 
-            try:
-                old_price = context.find_element(By.CSS_SELECTOR, ".price-section.total").text.strip()
-            except:
-                try:
-                    old_price = context.find_element(By.CSS_SELECTOR, "[data-price-type='oldPrice'] .price").text.strip()
-                except:
-                    old_price = ""
+    # Each field's fallbacks, remembered winner first so a stable layout costs one lookup per field.
+    # A strategy matches when its element exists, even with empty text, as the fixed selector order did.
+    _, name = first_success("aldawaa", "name", [
+        ("product_name", lambda: element("product-name", By.CLASS_NAME)),
+        ("item_link", lambda: element("a.product-item-link")),
+    ])
+    _, selling_price = first_success("aldawaa", "price", [
+        ("riyal_icon", lambda: element(".icon-saudi_riyal").find_element(By.XPATH, "..")),
+        ("final_price", lambda: element("[data-price-type='finalPrice'] .price")),
+    ])
+    _, old_price = first_success("aldawaa", "old_price", [
+        ("price_total", lambda: element(".price-section.total")),
+        ("old_price", lambda: element("[data-price-type='oldPrice'] .price")),
+    ])
+    name = text_of(name)
+    selling_price = text_of(selling_price)
+    old_price = text_of(old_price)
 
-            if old_price:
-                regular_price = old_price
-                price_after_discount = selling_price
-            else:
-                regular_price = selling_price
-                price_after_discount = ""
-                
-            try:
-                discount_percent = context.find_element(By.CSS_SELECTOR, ".promotion-style span").text.strip()
-            except:
-                discount_percent = ""
-                
-            product_link = ""
-            try:
-                links = context.find_elements(By.TAG_NAME, "a")
-                for link in links:
-                    href = link.get_attribute("href")
-                    if href and "/p/" in href:
-                        product_link = href
-                        break
-                
-                if not product_link and context != card:
-                     links = card.find_elements(By.TAG_NAME, "a")
-                     for link in links:
-                        href = link.get_attribute("href")
-                        if href and "/p/" in href:
-                            product_link = href
-                            break
-                            
-                if product_link and not product_link.startswith("http"):
-                    product_link = "https://www.al-dawaa.com" + product_link
-            except:
-                pass
+    try:
+        discount_percent = context.find_element(By.CSS_SELECTOR, ".promotion-style span").text.strip()
+    except:
+        discount_percent = ""
+        
+    product_link = ""
+    try:
+        links = context.find_elements(By.TAG_NAME, "a")
+        for link in links:
+            href = link.get_attribute("href")
+            if href and "/p/" in href:
+                product_link = href
+                break
+        
+        if not product_link and context != card:
+             links = card.find_elements(By.TAG_NAME, "a")
+             for link in links:
+                href = link.get_attribute("href")
+                if href and "/p/" in href:
+                    product_link = href
+                    break
+                    
+    except:
+        pass
+        
+    return build_aldawaa_product(
+        name, selling_price, old_price, discount_percent, product_link, category_name
+    )
+
+def scrape_aldawaa(driver, start_url, status_callback=None, row_sink=None, max_staleness=None, start_page=1,
+                   start_count=0, seen_ids=None):
+    """Scrape an Al-Dawaa category from start_page on; raises PageFailed when a page won't load."""
+    sink = RowSink(row_sink, count=start_count)
+    if seen_ids is None:
+        seen_ids = set()
+    
+    category_name = extract_category_from_url(start_url)
+    card_selector = SITE_READINESS["aldawaa"]["card_selector"]
+    job_stats = new_job_stats(blocking=apply_blocking_profile(driver, "aldawaa"))
+    
+    # A cached pagination plan lets fully cached categories skip the browser entirely
+    plan = None
+    if max_staleness != 0 and get_cache() is not None:
+        plan = get_cache().get(start_url, "aldawaa-plan", max_age=max_staleness)
+    if plan:
+        toolbar, limit, total_pages = plan["toolbar"], plan["limit"], plan["total_pages"]
+        planned = True
+        loaded = False
+        page_num = start_page
+    else:
+        toolbar = limit = total_pages = None
+        planned = False
+        load_page(driver, start_url, 1)
+        loaded = True
+        page_num = 1
+
+    job_stats["total_pages"] = total_pages
+    
+    while True:
+        report_progress(status_callback, page_num, sink.count, job_stats)
+        
+        page_url = aldawaa_page_url(start_url, page_num, toolbar, limit) if total_pages else None
+        page_products = cached_page_rows(page_url, max_staleness)
+        if page_products is not None:
+            print(f"Page {page_num} served from cache")
+        else:
+            if not loaded:
+                load_page(driver, page_url, page_num)
+                loaded = True
                 
-            products.append({
-                "Product Name": name,
-                "Regular Price": regular_price,
-                "Price After Discount": price_after_discount,
-                "Discount %": discount_percent,
-                "Image Link": product_link,
-                "Category": category_name,
-                "Source": "Al-Dawaa"
-            })
+            # Scrolls for lazy-loaded cards and waits for the listing to settle
+            wait_and_record(driver, "aldawaa", job_stats)
             
-        try:
-            next_button = None
-            selectors = [
-                "//a[contains(@class, 'next')]",
-                "//li[contains(@class, 'next')]/a",
-                "//a[@title='Next']",
-                "//a[contains(text(), 'Next')]",
-                "//a[contains(text(), '›')]",
-                "//a[contains(text(), '>')]",
-                "//a[contains(@aria-label, 'Next')]"
-            ]
-            
-            for xpath in selectors:
-                try:
-                    btn = driver.find_element(By.XPATH, xpath)
-                    if btn.is_displayed():
-                        next_button = btn
-                        break
-                except NoSuchElementException:
+            if not planned:
+                # Address pages by URL when the toolbar tells us how many there are
+                planned = True
+                toolbar, limit, total_pages = plan_aldawaa_pages(driver, start_url, job_stats)
+                job_stats["total_pages"] = total_pages
+                if total_pages:
+                    page_url = aldawaa_page_url(start_url, page_num, toolbar, limit)
+                    if get_cache() is not None:
+                        get_cache().put(start_url, "aldawaa-plan",
+                                        {"toolbar": toolbar, "limit": limit, "total_pages": total_pages})
+                if total_pages and page_num < start_page:
+                    # Resuming: jump straight to the first unfinished page
+                    page_num = start_page
+                    loaded = False
                     continue
-            
-            if next_button:
-                if "disabled" in next_button.get_attribute("class"):
+
+            if page_num < start_page:
+                # Resuming without a page count: click through the finished pages
+                if not _click_aldawaa_next(driver, card_selector):
                     break
-                
-                driver.execute_script("arguments[0].scrollIntoView();", next_button)
-                time.sleep(1)
-                driver.execute_script("arguments[0].click();", next_button)
-                time.sleep(random.uniform(5, 8))
                 page_num += 1
-            else:
+                continue
+            
+            cards = _find_aldawaa_cards(driver)
+
+            if not cards and not sink.count and job_stats["blocking"]:
+                reload_without_blocking(driver, job_stats)
+                continue
+
+            METRICS.count('cards_extracted', len(cards), site='aldawaa')
+            with METRICS.span('card_extraction', site='aldawaa', mode='per_card'):
+                page_products = [_read_aldawaa_card(card, category_name) for card in cards]
+            if page_products or page_num > 1:
+                store_page_rows(page_url, page_products)
+
+        if not page_products:
+            break
+            
+        new_products = unseen_products(page_products, seen_ids)
+        sink.emit(new_products)
+        report_progress(status_callback, page_num, sink.count, job_stats, event="page_done",
+                        cards=len(page_products))
+        if sink.count > len(new_products) and mostly_seen(len(page_products), len(new_products)):
+            print(f"Page {page_num} repeats earlier products, stopping")
+            break
+            
+        if total_pages:
+            if page_num >= total_pages:
                 break
-        except Exception:
+            page_num += 1
+            # Navigate lazily so cached pages cost nothing
+            loaded = False
+        elif _click_aldawaa_next(driver, card_selector):
+            page_num += 1
+        else:
             break
             
-    return products
+    return sink.result()
@@ -0,0 +1,16 @@
+from urllib.parse import urlparse
+
+# The only hosts (and their subdomains) a caller-supplied URL may make us fetch.
+# Kept free of requests/BeautifulSoup so the web workers can validate URLs cheaply.
+SUPPORTED_HOSTS = ('nahdionline.com', 'al-dawaa.com')
+# Origins the scrapers browse; pooled drivers have their storage for each cleared between jobs
+STOREFRONT_ORIGINS = ('https://www.nahdionline.com', 'https://www.al-dawaa.com')
+
+
+def supported_site(url):
+    """True for http(s) URLs on a Nahdi or Al-Dawaa host."""
+    parts = urlparse(url)
+    host = (parts.hostname or "").lower()
+    return parts.scheme in ("http", "https") and any(
+        host == domain or host.endswith("." + domain) for domain in SUPPORTED_HOSTS
+    )
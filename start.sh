@@ -1,4 +1,50 @@
 #!/bin/bash
-Xvfb :99 -screen 0 1920x1080x24 &
-export DISPLAY=:99
-python app.py
\ No newline at end of file
+# Scrapes and their browsers run in their own process; the web server only queues and reports.
+# Xvfb is started by the worker when a non-headless job needs a display.
+#
+# This script supervises both: a scrape worker that exits (crash, OOM kill) is restarted,
+# SIGTERM/SIGINT are passed on to both, and the container stops when the web server does.
+
+# Seconds to wait before restarting a worker that exited
+WORKER_RESTART_DELAY=${WORKER_RESTART_DELAY:-5}
+
+stopping=0
+exit_status=0
+worker_pid=
+web_pid=
+
+stop() {
+    stopping=1
+    kill -TERM $web_pid $worker_pid 2>/dev/null
+}
+trap stop TERM INT
+
+start_worker() {
+    python worker.py &
+    worker_pid=$!
+}
+
+start_worker
+gunicorn -c gunicorn.conf.py app:app &
+web_pid=$!
+
+while [ "$stopping" = 0 ]; do
+    # Returns when a child exits or a trapped signal arrives
+    wait -n
+    status=$?
+    [ "$stopping" = 1 ] && break
+    if ! kill -0 "$web_pid" 2>/dev/null; then
+        echo "Web server exited ($status); stopping"
+        exit_status=$status
+        stop
+        break
+    fi
+    if ! kill -0 "$worker_pid" 2>/dev/null; then
+        echo "Scrape worker exited ($status); restarting in ${WORKER_RESTART_DELAY}s"
+        sleep "$WORKER_RESTART_DELAY"
+        [ "$stopping" = 0 ] && start_worker
+    fi
+done
+# Let both finish their graceful shutdown
+wait
+exit $exit_status
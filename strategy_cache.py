@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+
+from metrics import METRICS
+
+# Remembers which selector variant found each thing per site, so later pages and jobs try it first
+STRATEGY_CACHE = os.environ.get('STRATEGY_CACHE', '1') == '1'
+STRATEGY_CACHE_PATH = os.environ.get('STRATEGY_CACHE_PATH', '.strategy_cache.json')
+# Times in a row the remembered strategy may fail where another one works before it is replaced
+STRATEGY_FAILURE_LIMIT = int(os.environ.get('STRATEGY_FAILURE_LIMIT', 3))
+
+
+class StrategyCache:
+    """Winning strategy per (site, lookup point), persisted as JSON across restarts.
+
+    A lookup whose remembered winner matches is a hit and costs one
+    attempt. When the winner fails and a later strategy matches, that is a
+    miss; after STRATEGY_FAILURE_LIMIT such misses in a row the winner is
+    replaced. Lookups where nothing matches (no Next button on the last
+    page, a product without an old price) teach nothing.
+    """
+
+    def __init__(self, path=STRATEGY_CACHE_PATH, failure_limit=STRATEGY_FAILURE_LIMIT):
+        self.path = path
+        self.failure_limit = failure_limit
+        self._lock = threading.Lock()
+        self._winners = {}   # "site:point" -> {'strategy': name, 'failures': misses in a row}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._winners = {key: {'strategy': name, 'failures': 0} for key, name in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not load strategy cache {path}: {e}")
+
+    def _save(self):
+        # Write then rename, so another worker process never reads half a file
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({key: entry['strategy'] for key, entry in self._winners.items()}, f, indent=2,
+                          sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save strategy cache {self.path}: {e}")
+
+    def order(self, site, point, names):
+        """names with the remembered winner first."""
+        with self._lock:
+            entry = self._winners.get(f"{site}:{point}")
+        if entry is None or entry['strategy'] not in names:
+            return list(names)
+        return [entry['strategy']] + [name for name in names if name != entry['strategy']]
+
+    def record(self, site, point, strategy):
+        """strategy matched at this lookup point."""
+        key = f"{site}:{point}"
+        invalidated = None
+        with self._lock:
+            entry = self._winners.get(key)
+            if entry is not None and entry['strategy'] == strategy:
+                entry['failures'] = 0
+                self.hits += 1
+                result = 'hit'
+            else:
+                self.misses += 1
+                result = 'miss'
+                if entry is not None:
+                    entry['failures'] += 1
+                if entry is None or entry['failures'] >= self.failure_limit:
+                    if entry is not None:
+                        self.invalidations += 1
+                        invalidated = entry['strategy']
+                    self._winners[key] = {'strategy': strategy, 'failures': 0}
+                    self._save()
+        METRICS.count('strategy_cache_lookups', site=site, point=point, result=result)
+        if invalidated:
+            print(f"Strategy cache: {key} switched from {invalidated} to {strategy}")
+            METRICS.count('strategy_cache_invalidations', site=site, point=point)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+
+_STRATEGY_CACHE = None
+_STRATEGY_CACHE_LOCK = threading.Lock()
+
+
+def get_strategy_cache():
+    """The shared strategy cache, or None when STRATEGY_CACHE=0."""
+    global _STRATEGY_CACHE
+    if not STRATEGY_CACHE:
+        return None
+    with _STRATEGY_CACHE_LOCK:
+        if _STRATEGY_CACHE is None:
+            _STRATEGY_CACHE = StrategyCache()
+        return _STRATEGY_CACHE
+
+
+def first_success(site, point, strategies):
+    """Run [(name, fn)] until one fn() returns something truthy, remembered winner first.
+
+    An fn that raises counts as not matching. Returns (name, result), or
+    (None, None) when nothing matched.
+    """
+    cache = get_strategy_cache()
+    if cache is not None:
+        by_name = dict(strategies)
+        strategies = [(name, by_name[name]) for name in cache.order(site, point, list(by_name))]
+    for name, fn in strategies:
+        try:
+            result = fn()
+        except Exception:
+            result = None
+        if result:
+            if cache is not None:
+                cache.record(site, point, name)
+            return name, result
+    return None, None
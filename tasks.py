@@ -0,0 +1,418 @@
+import os
+import queue
+import re
+import threading
+import time
+
+from selenium.common.exceptions import WebDriverException
+from scraper_lib import (
+    scrape_nahdi, scrape_aldawaa, extract_category_from_url, JobCancelled, PageFailed, ScrapeComplete
+)
+from product_ids import product_identity
+from driver_pool import get_pool, DriverLease
+from browser_governor import get_governor
+from http_fetch import fetch_category, discover_category_urls
+from scheduler import get_scheduler, available_memory_mb, BROWSER_RESERVE_MB
+from result_writer import CsvRowWriter
+from events import JOB_EVENTS
+from job_state import get_job_state
+from metrics import METRICS
+from result_store import get_store, ROW_COLUMNS, PRICE_COLUMNS
+from price_history import DeltaRun, get_history
+
+# Fresh-driver retries of a failed page before the job gives up (it can still be resumed)
+PAGE_RETRIES = int(os.environ.get('PAGE_RETRIES', 2))
+# Categories of one batch scraped at the same time (each holds one pool driver)
+BATCH_CONCURRENCY = max(1, int(os.environ.get('BATCH_CONCURRENCY', 2)))
+# Nahdi and Al-Dawaa rows have different fields, so the combined output fixes its columns up front
+BATCH_COLUMNS = [column for column in ROW_COLUMNS if column != 'No.'] + list(PRICE_COLUMNS)
+# Where result CSVs are written; point every instance at one shared volume to serve them from any of them
+RESULTS_DIR = os.environ.get('RESULTS_DIR', '.')
+
+def generate_filename_from_url(url):
+    try:
+        # Remove protocol
+        name = url.split('://')[-1]
+        # Remove query params
+        name = name.split('?')[0]
+        # Replace non-alphanumeric characters with underscores
+        name = re.sub(r'[^a-zA-Z0-9]', '_', name)
+        # Remove multiple underscores
+        name = re.sub(r'_+', '_', name)
+        # Limit length
+        name = name[:50]
+        # Remove trailing underscores
+        name = name.strip('_')
+        return f"{name}.csv"
+    except:
+        return "scraped_products.csv"
+
+def save_status(req_id, status):
+    """Store a job's status for /progress on any web worker, with its stage timings and browser memory."""
+    stored = dict(status)
+    timings = METRICS.job_breakdown(req_id)
+    if timings:
+        # Seconds per stage (page_load, readiness_wait, card_extraction, ...) and counters
+        stored['timings'] = timings
+    memory = get_governor().job_report(req_id)
+    if memory:
+        # Browser RSS (current and peak), CPU seconds, browsers used and killed
+        stored['memory'] = memory
+    get_job_state().set_status(req_id, stored)
+
+def browser_scrape(url, lease, status_callback, row_sink, cursor, seen_ids, max_staleness=None, on_retry=None):
+    """Run the site's browser scraper after cursor['page'], redoing a failed page on a fresh driver.
+
+    cursor['page'] and cursor['count'] must be advanced by status_callback on
+    page_done; seen_ids holds the product identities already emitted.
+    """
+    retries = 0
+    while True:
+        driver = lease.acquire()
+        try:
+            if "nahdi" in url.lower():
+                return scrape_nahdi(driver, url, status_callback=status_callback, row_sink=row_sink,
+                                    max_staleness=max_staleness, start_page=cursor['page'] + 1,
+                                    start_count=cursor['count'], seen_ids=seen_ids)
+            if "al-dawaa" in url.lower():
+                return scrape_aldawaa(driver, url, status_callback=status_callback, row_sink=row_sink,
+                                      max_staleness=max_staleness, start_page=cursor['page'] + 1,
+                                      start_count=cursor['count'], seen_ids=seen_ids)
+            return 0
+        except (PageFailed, WebDriverException) as e:
+            # Only the failed page is redone, on a fresh browser
+            lease.discard()
+            retries += 1
+            if retries > PAGE_RETRIES:
+                raise
+            METRICS.count('page_retries')
+            print(f"{url}: {e}; retrying page {cursor['page'] + 1} with a fresh driver ({retries}/{PAGE_RETRIES})")
+            if on_retry:
+                on_retry(retries, e)
+
+def run_scrape_task(req_id, url, headless_mode, max_staleness=None, incremental=False, resume=False):
+    print(f"Task {'resumed' if resume else 'started'} for {req_id}")
+    start_time = time.time()
+    scheduler = get_scheduler()
+    store = get_store()
+    lease = DriverLease(get_pool(), headless_mode, req_id)
+    writer = None
+    # Latest status; every change is saved to the shared job state for /progress
+    status = {'page': 0, 'count': 0, 'status': 'starting'}
+    save_status(req_id, status)
+    # Last page whose rows are safely stored; retries and resumes continue after it
+    checkpoint = store.checkpoint(req_id) if resume else None
+    cursor = {'tier': None, 'page': 0, 'count': 0}
+    # Incremental mode diffs against the previous run of this category
+    delta = DeltaRun(get_history(), req_id, url, resume=resume) if incremental else None
+    try:
+        # Rows go to disk page by page; /download serves the partial file meanwhile
+        if checkpoint and checkpoint['tier'] == 'browser' and checkpoint['page'] > 0:
+            job = store.job(req_id)
+            filename = job['filename']
+            # Rows past the checkpoint belong to a page that never finished
+            store.truncate_rows(req_id, checkpoint['count'])
+            writer = CsvRowWriter(filename)
+            writer.write_rows({column: row.get(column) for column in job['columns']}
+                              for row in store.iter_rows(req_id))
+            cursor.update(tier='browser', page=checkpoint['page'], count=writer.count)
+            if delta:
+                delta.restore(store.iter_rows(req_id))
+            print(f"Req {req_id}: resuming after page {cursor['page']} with {writer.count} rows")
+        else:
+            # Jobs on the same category must not share (or evict) each other's CSV
+            name, ext = os.path.splitext(generate_filename_from_url(url))
+            filename = os.path.join(RESULTS_DIR, f"{name}_{req_id[:8]}{ext}")
+            writer = CsvRowWriter(filename)
+            store.create_job(req_id, url, filename)
+        store.save_checkpoint(req_id, status='running', tier=cursor['tier'], page=cursor['page'], count=writer.count,
+                              options={'headless': headless_mode, 'max_staleness': max_staleness,
+                                       'incremental': incremental}, error=None)
+        
+        def save_rows(rows):
+            store.add_rows(req_id, writer.write_rows(rows))
+            if delta:
+                delta.add_rows(rows)
+        
+        def update_status(page, count, event='page_started', **stats):
+            if scheduler.is_cancelled(req_id):
+                raise JobCancelled()
+            print(f"Req {req_id}: Page {page}, Count {count} ({event})")
+            if event == 'page_done':
+                cursor.update(page=page, count=count)
+                store.save_checkpoint(req_id, tier=cursor['tier'], page=page, count=count)
+            status.clear()
+            status.update(page=page, count=count, status='scraping', tier=cursor['tier'])
+            # time_saved, blocked_requests, bytes_saved, total_pages, cards, page_seconds
+            status.update(stats)
+            total_pages = stats.get('total_pages')
+            if total_pages:
+                pages_done = page if event == 'page_done' else page - 1
+                status['progress'] = min(100, round(pages_done * 100 / total_pages))
+            save_status(req_id, status)
+            JOB_EVENTS.publish(req_id, event, status)
+            if event == 'page_done' and delta and delta.page_done(page):
+                raise ScrapeComplete()
+
+        stopped_early = False
+        try:
+            fetched = None
+            if cursor['tier'] is None:
+                # Plain HTTP first; Chrome only when it finds no cards or hits a bot check
+                cursor['tier'] = 'http'
+                if delta:
+                    # Diffs and page fingerprints only count once the tier succeeds
+                    delta.hold()
+                fetched = fetch_category(url, status_callback=update_status, row_sink=save_rows,
+                                         max_staleness=max_staleness)
+                if fetched is None:
+                    # Drop any pages the HTTP tier wrote before it gave up
+                    writer.reset()
+                    store.clear_rows(req_id)
+                    if delta:
+                        delta.discard()
+                    cursor.update(tier='browser', page=0, count=0)
+                elif delta:
+                    delta.commit()
+
+            if fetched is None:
+                # Products already stored (by a resumed attempt) are never emitted again
+                seen_ids = {product_identity(row) for row in store.iter_rows(req_id)}
+                browser_scrape(
+                    url, lease, update_status, save_rows, cursor, seen_ids, max_staleness,
+                    on_retry=lambda retry, e: JOB_EVENTS.publish(
+                        req_id, 'retry', dict(status, retry=retry, error=str(e)))
+                )
+                lease.release()
+        except ScrapeComplete:
+            # The last pages matched the previous run; take the rest of the category from it
+            stopped_early = True
+            delta.commit()
+            carried = delta.carry_forward()
+            store.add_rows(req_id, writer.write_rows(carried))
+            print(f"Req {req_id}: unchanged since last run after page {cursor['page']}, "
+                  f"carried forward {len(carried)} rows")
+        diff_summary = delta.finish(stopped_early) if delta and writer.count else None
+        
+        writer.close()
+        
+        end_time = time.time()
+        elapsed_seconds = int(end_time - start_time)
+        mins, secs = divmod(elapsed_seconds, 60)
+        elapsed_str = f"{mins}m {secs}s"
+        
+        # Save results
+        if writer.count:
+            status = {
+                'status': 'completed',
+                'count': writer.count,
+                'page': status.get('page', 0),
+                'time_saved': status.get('time_saved', 0),
+                'blocked_requests': status.get('blocked_requests', 0),
+                'bytes_saved': status.get('bytes_saved', 0),
+                'tier': cursor['tier'],
+                'diff': diff_summary,
+                'progress': 100,
+                'elapsed': elapsed_str
+            }
+            store.save_checkpoint(req_id, status='completed')
+            save_status(req_id, status)
+            JOB_EVENTS.publish(req_id, 'completed', status)
+            print(f"Task {req_id} completed. Saved to {filename}")
+        else:
+            writer.close(remove_if_empty=True)
+            store.delete_job(req_id)
+            status.update(status='failed', error='No data found')
+            save_status(req_id, status)
+            JOB_EVENTS.publish(req_id, 'failed', status)
+            
+    except JobCancelled:
+        print(f"Task {req_id} cancelled")
+        store.save_checkpoint(req_id, status='cancelled')
+        status['status'] = 'cancelled'
+        save_status(req_id, status)
+        JOB_EVENTS.publish(req_id, 'cancelled', status)
+    except Exception as e:
+        print(f"Task {req_id} failed: {e}")
+        store.save_checkpoint(req_id, status='failed', error=str(e))
+        status.update(status='failed', error=str(e), resumable=cursor['tier'] == 'browser' and cursor['page'] > 0)
+        save_status(req_id, status)
+        JOB_EVENTS.publish(req_id, 'failed', status)
+    finally:
+        if writer is not None:
+            # Keep whatever was scraped before a failure or cancellation
+            writer.close()
+        lease.release()
+        get_governor().job_finished(req_id)
+
+def run_batch_task(req_id, urls, headless_mode, max_staleness=None, root=None):
+    """Scrape several category URLs into one CSV/result job, reporting progress per URL.
+
+    A root (sitemap or category page) is crawled here first and the categories
+    it lists are added to urls. Up to BATCH_CONCURRENCY worker threads pull
+    URLs from a queue; each keeps one pool driver across the categories it
+    scrapes. A URL that fails is recorded and the batch carries on with the rest.
+    """
+    start_time = time.time()
+    if root:
+        discovering = {'page': 0, 'count': 0, 'status': 'discovering', 'batch': True, 'urls_total': len(urls)}
+        save_status(req_id, discovering)
+        JOB_EVENTS.publish(req_id, 'discovering', discovering)
+        try:
+            urls = list(dict.fromkeys(list(urls) + discover_category_urls(root)))
+            error = None if urls else 'No category URLs found under the root'
+        except Exception as e:
+            # The reason can name internal hosts; it stays in the worker log
+            print(f"Batch {req_id}: could not read {root}: {e}")
+            error = 'Could not read the sitemap or category root'
+        if error:
+            failed = dict(discovering, status='failed', error=error)
+            save_status(req_id, failed)
+            JOB_EVENTS.publish(req_id, 'failed', failed)
+            return
+    print(f"Batch {req_id} started with {len(urls)} URLs")
+    scheduler = get_scheduler()
+    store = get_store()
+    pool = get_pool()
+    filename = os.path.join(RESULTS_DIR, f"batch_{req_id[:8]}.csv")
+    writer = CsvRowWriter(filename)
+    store.create_job(req_id, urls[0], filename)
+    url_status = [{'url': url, 'status': 'queued', 'count': 0, 'page': 0} for url in urls]
+    status_lock = threading.Lock()
+    pending = queue.Queue()
+    for index in range(len(urls)):
+        pending.put(index)
+
+    def batch_status(**extra):
+        with status_lock:
+            done = sum(1 for item in url_status if item['status'] in ('completed', 'failed'))
+            status = {'status': 'scraping', 'batch': True, 'count': writer.count, 'urls_done': done,
+                      'urls_total': len(urls), 'progress': round(done * 100 / len(urls)),
+                      'urls': [dict(item) for item in url_status]}
+        status.update(extra)
+        save_status(req_id, status)
+        return status
+
+    def publish_url(event, index):
+        JOB_EVENTS.publish(req_id, event, dict(batch_status(), url=dict(url_status[index])))
+
+    def save_rows(url, rows):
+        # Builders fill Category from the URL; make sure no combined row goes without one
+        category = extract_category_from_url(url)
+        rows = [
+            dict({column: row.get(column) for column in BATCH_COLUMNS},
+                 Category=row.get('Category') if row.get('Category') not in (None, '', 'Unknown Category') else category)
+            for row in rows
+        ]
+        store.add_rows(req_id, writer.write_rows(rows))
+
+    def scrape_url(index, lease):
+        url = url_status[index]['url']
+        cursor = {'tier': 'http', 'page': 0, 'count': 0}
+
+        def update_status(page, count, event='page_started', **stats):
+            if scheduler.is_cancelled(req_id):
+                raise JobCancelled()
+            if event == 'page_done':
+                cursor.update(page=page, count=count)
+            with status_lock:
+                url_status[index].update(page=page, count=count, tier=cursor['tier'],
+                                         total_pages=stats.get('total_pages'))
+            JOB_EVENTS.publish(req_id, event, dict(batch_status(), url=dict(url_status[index])))
+
+        # Rows are stored page by page; nothing of a category is held in memory but its product identities
+        seen_ids = set()
+
+        def save_category_rows(rows):
+            seen_ids.update(product_identity(row) for row in rows)
+            save_rows(url, rows)
+
+        if fetch_category(url, status_callback=update_status, row_sink=save_category_rows,
+                          max_staleness=max_staleness) is not None:
+            return
+        # The browser's page size and numbering can differ from the HTTP tier's, so it starts over at page 1.
+        # The rows already stored stay (they share the batch's file) and seen_ids keeps them from repeating.
+        cursor.update(tier='browser', page=0)
+        browser_scrape(
+            url, lease, update_status, save_category_rows, cursor, seen_ids, max_staleness,
+            on_retry=lambda retry, e: JOB_EVENTS.publish(
+                req_id, 'retry', dict(batch_status(), url=dict(url_status[index]), retry=retry, error=str(e)))
+        )
+
+    def worker():
+        lease = DriverLease(pool, headless_mode, req_id)
+        try:
+            with METRICS.bind_job(req_id):
+                work(lease)
+        finally:
+            lease.release()
+
+    def work(lease):
+        while not scheduler.is_cancelled(req_id):
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            with status_lock:
+                url_status[index]['status'] = 'running'
+            publish_url('url_started', index)
+            try:
+                scrape_url(index, lease)
+            except JobCancelled:
+                with status_lock:
+                    url_status[index]['status'] = 'cancelled'
+                return
+            except Exception as e:
+                print(f"Batch {req_id}: {url_status[index]['url']} failed: {e}")
+                with status_lock:
+                    url_status[index].update(status='failed', error=str(e))
+                publish_url('url_failed', index)
+                continue
+            with status_lock:
+                url_status[index]['status'] = 'completed'
+            publish_url('url_done', index)
+
+    try:
+        batch_status()
+        workers = []
+        for _ in range(min(BATCH_CONCURRENCY, pool.size, len(urls))):
+            # Every extra category in flight may need another Chrome
+            available = available_memory_mb()
+            if workers and available is not None and available < BROWSER_RESERVE_MB:
+                print(f"Batch {req_id}: {available:.0f} MB free, running {len(workers)} categories at a time")
+                break
+            thread = threading.Thread(target=worker, daemon=True)
+            thread.start()
+            workers.append(thread)
+        for thread in workers:
+            thread.join()
+        writer.close()
+
+        mins, secs = divmod(int(time.time() - start_time), 60)
+        if scheduler.is_cancelled(req_id):
+            print(f"Batch {req_id} cancelled")
+            state = 'cancelled'
+        elif writer.count:
+            print(f"Batch {req_id} completed. Saved to {filename}")
+            state = 'completed'
+        else:
+            state = 'failed'
+        status = batch_status(status=state, elapsed=f"{mins}m {secs}s")
+        if state == 'failed':
+            status['error'] = 'No data found'
+            writer.close(remove_if_empty=True)
+            store.delete_job(req_id)
+        JOB_EVENTS.publish(req_id, state, status)
+    except Exception as e:
+        print(f"Batch {req_id} failed: {e}")
+        JOB_EVENTS.publish(req_id, 'failed', batch_status(status='failed', error=str(e)))
+    finally:
+        writer.close()
+        get_governor().job_finished(req_id)
+
+
+# Task names the web workers queue -> functions the scrape workers run
+TASKS = {
+    'scrape': run_scrape_task,
+    'batch': run_batch_task,
+}
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Config is read at import time, so keep every store, cache and pid file out of the checkout
+_SCRATCH = tempfile.mkdtemp(prefix='sws-tests-')
+os.environ.update({
+    'RESULTS_DB': os.path.join(_SCRATCH, 'results.db'),
+    'RESULTS_DIR': _SCRATCH,
+    'PAGE_CACHE_DIR': os.path.join(_SCRATCH, 'page_cache'),
+    'MATCH_INDEX_DIR': os.path.join(_SCRATCH, 'match_index'),
+    'GOVERNOR_STATE_DIR': os.path.join(_SCRATCH, 'browser_pids'),
+    'GOVERNOR_SWEEP_ON_START': '0',
+    'GOVERNOR_INTERVAL': '0',
+    'DRIVER_POOL_PREWARM': '0',
+    'STRATEGY_CACHE': '0',
+    'SCHEDULER_POLL_SECONDS': '0.05',
+})
+
+import job_state
+import page_cache
+import price_history
+import result_store
+import scheduler
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(tmp_path, monkeypatch):
+    """Every test gets its own SQLite file for results, history and job state, and no page cache."""
+    path = str(tmp_path / 'results.db')
+    monkeypatch.setattr(result_store, '_STORE', result_store.ResultStore(path))
+    monkeypatch.setattr(price_history, '_HISTORY', price_history.PriceHistory(path))
+    monkeypatch.setattr(job_state, '_JOB_STATE', job_state.SqliteJobState(path))
+    monkeypatch.setattr(scheduler, '_SCHEDULER', scheduler.JobScheduler())
+    monkeypatch.setattr(page_cache, 'PAGE_CACHE', False)
+    return tmp_path
+
+
+def product(n, price='10.00'):
+    return {
+        'Product Name': f'Product {n}',
+        'Regular Price': '',
+        'Price After Discount': '',
+        'Price Without Discount': price,
+        'Discount %': '',
+        'Category': 'Vitamins',
+        'Image Link': f'https://www.nahdionline.com/en-sa/product-{n}/p/{100000 + n}',
+        'Source': 'Nahdi',
+    }
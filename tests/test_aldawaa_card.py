@@ -0,0 +1,59 @@
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+
+import scraper_lib
+import strategy_cache
+
+
+class FakeElement:
+    """A card whose find_element answers from a {selector: FakeElement} map."""
+
+    def __init__(self, text='', children=None, href=None):
+        self.text = text
+        self.children = children or {}
+        self.href = href
+
+    def find_element(self, by, selector):
+        if selector not in self.children:
+            raise NoSuchElementException(selector)
+        return self.children[selector]
+
+    def find_elements(self, by, selector):
+        return [child for child in self.children.values() if child.href] if selector == 'a' else []
+
+    def get_attribute(self, name):
+        return self.href if name == 'href' else None
+
+
+def card(**children):
+    link = FakeElement(href='https://www.al-dawaa.com/english/cerave-cream/p/1234')
+    return FakeElement(children=dict(children, link=link))
+
+
+@pytest.fixture(params=[False, True], ids=['no-cache', 'cache'])
+def strategies(request, tmp_path, monkeypatch):
+    cache = strategy_cache.StrategyCache(path=str(tmp_path / 'strategies.json')) if request.param else None
+    monkeypatch.setattr(strategy_cache, 'get_strategy_cache', lambda: cache)
+    return cache
+
+
+def test_first_present_selector_wins_even_when_empty(strategies):
+    # An empty name element and a price list with no old price read as the fixed selector order did
+    row = scraper_lib._read_aldawaa_card(card(**{
+        'product-name': FakeElement(''),
+        'a.product-item-link': FakeElement('CeraVe Cream'),
+        "[data-price-type='finalPrice'] .price": FakeElement('45.00'),
+    }), 'Skin Care')
+    assert row['Product Name'] == ''
+    assert row['Regular Price'] == '45.00'
+    assert row['Image Link'] == 'https://www.al-dawaa.com/english/cerave-cream/p/1234'
+
+
+def test_later_selector_used_when_earlier_one_is_missing(strategies):
+    row = scraper_lib._read_aldawaa_card(card(**{
+        'a.product-item-link': FakeElement('CeraVe Cream'),
+        '.price-section.total': FakeElement('60.00'),
+        "[data-price-type='finalPrice'] .price": FakeElement('45.00'),
+    }), 'Skin Care')
+    assert row['Product Name'] == 'CeraVe Cream'
+    assert (row['Regular Price'], row['Price After Discount']) == ('60.00', '45.00')
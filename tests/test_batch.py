@@ -0,0 +1,142 @@
+import pytest
+
+import app as web
+import http_fetch
+import tasks
+from conftest import product
+from job_state import get_job_state
+
+SITEMAP_INDEX = """<?xml version="1.0"?><sitemapindex>
+<sitemap><loc>https://www.nahdionline.com/sitemap-categories.xml</loc></sitemap>
+<sitemap><loc>http://169.254.169.254/latest/meta-data/</loc></sitemap>
+<sitemap><loc>https://nahdionline.com.evil.example/sitemap.xml</loc></sitemap>
+</sitemapindex>"""
+CATEGORIES = """<?xml version="1.0"?><urlset>
+<url><loc>https://www.nahdionline.com/en-sa/vitamins/plp/1</loc></url>
+<url><loc>https://www.nahdionline.com/en-sa/vitamin-c/pdp/55</loc></url>
+<url><loc>https://www.nahdionline.com/en-sa/baby-care/plp/2</loc></url>
+</urlset>"""
+
+
+@pytest.fixture(autouse=True)
+def live_worker():
+    get_job_state().heartbeat('test-worker', {'threads': 1})
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    served = {
+        'https://www.nahdionline.com/sitemap.xml': SITEMAP_INDEX,
+        'https://www.nahdionline.com/sitemap-categories.xml': CATEGORIES,
+    }
+    fetched = []
+
+    def fetch_html(url, max_staleness=None):
+        fetched.append(url)
+        return served[url]
+
+    monkeypatch.setattr(http_fetch, 'fetch_html', fetch_html)
+    return fetched
+
+
+@pytest.mark.parametrize('url, supported', [
+    ('https://www.nahdionline.com/en-sa/vitamins/plp/1', True),
+    ('https://al-dawaa.com/english/skin-care', True),
+    ('http://localhost:5500/nahdi', False),
+    ('https://nahdionline.com.evil.example/', False),
+    ('https://evil.example/al-dawaa.com', False),
+    ('file:///etc/passwd', False),
+])
+def test_supported_site(url, supported):
+    assert http_fetch.supported_site(url) is supported
+
+
+def test_discovery_only_follows_storefront_sitemaps(pages):
+    urls = http_fetch.discover_category_urls('https://www.nahdionline.com/sitemap.xml')
+    assert urls == ['https://www.nahdionline.com/en-sa/vitamins/plp/1',
+                    'https://www.nahdionline.com/en-sa/baby-care/plp/2']
+    assert pages == ['https://www.nahdionline.com/sitemap.xml',
+                     'https://www.nahdionline.com/sitemap-categories.xml']
+
+
+def test_discovery_refuses_other_hosts(pages):
+    with pytest.raises(ValueError):
+        http_fetch.discover_category_urls('http://127.0.0.1:8080/admin')
+    assert pages == []
+
+
+def test_batch_rejects_root_on_other_host(pages):
+    response = web.app.test_client().post('/batch', json={'root': 'http://169.254.169.254/latest/'})
+    assert response.status_code == 400
+    assert pages == []
+
+
+@pytest.mark.parametrize('url', ['http://169.254.169.254/latest?nahdi', 'http://10.0.0.5/al-dawaa/vitamins'])
+def test_batch_rejects_urls_that_only_mention_a_storefront(url):
+    response = web.app.test_client().post('/batch', json={'urls': [url]})
+    assert response.status_code == 400
+    assert response.get_json()['urls'] == [url]
+    assert get_job_state().jobs(('queued',)) == []
+
+
+def test_batch_hides_fetch_errors(monkeypatch):
+    def fail(url, max_staleness=None):
+        raise OSError('connect to 10.0.0.5:443 refused')
+
+    monkeypatch.setattr(http_fetch, 'fetch_html', fail)
+    tasks.run_batch_task('batch', [], True, root='https://www.nahdionline.com/sitemap.xml')
+    status = get_job_state().get_status('batch')
+    assert status['status'] == 'failed'
+    assert '10.0.0.5' not in status['error']
+
+
+def test_batch_root_is_crawled_by_the_worker(pages, monkeypatch):
+    response = web.app.test_client().post('/batch', json={'root': 'https://www.nahdionline.com/sitemap.xml'})
+    assert response.status_code == 200
+    # Nothing is fetched inside the web request
+    assert pages == []
+    req_id = response.get_json()['req_id']
+    assert get_job_state().job(req_id)['args'][4] == 'https://www.nahdionline.com/sitemap.xml'
+
+    scraped = []
+
+    def fetch_category(url, status_callback=None, row_sink=None, max_staleness=None):
+        scraped.append(url)
+        row_sink([product(len(scraped))])
+        return 1
+
+    monkeypatch.setattr(tasks, 'fetch_category', fetch_category)
+    tasks.run_batch_task(req_id, [], True, root='https://www.nahdionline.com/sitemap.xml')
+    status = get_job_state().get_status(req_id)
+    assert status['status'] == 'completed'
+    assert sorted(scraped) == ['https://www.nahdionline.com/en-sa/baby-care/plp/2',
+                               'https://www.nahdionline.com/en-sa/vitamins/plp/1']
+
+
+def test_sitemap_discovery_keeps_only_listing_pages(monkeypatch):
+    sitemap = """<?xml version="1.0"?><urlset>
+<url><loc>https://www.al-dawaa.com/english/skin-care</loc></url>
+<url><loc>https://www.al-dawaa.com/english/customer/account</loc></url>
+<url><loc>https://www.al-dawaa.com/english/about-us</loc></url>
+<url><loc>https://www.al-dawaa.com/english/cerave-cream/p/1234</loc></url>
+<url><loc>https://www.al-dawaa.com/media/banner.jpg</loc></url>
+</urlset>"""
+    monkeypatch.setattr(http_fetch, 'fetch_html', lambda url, max_staleness=None: sitemap)
+    assert http_fetch.discover_category_urls('https://www.al-dawaa.com/sitemap.xml') == [
+        'https://www.al-dawaa.com/english/skin-care']
+
+
+def test_discovery_stops_after_max_fetches(monkeypatch):
+    fetched = []
+
+    def endless_index(url, max_staleness=None):
+        fetched.append(url)
+        return (f'<?xml version="1.0"?><sitemapindex><sitemap><loc>https://www.nahdionline.com/sitemap-{len(fetched)}-a.xml'
+                f'</loc></sitemap><sitemap><loc>https://www.nahdionline.com/sitemap-{len(fetched)}-b.xml</loc></sitemap>'
+                '</sitemapindex>')
+
+    monkeypatch.setattr(http_fetch, 'fetch_html', endless_index)
+    assert http_fetch.discover_category_urls('https://www.nahdionline.com/sitemap.xml', max_fetches=5) == []
+    assert len(fetched) == 5
+    assert http_fetch.discover_category_urls('https://www.nahdionline.com/sitemap.xml', max_seconds=0) == []
+    assert len(fetched) == 6
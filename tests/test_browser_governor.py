@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import browser_governor
+
+
+class FakeDriver:
+    pass
+
+
+@pytest.fixture
+def cpu(monkeypatch):
+    """Pretend each driver is one process whose cumulative CPU the test sets."""
+    usage = {'seconds': 0.0}
+    monkeypatch.setattr(browser_governor, 'driver_pids', lambda driver: [4242])
+    monkeypatch.setattr(browser_governor, 'process_stat',
+                        lambda pid: {'start': 1, 'cpu_seconds': usage['seconds'], 'ppid': 1})
+    monkeypatch.setattr(browser_governor, 'process_rss_mb', lambda pid: 100.0)
+    return usage
+
+
+@pytest.fixture
+def governor(tmp_path, monkeypatch):
+    governor = browser_governor.BrowserGovernor(max_rss_mb=1000, max_cpu_seconds=100, interval=0,
+                                                state_dir=str(tmp_path))
+    killed = []
+    monkeypatch.setattr(governor, '_kill_browser', lambda driver, reason, kind: killed.append(kind))
+    governor.killed = killed
+    return governor
+
+
+def test_a_long_lived_pooled_browser_is_judged_per_job(cpu, governor):
+    driver = FakeDriver()
+    governor.track(driver)
+    # Many earlier jobs used 500s of CPU between them
+    for n in range(10):
+        governor.assign(driver, f'job-{n}')
+        cpu['seconds'] += 50
+        governor.check()
+        governor.assign(driver, None)
+    assert governor.killed == []
+    assert governor.job_report('job-9')['cpu_seconds'] == 50
+
+    governor.assign(driver, 'runaway')
+    cpu['seconds'] += 150
+    governor.check()
+    assert governor.killed == ['cpu']
+    assert governor.job_report('runaway')['cpu_seconds'] == 150
+
+
+def test_memory_limit_still_applies(cpu, governor, monkeypatch):
+    driver = FakeDriver()
+    governor.track(driver)
+    governor.assign(driver, 'job')
+    monkeypatch.setattr(browser_governor, 'process_rss_mb', lambda pid: 2000.0)
+    governor.check()
+    assert governor.killed == ['rss']
+
+
+def test_startup_sweep_only_reaps_browsers_of_dead_owners(tmp_path, monkeypatch):
+    live_owner, dead_owner = 100, 200
+    stats = {live_owner: {'start': 10}, 11: {'start': 11}, 21: {'start': 21}, 22: {'start': 99}}
+    monkeypatch.setattr(browser_governor, 'process_stat', lambda pid: stats.get(pid))
+    killed = []
+    monkeypatch.setattr(browser_governor, 'kill_processes', lambda pids, starts: killed.extend(pids) or len(pids))
+    for owner, pids in ((live_owner, {'11': 11}), (dead_owner, {'21': 21, '22': 22})):
+        with open(tmp_path / f'{owner}.json', 'w') as f:
+            json.dump({'owner': owner, 'owner_start': 10 if owner == live_owner else 20, 'pids': pids}, f)
+
+    governor = browser_governor.BrowserGovernor(interval=0, state_dir=str(tmp_path))
+    assert governor.sweep_stale() == 1
+    # 11 belongs to a live worker; 22's pid was recycled by something else
+    assert killed == [21]
+    assert (tmp_path / f'{live_owner}.json').exists()
+    assert not (tmp_path / f'{dead_owner}.json').exists()
@@ -0,0 +1,30 @@
+from driver_pool import DriverPool
+from sites import STOREFRONT_ORIGINS
+
+
+class RecordingDriver:
+    def __init__(self):
+        self.cdp = []
+
+    def delete_all_cookies(self):
+        pass
+
+    def execute_cdp_cmd(self, command, params):
+        self.cdp.append((command, params))
+
+    def execute_script(self, script):
+        pass
+
+    def get(self, url):
+        pass
+
+
+def test_reset_clears_every_storefront_but_keeps_the_http_cache():
+    driver = RecordingDriver()
+    DriverPool(factory=lambda headless: driver)._reset(driver)
+
+    commands = [command for command, _ in driver.cdp]
+    assert 'Network.clearBrowserCookies' in commands
+    assert 'Network.clearBrowserCache' not in commands
+    cleared = [params['origin'] for command, params in driver.cdp if command == 'Storage.clearDataForOrigin']
+    assert cleared == list(STOREFRONT_ORIGINS)
@@ -0,0 +1,101 @@
+import os
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+import http_fetch
+from metrics import METRICS
+from product_ids import product_identity
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench_fixtures')
+NAHDI_URL = 'https://www.nahdionline.com/en-sa/baby-care'
+ALDAWAA_URL = 'https://www.al-dawaa.com/english/{}'
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """Serve bench_fixtures in place of the storefronts; returns the URLs fetched."""
+    fetched = []
+
+    def fetch_html(url, max_staleness=None):
+        fetched.append(url)
+        parts = urlparse(url)
+        if 'nahdionline' in parts.netloc:
+            directory, page = 'nahdi/baby-care', parse_qs(parts.query).get('page', ['1'])[0]
+        else:
+            directory, page = f"aldawaa/{parts.path.rstrip('/').rsplit('/', 1)[-1]}", parse_qs(parts.query).get('p', ['1'])[0]
+        path = os.path.join(FIXTURES, directory, f'page-{page}.html')
+        if not os.path.exists(path):
+            path = os.path.join(FIXTURES, directory, 'empty.html')
+        if not os.path.exists(path):
+            return '<!DOCTYPE html><html><body></body></html>'
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    monkeypatch.setattr(http_fetch, 'fetch_html', fetch_html)
+    return fetched
+
+
+def test_nahdi_reads_every_page_until_an_empty_one(served):
+    rows = http_fetch.fetch_nahdi(NAHDI_URL)
+    assert len(rows) == 96
+    assert len({product_identity(row) for row in rows}) == 96
+    assert all(row['Source'] == 'Nahdi' and row['Image Link'] for row in rows)
+    assert [parse_qs(urlparse(url).query)['page'][0] for url in served] == ['1', '2', '3', '4', '5']
+
+
+def test_nahdi_streams_rows_and_reports_pages(served):
+    batches, done = [], []
+
+    def status_callback(page, count, event, **details):
+        if event == 'page_done':
+            done.append((page, count))
+
+    assert http_fetch.fetch_nahdi(NAHDI_URL, status_callback=status_callback, row_sink=batches.append) == 96
+    assert [len(batch) for batch in batches] == [24, 24, 24, 24]
+    assert done == [(1, 24), (2, 48), (3, 72), (4, 96)]
+
+
+@pytest.mark.parametrize('category', ['vitamins', 'skin-care'])
+def test_aldawaa_follows_the_pager(served, category):
+    rows = http_fetch.fetch_aldawaa(ALDAWAA_URL.format(category))
+    assert len(rows) == 60
+    assert len({product_identity(row) for row in rows}) == 60
+    assert all(row['Source'] == 'Al-Dawaa' for row in rows)
+
+
+def test_empty_first_page_falls_back_to_the_browser(served, monkeypatch):
+    monkeypatch.setattr(http_fetch, 'fetch_html', lambda url, max_staleness=None: '<html><body></body></html>')
+    assert http_fetch.fetch_nahdi(NAHDI_URL) is None
+    assert http_fetch.fetch_category(NAHDI_URL) is None
+
+
+def test_bot_challenge_falls_back_to_the_browser(monkeypatch):
+    def challenged(url, max_staleness=None):
+        raise http_fetch.BotChallenge(f"Bot challenge on {url} (HTTP 403)")
+
+    monkeypatch.setattr(http_fetch, 'fetch_html', challenged)
+    assert http_fetch.fetch_category(NAHDI_URL) is None
+    assert ['fallbacks', [['path', 'browser'], ['reason', 'bot_challenge']]] in [
+        counter[:2] for counter in METRICS.snapshot()['counters']]
+
+
+@pytest.mark.parametrize('status, html, challenged', [
+    (403, '', True),
+    (200, '<html><title>Just a moment...</title></html>', True),
+    (200, '<html><body>Baby care</body></html>', False),
+])
+def test_looks_like_challenge(status, html, challenged):
+    assert http_fetch.looks_like_challenge(status, html) is challenged
+
+
+def test_http_tier_can_be_switched_off(served, monkeypatch):
+    monkeypatch.setattr(http_fetch, 'HTTP_FETCH', False)
+    assert http_fetch.fetch_category(NAHDI_URL) is None
+    assert served == []
+
+
+@pytest.mark.parametrize('url', ['http://127.0.0.1:8080/nahdi/admin', 'http://169.254.169.254/latest?al-dawaa'])
+def test_other_hosts_are_never_fetched(served, url):
+    assert http_fetch.fetch_category(url) is None
+    assert served == []
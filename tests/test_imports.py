@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(statement):
+    code = f"import sys; {statement}; print(' '.join(sorted(sys.modules)))"
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                          cwd=ROOT).stdout.split()
+
+
+def test_web_app_never_imports_the_browser_stack():
+    modules = loaded_modules('import app')
+    heavy = [name for name in modules if name.split('.')[0] in
+             ('selenium', 'undetected_chromedriver', 'webdriver_manager', 'pandas', 'scraper_lib')]
+    assert heavy == []
@@ -0,0 +1,95 @@
+import os
+from urllib.parse import urlparse, parse_qs
+
+from bs4 import BeautifulSoup
+
+import scraper_lib
+from http_fetch import _nahdi_raw_from_html
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench_fixtures', 'nahdi',
+                        'baby-care')
+URL = 'https://www.nahdionline.com/en-sa/baby-care'
+
+
+def fixture_html(url):
+    page = parse_qs(urlparse(url).query).get('page', ['1'])[0]
+    path = os.path.join(FIXTURES, f'page-{page}.html')
+    if not os.path.exists(path):
+        path = os.path.join(FIXTURES, 'empty.html')
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class FakeTabbedDriver:
+    """Serves the Nahdi fixtures to scraper_lib with one URL per tab and a log of what happened."""
+
+    def __init__(self):
+        self.urls = {'tab-0': None}
+        self.current_window_handle = 'tab-0'
+        self.log = []
+        self.switch_to = self
+
+    # switch_to
+    def new_window(self, kind):
+        handle = f'tab-{len(self.urls)}'
+        self.urls[handle] = None
+        self.current_window_handle = handle
+
+    def window(self, handle):
+        self.current_window_handle = handle
+
+    def close(self):
+        del self.urls[self.current_window_handle]
+
+    def _soup(self):
+        return BeautifulSoup(fixture_html(self.urls[self.current_window_handle]), 'html.parser')
+
+    def get(self, url):
+        self.urls[self.current_window_handle] = url
+        self.log.append(('load', url))
+
+    def execute_script(self, script, *args):
+        if 'window.location.href' in script:
+            self.get(args[0])
+        elif '__swsPending' in script:
+            return True
+        elif script == scraper_lib.NAHDI_CARDS_JS:
+            url = self.urls[self.current_window_handle]
+            self.log.append(('read', url))
+            return [_nahdi_raw_from_html(card, url) for card in args[0]]
+        return None
+
+    def execute_async_script(self, script, *args):
+        return {'cards': 0, 'timed_out': False}
+
+    def find_elements(self, by, selector):
+        return self._soup().select(selector)
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def execute_cdp_cmd(self, command, params):
+        return {}
+
+    def get_log(self, kind):
+        return []
+
+
+def test_tabs_load_a_wave_of_pages_before_reading_and_merge_in_page_order():
+    sequential = scraper_lib.scrape_nahdi(FakeTabbedDriver(), URL, concurrency=1)
+    driver = FakeTabbedDriver()
+    pages_done = []
+    rows = scraper_lib.scrape_nahdi(
+        driver, URL, concurrency=3,
+        status_callback=lambda page, count, event='page_started', **stats:
+            pages_done.append((page, count)) if event == 'page_done' else None
+    )
+
+    assert len(rows) == 96
+    assert [row['Product Name'] for row in rows] == [row['Product Name'] for row in sequential]
+    assert pages_done == [(1, 24), (2, 48), (3, 72), (4, 96)]
+    # Pages 1-3 were all requested before the first one was read
+    assert [kind for kind, _ in driver.log[:4]] == ['load', 'load', 'load', 'read']
+    # Extra tabs are closed again
+    assert list(driver.urls) == ['tab-0']
+
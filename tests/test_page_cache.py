@@ -0,0 +1,95 @@
+import gzip
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from page_cache import PageCache, normalize_url
+
+URL = 'https://www.nahdionline.com/en-sa/vitamins/plp/1?page=2'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PageCache(directory=str(tmp_path / 'cache'), ttl=60, max_mb=1)
+
+
+def age(cache, url, kind, seconds):
+    """Backdate an entry as if it had been fetched seconds ago."""
+    path = cache._path(url, kind)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        entry = json.load(f)
+    entry['fetched_at'] = time.time() - seconds
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(entry, f)
+
+
+def test_normalized_urls_share_an_entry(cache):
+    cache.put(URL, 'html', '<html>2</html>')
+    assert cache.get('https://WWW.nahdionline.com/en-sa/vitamins/plp/1/?utm_source=x&page=2#top', 'html') == \
+        '<html>2</html>'
+    assert cache.get(URL, 'rows') is None
+    assert normalize_url('https://a.com/x?b=2&a=1&gclid=z') == 'https://a.com/x?a=1&b=2'
+
+
+def test_entries_expire_after_the_ttl_or_the_callers_max_staleness(cache):
+    cache.put(URL, 'html', 'fresh')
+    assert cache.get(URL, 'html') == 'fresh'
+    assert cache.get(URL, 'html', max_age=0) is None
+
+    age(cache, URL, 'html', 30)
+    assert cache.get(URL, 'html', max_age=10) is None
+    assert cache.get(URL, 'html') == 'fresh'
+    # max_staleness can't stretch the TTL
+    age(cache, URL, 'html', 90)
+    assert cache.get(URL, 'html', max_age=3600) is None
+
+
+def test_eviction_drops_least_recently_used_entries_over_the_budget(cache):
+    cache.max_bytes = 3 * 1024
+    payload = os.urandom(900).hex()
+    urls = [f'https://www.nahdionline.com/en-sa/c/plp/{n}' for n in range(6)]
+    for n, url in enumerate(urls):
+        cache.put(url, 'html', payload)
+        path = cache._path(url, 'html')
+        os.utime(path, (time.time() - 100 + n, time.time() - 100 + n))
+    # Reading the oldest entry makes it the most recently used
+    assert cache.get(urls[0], 'html') == payload
+    cache._evict()
+
+    kept = [url for url in urls if os.path.exists(cache._path(url, 'html'))]
+    assert urls[0] in kept
+    assert urls[1] not in kept
+    assert urls[-1] in kept
+    assert sum(os.path.getsize(cache._path(url, 'html')) for url in kept) <= cache.max_bytes
+
+
+def test_entries_long_past_the_ttl_are_removed(cache):
+    cache.put(URL, 'html', 'old')
+    path = cache._path(URL, 'html')
+    os.utime(path, (time.time() - 1000, time.time() - 1000))
+    cache._evict()
+    assert not os.path.exists(path)
+
+
+def _write_many(directory, worker):
+    cache = PageCache(directory=directory, ttl=60, max_mb=50)
+    for n in range(150):
+        cache.put(URL, 'html', f'{worker}:' + 'x' * 20000)
+
+
+def test_processes_writing_the_same_entry_never_corrupt_it(cache, capfd):
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_write_many, args=(cache.directory, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert 'write failed' not in capfd.readouterr().out
+    html = cache.get(URL, 'html')
+    assert html is not None and html.split(':')[0] in {'0', '1', '2', '3'}
+    assert len(html) == 20002
+    assert not [name for name in os.listdir(cache.directory) if name.endswith('.tmp')]
@@ -0,0 +1,45 @@
+import json
+
+import app as web
+import events
+from events import JOB_EVENTS
+from job_state import get_job_state
+from scheduler import get_scheduler
+
+
+def read_event(chunks):
+    for chunk in chunks:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith(':'):
+            continue
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+        return fields['event'], json.loads(fields['data'])
+
+
+def test_stream_reports_queue_position_until_the_job_starts(monkeypatch):
+    monkeypatch.setattr(web, 'QUEUE_UPDATE_SECONDS', 0.1)
+    monkeypatch.setattr(events, 'EVENT_POLL_SECONDS', 0.05)
+    state = get_job_state()
+    state.heartbeat('w1', {'threads': 1})
+    scheduler = get_scheduler()
+    for req_id in ('first', 'second'):
+        state.set_status(req_id, {'page': 0, 'count': 0, 'status': 'queued'})
+        scheduler.submit(req_id, 'scrape', [])
+
+    response = web.app.test_client().get('/progress/second/stream')
+    chunks = iter(response.response)
+
+    event, data = read_event(chunks)
+    assert event == 'status'
+    assert data['status'] == 'queued'
+    assert data['queue_position'] == 2
+
+    state.claim('w1')
+    event, data = read_event(chunks)
+    assert event == 'queued'
+    assert data['queue_position'] == 1
+    assert data['queued_jobs'] == 1
+
+    JOB_EVENTS.publish('second', 'cancelled', {'page': 0, 'count': 0, 'status': 'cancelled'})
+    assert read_event(chunks) == ('cancelled', {'page': 0, 'count': 0, 'status': 'cancelled'})
+    response.close()
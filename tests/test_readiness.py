@@ -0,0 +1,64 @@
+import pytest
+from selenium.common.exceptions import JavascriptException, WebDriverException
+
+import scraper_lib
+
+
+class FakeDriver:
+    """Answers execute_async_script with the queued outcomes: an exception to raise or a result."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def set_script_timeout(self, seconds):
+        pass
+
+    def execute_async_script(self, script, *args):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else JavascriptException('document unloaded')
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(scraper_lib, 'SITE_READINESS',
+                        {'nahdi': dict(scraper_lib.SITE_READINESS['nahdi'], timeout=0.3, min_jitter=0)})
+    monkeypatch.setattr(scraper_lib, 'READINESS_FALLBACK_WAIT', 2)
+    real_sleep = scraper_lib.time.sleep
+
+    def sleep(seconds):
+        slept.append(seconds)
+        real_sleep(min(seconds, 0.1))
+
+    monkeypatch.setattr(scraper_lib.time, 'sleep', sleep)
+    return slept
+
+
+def test_navigation_mid_check_reruns_the_check_on_the_new_document(sleeps):
+    driver = FakeDriver(JavascriptException('javascript error: document unloaded while waiting for result'),
+                        {'cards': 24, 'timed_out': False})
+    ready = scraper_lib.wait_for_page_ready(driver, 'nahdi')
+    assert driver.calls == 2
+    assert ready['cards'] == 24
+    assert not ready['timed_out']
+    assert 2 not in sleeps
+
+
+def test_falls_back_to_a_bounded_sleep_only_after_the_deadline(sleeps):
+    driver = FakeDriver()
+    ready = scraper_lib.wait_for_page_ready(driver, 'nahdi')
+    assert driver.calls > 1
+    assert ready['timed_out']
+    assert sleeps[-1] == 2
+
+
+def test_a_broken_browser_is_not_waited_on(sleeps):
+    driver = FakeDriver(WebDriverException('invalid session id'))
+    ready = scraper_lib.wait_for_page_ready(driver, 'nahdi')
+    assert driver.calls == 1
+    assert ready['timed_out']
+    assert 2 not in sleeps
@@ -0,0 +1,55 @@
+import pytest
+
+import app as web
+from conftest import product
+from result_store import get_store
+
+REQ_ID = 'results-job'
+
+
+@pytest.fixture
+def client():
+    store = get_store()
+    store.create_job(REQ_ID, 'https://www.nahdionline.com/en-sa/vitamins/plp/123', None)
+    rows = [dict(product(n, price=f'{n * 5}.00'), **{'No.': n}) for n in range(1, 8)]
+    rows[2].update({'Regular Price': '30.00', 'Price After Discount': '12.00', 'Price Without Discount': '',
+                    'Discount %': 'Save 20%'})
+    rows[5].update({'Source': 'Al-Dawaa', 'Category': 'Skin Care', 'Product Name': 'Sunscreen'})
+    store.add_rows(REQ_ID, rows)
+    return web.app.test_client()
+
+
+def results(client, **args):
+    response = client.get(f'/api/results/{REQ_ID}', query_string=args)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_pages_in_row_order(client):
+    data = results(client, page=2, per_page=3)
+    assert data['total'] == 7
+    assert [row['No.'] for row in data['rows']] == [4, 5, 6]
+    assert data['columns'][0] == 'Product Name'
+
+
+def test_sorts_by_effective_price(client):
+    data = results(client, sort='price', order='desc', per_page=3)
+    assert [row['No.'] for row in data['rows']] == [7, 6, 5]
+    assert [row['No.'] for row in results(client, sort='price')['rows']][:3] == [1, 2, 3]
+
+
+def test_filters(client):
+    assert [row['No.'] for row in results(client, discounted='true')['rows']] == [3]
+    assert [row['No.'] for row in results(client, min_price=20, max_price=26)['rows']] == [4, 5]
+    assert [row['No.'] for row in results(client, source='Al-Dawaa')['rows']] == [6]
+    assert [row['No.'] for row in results(client, q='sunscreen')['rows']] == [6]
+
+
+def test_facets(client):
+    assert results(client, facets='true')['facets'] == {
+        'sources': ['Al-Dawaa', 'Nahdi'], 'categories': ['Skin Care', 'Vitamins']}
+
+
+def test_bad_requests(client):
+    assert client.get(f'/api/results/{REQ_ID}?min_price=cheap').status_code == 400
+    assert client.get('/api/results/missing').status_code == 404
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import app as web
+import worker
+from events import JOB_EVENTS
+from job_state import get_job_state
+from result_store import get_store
+from scheduler import get_scheduler
+
+
+def test_claim_runs_lower_priority_numbers_first_then_fifo():
+    scheduler = get_scheduler()
+    scheduler.submit('later', 'scrape', ['a'], priority=10)
+    scheduler.submit('urgent', 'scrape', ['b'], priority=1)
+    scheduler.submit('last', 'scrape', ['c'], priority=10)
+    state = get_job_state()
+
+    claimed = [state.claim('w1') for _ in range(4)]
+    assert [job and job['req_id'] for job in claimed] == ['urgent', 'later', 'last', None]
+    assert claimed[0]['args'] == ['b']
+    assert state.job('urgent')['state'] == 'running'
+    assert state.job('urgent')['worker'] == 'w1'
+
+
+def test_concurrent_claims_never_share_a_job():
+    scheduler = get_scheduler()
+    for n in range(40):
+        scheduler.submit(f'job-{n}', 'scrape', [])
+    state = get_job_state()
+    claimed = []
+    lock = threading.Lock()
+
+    def claim_all(name):
+        while True:
+            job = state.claim(name)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job['req_id'])
+
+    threads = [threading.Thread(target=claim_all, args=(f'w{n}',)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(f'job-{n}' for n in range(40))
+
+
+def test_cancel_drops_queued_jobs_and_flags_running_ones():
+    scheduler = get_scheduler()
+    scheduler.submit('running', 'scrape', [])
+    scheduler.submit('queued', 'scrape', [])
+    get_job_state().claim('w1')
+
+    assert scheduler.cancel('queued') == 'cancelled'
+    assert scheduler.cancel('running') == 'cancelling'
+    assert scheduler.is_cancelled('running')
+    assert scheduler.is_active('running')
+    assert not scheduler.is_active('queued')
+    assert get_job_state().claim('w1') is None
+    assert scheduler.cancel('unknown') is None
+
+
+def test_queue_info_counts_jobs_ahead():
+    scheduler = get_scheduler()
+    get_job_state().heartbeat('w1', {'threads': 1})
+    for n in range(3):
+        scheduler.submit(f'job-{n}', 'scrape', [])
+    get_job_state().claim('w1')
+
+    info = scheduler.queue_info('job-2')
+    assert info['queue_position'] == 2
+    assert info['queued_jobs'] == 2
+    assert info['estimated_start'] > 0
+    assert scheduler.queue_info('job-0') is None
+
+
+def test_jobs_of_a_dead_worker_are_reaped_and_failed():
+    state = get_job_state()
+    scheduler = get_scheduler()
+    scheduler.submit('orphan', 'scrape', [])
+    scheduler.submit('healthy', 'scrape', [])
+    state.claim('dead-worker')
+    state.claim('live-worker')
+    state.heartbeat('live-worker', {'threads': 1})
+    state.set_status('orphan', {'page': 3, 'count': 60, 'status': 'scraping'})
+    get_store().create_job('orphan', 'https://www.nahdionline.com/en-sa/vitamins/plp/1', 'orphan.csv')
+    get_store().save_checkpoint('orphan', status='running', tier='browser', page=3, count=60)
+
+    worker.fail_abandoned()
+
+    status = state.get_status('orphan')
+    assert status['status'] == 'failed'
+    assert status['resumable'] is True
+    assert 'dead-worker' in status['error']
+    assert state.job('orphan')['state'] == 'done'
+    assert state.job('healthy')['state'] == 'running'
+    assert [event for _, event, _ in state.events_after('orphan', 0)] == ['failed']
+    assert get_store().checkpoint('orphan')['status'] == 'failed'
+
+
+def test_stale_heartbeats_do_not_count_as_live():
+    state = get_job_state()
+    state.heartbeat('old', {'threads': 2})
+    assert 'old' in state.workers()
+    assert state.workers(max_age=-1) == {}
+
+
+def test_expired_jobs_are_evicted_but_active_ones_kept():
+    state = get_job_state()
+    scheduler = get_scheduler()
+    scheduler.submit('running', 'scrape', [])
+    state.claim('w1')
+    state.set_status('running', {'status': 'scraping'})
+    state.set_status('finished', {'status': 'completed'})
+    JOB_EVENTS.publish('finished', 'completed', {'status': 'completed'})
+    time.sleep(0.01)
+
+    assert worker.evict_expired(ttl=0) == 1
+    assert state.get_status('finished') is None
+    assert state.events_after('finished', 0) == []
+    assert state.get_status('running') is not None
+
+
+def test_submitting_without_a_live_worker_fails_fast():
+    client = web.app.test_client()
+    response = client.post('/scrape', data={'url': 'https://www.nahdionline.com/en-sa/vitamins/plp/1'})
+    assert response.status_code == 503
+    assert get_job_state().jobs(('queued',)) == []
+
+    get_job_state().heartbeat('w1', {'threads': 1})
+    response = client.post('/scrape', data={'url': 'https://www.nahdionline.com/en-sa/vitamins/plp/1'})
+    assert response.status_code == 200
+    assert get_job_state().job(response.get_json()['req_id'])['state'] == 'queued'
+
+
+def test_scrape_rejects_urls_off_the_storefronts():
+    get_job_state().heartbeat('w1', {'threads': 1})
+    response = web.app.test_client().post('/scrape', data={'url': 'http://169.254.169.254/latest?nahdi'})
+    assert response.status_code == 400
+    assert get_job_state().jobs(('queued',)) == []
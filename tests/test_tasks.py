@@ -0,0 +1,144 @@
+import functools
+import os
+
+import tasks
+from conftest import product
+from job_state import get_job_state
+from price_history import DeltaRun, get_history
+from result_store import get_store
+from product_ids import product_identity
+
+URL = 'https://www.nahdionline.com/en-sa/vitamins/plp/123'
+PAGES = [[product(page * 10 + n) for n in range(3)] for page in range(1, 5)]
+
+
+def emit_pages(pages, status_callback, row_sink):
+    count = 0
+    for page, rows in enumerate(pages, start=1):
+        status_callback(page, count)
+        row_sink(rows)
+        count += len(rows)
+        status_callback(page, count, event='page_done')
+
+
+def test_browser_fallback_scrapes_every_page_after_http_gives_up(monkeypatch):
+    def http_then_give_up(url, status_callback=None, row_sink=None, max_staleness=None):
+        emit_pages(PAGES[:2], status_callback, row_sink)
+        return None
+
+    browser_pages = []
+
+    def browser(url, lease, status_callback, row_sink, cursor, seen_ids, max_staleness=None, on_retry=None):
+        def track(page, count, event='page_started', **stats):
+            if event == 'page_done':
+                browser_pages.append(page)
+            status_callback(page, count, event, **stats)
+        emit_pages(PAGES, track, row_sink)
+
+    monkeypatch.setattr(tasks, 'fetch_category', http_then_give_up)
+    monkeypatch.setattr(tasks, 'browser_scrape', browser)
+
+    tasks.run_scrape_task('job-1', URL, True, incremental=True)
+
+    status = get_job_state().get_status('job-1')
+    total = sum(len(rows) for rows in PAGES)
+    assert status['status'] == 'completed'
+    assert status['tier'] == 'browser'
+    assert browser_pages == [1, 2, 3, 4]
+    assert status['count'] == total
+    assert [row['Product Name'] for row in get_store().iter_rows('job-1')] == \
+        [row['Product Name'] for rows in PAGES for row in rows]
+    # Every product is new exactly once; the HTTP attempt left no diffs behind
+    assert status['diff']['new'] == total
+    assert get_history().diff('job-1')['summary']['new'] == total
+
+
+def test_incremental_run_scrapes_every_page_by_default(monkeypatch):
+    pages = [list(rows) for rows in PAGES]
+
+    def http(url, status_callback=None, row_sink=None, max_staleness=None):
+        emit_pages(pages, status_callback, row_sink)
+        return sum(len(rows) for rows in pages)
+
+    monkeypatch.setattr(tasks, 'fetch_category', http)
+    tasks.run_scrape_task('first', URL, True, incremental=True)
+    # Only the last page changes, well past the unchanged leading pages
+    pages[3] = [product(40, price='12.50')] + pages[3][1:]
+    tasks.run_scrape_task('second', URL, True, incremental=True)
+
+    diff = get_job_state().get_status('second')['diff']
+    assert diff['price_changed'] == 1
+    assert diff['carried_rows'] == 0
+    assert diff['carried_after_page'] is None
+
+
+def test_incremental_run_stops_early_when_opted_in(monkeypatch):
+    def http(url, status_callback=None, row_sink=None, max_staleness=None):
+        emit_pages(PAGES, status_callback, row_sink)
+        return sum(len(rows) for rows in PAGES)
+
+    monkeypatch.setattr(tasks, 'fetch_category', http)
+    monkeypatch.setattr(tasks, 'DeltaRun', functools.partial(DeltaRun, stop_after=2))
+    tasks.run_scrape_task('first', URL, True, incremental=True)
+    tasks.run_scrape_task('second', URL, True, incremental=True)
+
+    status = get_job_state().get_status('second')
+    assert status['status'] == 'completed'
+    assert status['count'] == sum(len(rows) for rows in PAGES)
+    assert status['diff']['unchanged_pages'] == 2
+    assert status['diff']['carried_rows'] == 6
+    assert status['diff']['carried_after_page'] == 2
+    assert status['diff']['new'] == 0
+
+
+def test_batch_browser_fallback_starts_over_without_repeating_rows(monkeypatch):
+    good = 'https://www.nahdionline.com/en-sa/vitamins/plp/1'
+    flaky = 'https://www.nahdionline.com/en-sa/baby-care/plp/2'
+    stored_while_running = []
+
+    def http(url, status_callback=None, row_sink=None, max_staleness=None):
+        if url == good:
+            emit_pages(PAGES[:2], status_callback, row_sink)
+            stored_while_running.append(get_store().row_count('batch'))
+            return 6
+        emit_pages(PAGES[2:3], status_callback, row_sink)
+        return None
+
+    browser_starts = []
+
+    def browser(url, lease, status_callback, row_sink, cursor, seen_ids, max_staleness=None, on_retry=None):
+        browser_starts.append((url, cursor['page'] + 1, cursor['count']))
+        count = cursor['count']
+        # The browser's page 1 holds everything the HTTP tier stored and more
+        rows = [row for row in PAGES[2] + PAGES[3] if product_identity(row) not in seen_ids]
+        row_sink(rows)
+        status_callback(1, count + len(rows), event='page_done')
+
+    monkeypatch.setattr(tasks, 'fetch_category', http)
+    monkeypatch.setattr(tasks, 'browser_scrape', browser)
+
+    tasks.run_batch_task('batch', [good, flaky], True)
+
+    status = get_job_state().get_status('batch')
+    assert status['status'] == 'completed'
+    # Rows reached the store as pages finished, not when the batch ended
+    assert stored_while_running[0] >= 6
+    assert browser_starts == [(flaky, 1, 3)]
+    names = sorted(row['Product Name'] for row in get_store().iter_rows('batch'))
+    assert names == sorted(row['Product Name'] for rows in PAGES for row in rows)
+    assert {row['Category'] for row in get_store().iter_rows('batch')} == {'Vitamins'}
+
+
+
+def test_jobs_on_the_same_url_write_separate_files(monkeypatch):
+    def http(url, status_callback=None, row_sink=None, max_staleness=None):
+        emit_pages(PAGES[:1], status_callback, row_sink)
+        return 3
+
+    monkeypatch.setattr(tasks, 'fetch_category', http)
+    tasks.run_scrape_task('older-job', URL, True)
+    tasks.run_scrape_task('newer-job', URL, True)
+
+    older, newer = get_store().job('older-job')['filename'], get_store().job('newer-job')['filename']
+    assert older != newer
+    assert os.path.exists(older) and os.path.exists(newer)
@@ -0,0 +1,77 @@
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+# Display Xvfb is started on when a non-headless browser needs one and DISPLAY names none
+XVFB_DISPLAY = os.environ.get('XVFB_DISPLAY', ':99')
+XVFB_SCREEN = os.environ.get('XVFB_SCREEN', '1920x1080x24')
+XVFB_START_TIMEOUT = 10
+
+_LOCK = threading.Lock()
+_XVFB = None
+
+
+def _display_number(display):
+    """99 for ':99' or ':99.0'; None for a remote display (host:N)."""
+    host, _, rest = display.partition(':')
+    if host or not rest:
+        return None
+    try:
+        return int(rest.split('.')[0])
+    except ValueError:
+        return None
+
+
+def display_running(display):
+    number = _display_number(display)
+    if number is None:
+        # Can't check a remote display; trust it
+        return True
+    return os.path.exists(f'/tmp/.X11-unix/X{number}')
+
+
+def _stop_xvfb():
+    if _XVFB is not None and _XVFB.poll() is None:
+        _XVFB.terminate()
+        try:
+            _XVFB.wait(5)
+        except subprocess.TimeoutExpired:
+            _XVFB.kill()
+
+
+def ensure_display():
+    """An X display for a visible browser, starting Xvfb on first need. Returns DISPLAY (or None)."""
+    global _XVFB
+    with _LOCK:
+        display = os.environ.get('DISPLAY')
+        if display and display_running(display):
+            return display
+        if not sys.platform.startswith('linux'):
+            # macOS and Windows browsers don't need X
+            return display
+        xvfb = shutil.which('Xvfb')
+        if xvfb is None:
+            print("No X display and Xvfb isn't installed; a non-headless browser may fail to start")
+            return display
+
+        display = display or XVFB_DISPLAY
+        if _XVFB is None or _XVFB.poll() is not None:
+            if _XVFB is None:
+                atexit.register(_stop_xvfb)
+            started = time.time()
+            _XVFB = subprocess.Popen([xvfb, display, '-screen', '0', XVFB_SCREEN, '-nolisten', 'tcp'],
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            while not display_running(display) and _XVFB.poll() is None:
+                if time.time() - started > XVFB_START_TIMEOUT:
+                    break
+                time.sleep(0.05)
+            if display_running(display):
+                print(f"Started Xvfb on {display} in {time.time() - started:.2f}s")
+            else:
+                print(f"Xvfb on {display} did not come up")
+        os.environ['DISPLAY'] = display
+        return display
@@ -0,0 +1,142 @@
+"""Scrape worker process: runs the jobs the web workers queue in the shared job state.
+
+Browsers live here instead of in the web processes, so pages, /progress and
+downloads stay responsive while Chrome is busy. Run one or more next to the
+web server (each runs SCRAPE_WORKERS jobs at a time):
+
+    python worker.py
+
+Every worker also heartbeats its metrics, fails the jobs of workers that
+died mid-scrape and evicts jobs older than JOB_TTL_SECONDS.
+"""
+import os
+import signal
+import threading
+import time
+
+from driver_pool import get_pool, prewarm_in_background
+from browser_governor import get_governor, process_rss_mb, process_stat, process_age_seconds
+from events import JOB_EVENTS
+from job_state import get_job_state, JOB_TTL_SECONDS
+from metrics import METRICS
+from page_cache import get_cache
+from price_history import get_history
+from product_matching import get_index_cache
+from result_store import get_store
+from scheduler import get_scheduler
+from strategy_cache import get_strategy_cache
+from tasks import TASKS, RESULTS_DIR
+
+# Heartbeats tell the web workers this process is alive and carry its metrics and gauges
+WORKER_HEARTBEAT_SECONDS = int(os.environ.get('WORKER_HEARTBEAT_SECONDS', 10))
+# How often expired jobs are looked for
+EVICT_INTERVAL_SECONDS = int(os.environ.get('EVICT_INTERVAL_SECONDS', 600))
+
+
+def heartbeat():
+    scheduler = get_scheduler()
+    gauges = {'scrape_worker_rss_mb': round(process_rss_mb(os.getpid()), 1)}
+    for prefix, stats in (('pool', get_pool().stats()), ('governor', get_governor().stats())):
+        gauges.update((f'{prefix}_{name}', value) for name, value in stats.items())
+    cache = get_cache()
+    if cache is not None:
+        gauges.update((f'page_cache_{name}', value) for name, value in cache.stats().items())
+    strategies = get_strategy_cache()
+    if strategies is not None:
+        gauges.update((f'strategy_cache_{name}', value) for name, value in strategies.stats().items())
+    get_job_state().heartbeat(scheduler.worker_id, {
+        'threads': scheduler.workers,
+        'running': scheduler.local_jobs(),
+        'gauges': gauges,
+        'metrics': METRICS.snapshot(),
+    })
+
+
+def fail_abandoned():
+    """Fail the jobs of worker processes that stopped mid-scrape; browser jobs past a checkpoint stay resumable."""
+    state = get_job_state()
+    store = get_store()
+    for job in get_scheduler().reap_abandoned():
+        req_id = job['req_id']
+        error = f"Scrape worker {job['worker']} stopped"
+        checkpoint = store.checkpoint(req_id)
+        if checkpoint:
+            store.save_checkpoint(req_id, status='failed', error=error)
+        status = state.get_status(req_id) or {'page': 0, 'count': 0}
+        status.update(status='failed', error=error,
+                      resumable=bool(checkpoint and checkpoint['tier'] == 'browser' and checkpoint['page'] > 0))
+        state.set_status(req_id, status)
+        JOB_EVENTS.publish(req_id, 'failed', status)
+        print(f"Job {req_id}: {error}")
+
+
+def evict_expired(ttl=JOB_TTL_SECONDS):
+    """Delete jobs last updated more than ttl seconds ago: state, events, rows, diffs, match indexes and CSV."""
+    cutoff = time.time() - ttl
+    state = get_job_state()
+    store = get_store()
+    scheduler = get_scheduler()
+    expired = set(state.expired_jobs(cutoff)) | set(store.jobs_updated_before(cutoff))
+    evicted = 0
+    for req_id in expired:
+        if scheduler.is_active(req_id):
+            continue
+        job = store.job(req_id)
+        if job and job['filename']:
+            try:
+                os.remove(job['filename'])
+            except OSError:
+                pass
+        store.delete_job(req_id)
+        get_history().clear_diff(req_id)
+        get_index_cache().forget(req_id)
+        state.delete(req_id)
+        evicted += 1
+    if evicted:
+        print(f"Evicted {evicted} jobs older than {ttl}s")
+    return evicted
+
+
+def _maintenance_loop():
+    last_evicted = 0
+    while True:
+        time.sleep(WORKER_HEARTBEAT_SECONDS)
+        try:
+            heartbeat()
+            fail_abandoned()
+            if time.time() - last_evicted >= EVICT_INTERVAL_SECONDS:
+                last_evicted = time.time()
+                evict_expired()
+        except Exception as e:
+            print(f"Worker maintenance failed: {e}")
+
+
+def start_worker(prewarm=True):
+    """Run queued jobs in this process, with heartbeats and eviction on a background thread."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    # Heartbeat before claiming anything so this worker's jobs never look abandoned
+    heartbeat()
+    get_scheduler().start(TASKS)
+    threading.Thread(target=_maintenance_loop, name='worker-maintenance', daemon=True).start()
+    if prewarm:
+        prewarm_in_background()
+
+
+def main():
+    scheduler = get_scheduler()
+    print(f"Scrape worker {scheduler.worker_id} running up to {scheduler.workers} jobs at a time")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    start_worker()
+    pid = os.getpid()
+    print(f"Scrape worker ready in {process_age_seconds(process_stat(pid)):.2f}s, idle RSS {process_rss_mb(pid):.0f} MB")
+    while not stop.wait(1):
+        pass
+    # Jobs still running are failed (and resumable) by the next worker's abandoned-job check
+    print(f"Scrape worker {scheduler.worker_id} stopping")
+    get_pool().shutdown()
+
+
+if __name__ == '__main__':
+    main()